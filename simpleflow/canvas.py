@@ -1,4 +1,4 @@
-from . import futures
+from . import futures, payload
 from .activity import Activity
 from .base import Submittable, SubmittableContainer
 from .signal import WaitForSignal
@@ -281,7 +281,8 @@ class ChainFuture(GroupFuture):
                 # End this chain
                 self._has_failed = True
                 break
-            previous_result = future.result
+            if send_result:
+                previous_result = future.result
 
         self.sync_state()
         self.sync_result()
@@ -293,3 +294,27 @@ class ChainFuture(GroupFuture):
             self._state = futures.CANCELLED
         elif any(a.running for a in self.futures):
             self._state = futures.RUNNING
+
+
+class Broadcast(object):
+    """
+    Value shared by many activities, e.g. a large configuration passed to
+    every task of a Group::
+
+        config = Broadcast(big_config)
+        Group(*[ActivityTask(process, shard, config) for shard in shards])
+
+    If it is larger than PAYLOAD_THRESHOLD once serialized, the value is
+    written once to the payload store (see :py:mod:`simpleflow.payload`)
+    and activities only receive a reference to it, resolved by the worker.
+    It must be passed directly as an argument. Smaller values, or without
+    payload store, are sent as is.
+    """
+    def __init__(self, value):
+        self.value = value
+        self._reference = None
+
+    def __json__(self):
+        if self._reference is None:
+            self._reference = payload.offload_value(self.value)
+        return self._reference
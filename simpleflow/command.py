@@ -21,7 +21,7 @@ from simpleflow.history import History
 from simpleflow.settings import logging_formatter
 from simpleflow.settings.logging_formatter import ColorModes
 from simpleflow.swf.stats import pretty
-from simpleflow.swf import helpers
+from simpleflow.swf import client, helpers
 from simpleflow.swf.process import decider
 from simpleflow.swf.process import worker
 from simpleflow.swf.utils import get_workflow_history
@@ -86,6 +86,8 @@ def cli(ctx, header, format, color):
     ctx.params['format'] = format
     ctx.params['header'] = header
     logging_formatter.color_mode = color
+    # Concurrent queries must respect SWF_RATE_LIMITS
+    client.install()
 
 
 def get_workflow_type(domain_name, workflow_class):
@@ -248,6 +250,13 @@ def with_format(ctx):
     )
 
 
+def with_format_blocks(ctx):
+    return pretty.formatted_blocks(
+        with_header=ctx.parent.params['header'],
+        fmt=ctx.parent.params['format'] or pretty.DEFAULT_FORMAT,
+    )
+
+
 @click.argument('run_id', required=False)
 @click.argument('workflow_id')
 @click.argument('domain',
@@ -306,10 +315,15 @@ def status(ctx, domain, workflow_id, run_id, nb_tasks):
 @click.option('--status', '-s', default='open', show_default=True, type=click.Choice(['open', 'closed']),
               help='Open/Closed')
 @click.option('--started-since', '-d', default=30, show_default=True, help='Started since N days.')
+@click.option('--windows', default=4, show_default=True, help='Number of time windows of the period.')
+@click.option('--threads', default=4, show_default=True, help='Number of time windows queried concurrently.')
 @click.pass_context
-def list_workflows(ctx, domain, status, started_since):
-    print(with_format(ctx)(helpers.list_workflow_executions)(domain, status=status.upper(),
-                                                             start_oldest_date=started_since))
+def list_workflows(ctx, domain, status, started_since, windows, threads):
+    for block in with_format_blocks(ctx)(helpers.list_workflow_executions)(domain, status=status.upper(),
+                                                                           start_oldest_date=started_since,
+                                                                           windows=windows,
+                                                                           threads=threads):
+        print(block)
 
 
 @click.argument('domain',
@@ -318,29 +332,31 @@ def list_workflows(ctx, domain, status, started_since):
 @cli.command('workflow.filter', help='Filter workflow executions.')
 @click.option('--status', '-s', default='open', show_default=True, type=click.Choice(['open', 'closed']),
               help='Open/Closed')
-@click.option('--tag', default=None, help='Tag (multiple option).'  # , multiple=True
-              )
+@click.option('--tag', multiple=True, help='Tag (multiple option).')
 @click.option('--workflow-id', default=None, help='Workflow ID.')
 @click.option('--workflow-type-name', default=None, help='Workflow Name.')
 @click.option('--workflow-type-version', default=None, help='Workflow Version (name needed).')
 @click.option('--started-since', '-d', default=30, show_default=True, help='Started since N days.')
+@click.option('--threads', default=4, show_default=True, help='Number of tags queried concurrently.')
 @click.pass_context
 def filter_workflows(ctx, domain, status, tag,
                      workflow_id, workflow_type_name,
-                     workflow_type_version, started_since):
+                     workflow_type_version, started_since, threads):
     status = status.upper()
     kwargs = {}
     if status == swf.models.workflow.WorkflowExecution.STATUS_OPEN:
         kwargs['oldest_date'] = started_since
     else:
         kwargs['start_oldest_date'] = started_since
-    print(with_format(ctx)(helpers.filter_workflow_executions)(domain, status=status.upper(),
-                                                               tag=tag,
-                                                               workflow_id=workflow_id,
-                                                               workflow_type_name=workflow_type_name,
-                                                               workflow_type_version=workflow_type_version,
-                                                               **kwargs
-                                                               ))
+    for block in with_format_blocks(ctx)(helpers.filter_workflow_executions)(
+            domain, status=status.upper(),
+            tag=list(tag),
+            workflow_id=workflow_id,
+            workflow_type_name=workflow_type_name,
+            workflow_type_version=workflow_type_version,
+            threads=threads,
+            **kwargs):
+        print(block)
 
 
 @click.argument('task_id')
@@ -8,7 +8,9 @@ if PY2:
     from itertools import imap, izip
     import urllib2 as request  # NOQA
     from urllib import quote as urlquote  # NOQA
+    from time import time as perf_counter  # NOQA
     text_type = unicode  # NOQA
+    integer_types = (int, long)  # NOQA
     binary_type = str
     string_types = (str, unicode)  # NOQA
     unicode = unicode  # NOQA
@@ -18,7 +20,9 @@ if PY2:
 else:
     from urllib import request  # NOQA
     from urllib.parse import quote as urlquote  # NOQA
+    from time import perf_counter  # NOQA
     text_type = str
+    integer_types = (int,)
     binary_type = bytes
     string_types = (str,)
     unicode = str
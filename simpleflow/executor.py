@@ -1,6 +1,10 @@
 import abc
 import logging
+import sys
 
+from future.utils import raise_
+
+from . import exceptions
 from ._decorators import deprecated
 
 if False:
@@ -66,10 +70,33 @@ class Executor(object):
         """
         Runs the workflow definition.
 
+        The workflow is closed (completed or failed) once ``run()`` returned
+        or raised; :py:meth:`before_close` is called before that.
+
         """
-        result = self._workflow.run(*args, **kwargs)
+        try:
+            result = self._workflow.run(*args, **kwargs)
+        except exceptions.ExecutionBlocked:
+            raise
+        except Exception:
+            exc_info = sys.exc_info()
+            self.before_close()
+            raise_(*exc_info)
+        self.before_close()
         return result
 
+    def before_close(self):
+        """
+        If the workflow defines a ``before_close()`` method, call it before
+        completing or failing the execution; it may raise
+        :py:class:`simpleflow.exceptions.ExecutionBlocked` to postpone the
+        closing, e.g. until some background tasks are finished.
+
+        """
+        before_close = getattr(self._workflow, 'before_close', None)
+        if before_close:
+            before_close()
+
     @abc.abstractmethod
     def submit(self, submittable, *args, **kwargs):
         """
@@ -55,6 +55,10 @@ def wait(*fs):
 
 
 class Future(object):
+    # Optional callable applied to ``_result`` on first access, see
+    # :py:meth:`Future.set_finished`.
+    _decode = None
+
     def __init__(self):
         """Represents the state of a computation.
 
@@ -81,6 +85,9 @@ class Future(object):
         if self._state != FINISHED:
             return self.wait()
 
+        if self._decode is not None:
+            decode, self._decode = self._decode, None
+            self._result = decode(self._result)
         return self._result
 
     def cancel(self):
@@ -152,9 +159,19 @@ class Future(object):
         self._state = FINISHED
         self._exception = exception
 
-    def set_finished(self, result):
+    def set_finished(self, result, decode=None):
+        """
+        Set state to finished with a result.
+        :param result:
+        :type result: Any
+        :param decode: if set, *result* is a raw value passed through this
+                       callable on first access only; this avoids decoding
+                       results the workflow never reads.
+        :type decode: Optional[Callable[[Any], Any]]
+        """
         self._state = FINISHED
         self._result = result
+        self._decode = decode
 
     def set_cancelled(self):
         self._state = CANCELLED
@@ -1,6 +1,8 @@
 import collections
 import logging
 
+from simpleflow.utils.json_tools import decompress_value
+
 logger = logging.getLogger(__name__)
 
 
@@ -141,7 +143,7 @@ class History(object):
                 'state': event.state,
                 'scheduled_id': event.id,
                 'scheduled_timestamp': event.timestamp,
-                'input': event.input,
+                'input': decompress_value(event.input),
                 'task_list': event.task_list['name'],
             }
             if event.activity_id not in self._activities:
@@ -357,7 +359,7 @@ class History(object):
                 'external_initiated_event_id': getattr(event, 'external_initiated_event_id', None),
                 'external_run_id': getattr(event, 'external_workflow_execution', {}).get('runId'),
                 'external_workflow_id': getattr(event, 'external_workflow_execution', {}).get('workflowId'),
-                'input': event.input,
+                'input': decompress_value(event.input),
                 'event_id': event.id,
                 'timestamp': event.timestamp,
             }
@@ -383,7 +385,7 @@ class History(object):
                 'name': event.signal_name,
                 'state': event.state,
                 'initiated_event_id': event.id,
-                'input': event.input,
+                'input': decompress_value(event.input),
                 'control': control,
                 'initiated_event_timestamp': event.timestamp,
             }
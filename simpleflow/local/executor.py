@@ -7,6 +7,7 @@ from simpleflow import (
     futures,
 )
 from simpleflow.base import Submittable
+from simpleflow.canvas import Broadcast
 from simpleflow.marker import Marker
 from simpleflow.signal import WaitForSignal
 from simpleflow.task import ActivityTask, WorkflowTask, SignalTask, MarkerTask
@@ -19,6 +20,16 @@ from simpleflow.history import History
 logger = logging.getLogger(__name__)
 
 
+def unwrap_broadcasts(args, kwargs):
+    """
+    Replace the Broadcast arguments with their value: there is no payload
+    store to share them through.
+    """
+    args = [a.value if isinstance(a, Broadcast) else a for a in args]
+    kwargs = {k: v.value if isinstance(v, Broadcast) else v for k, v in kwargs.items()}
+    return args, kwargs
+
+
 class Executor(executor.Executor):
     """
     Executes all tasks synchronously in a single local process.
@@ -55,6 +66,7 @@ class Executor(executor.Executor):
             func, args, kwargs))
 
         future = futures.Future()
+        args, kwargs = unwrap_broadcasts(args, kwargs)
 
         context = self.get_execution_context()
         context["activity_id"] = str(self.nb_activities)
@@ -76,6 +88,8 @@ class Executor(executor.Executor):
             task = func  # *args, **kwargs already resolved.
             task.context = context
             func = getattr(task, 'activity', None)
+            if isinstance(task, ActivityTask):
+                task.args, task.kwargs = unwrap_broadcasts(task.args, task.kwargs)
         elif isinstance(func, Activity):
             task = ActivityTask(func, context=context, *args, **kwargs)
         elif issubclass(func, Workflow):
@@ -83,6 +97,9 @@ class Executor(executor.Executor):
         else:
             raise TypeError('invalid type {} for {}'.format(
                 type(func), func))
+        if isinstance(func, Activity):
+            # Like simpleflow.swf.utils.sanitize_activity_context
+            context["name"] = func.name
 
         try:
             future._result = task.execute()
@@ -1,7 +1,8 @@
 class Marker(object):
-    def __init__(self, name, details):
+    def __init__(self, name, details, state='recorded'):
         self.name = name
         self.details = details
+        self.state = state
 
     def __repr__(self):
         return '<{klass} {name!r} details={details!r}>'.format(
@@ -0,0 +1,400 @@
+"""
+Process-level metrics of deciders and activity workers.
+
+Pollers record counters and histograms in the registry of their process.
+When the ``METRICS_DIRECTORY`` setting is defined, each process dumps its
+registry to a file of that directory every ``METRICS_INTERVAL`` seconds.
+The supervisor aggregates these files and exposes the result in the
+Prometheus text format, on http://``METRICS_HOST``:``METRICS_PORT``/metrics
+and/or in the ``METRICS_TEXTFILE`` file (for the node exporter).
+"""
+from future.standard_library import install_aliases
+install_aliases()
+
+import contextlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import psutil
+
+from . import settings
+from .compat import perf_counter
+from .utils import prometheus
+from .utils.files import write_file_atomically
+
+logger = logging.getLogger(__name__)
+
+# Sizes, e.g. of histories
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, prometheus.INF)
+
+# name -> (kind, description, buckets of a histogram or merge function of a
+# gauge, see Registry.merge())
+METRICS = {
+    'simpleflow_poll_seconds': (
+        'histogram', 'Latency of the polls for tasks.', prometheus.DEFAULT_BUCKETS),
+    'simpleflow_polls_empty_total': (
+        'counter', 'Polls that timed out without a task.', None),
+    'simpleflow_decision_seconds': (
+        'histogram', 'Time taken to replay a workflow and decide.', prometheus.DEFAULT_BUCKETS),
+    'simpleflow_decision_history_events': (
+        'histogram', 'Number of events in the histories of the decision tasks.', SIZE_BUCKETS),
+    'simpleflow_decisions_per_response': (
+        'histogram', 'Number of decisions sent for each decision task.', SIZE_BUCKETS),
+    'simpleflow_activity_task_seconds': (
+        'histogram', 'Duration of the activity task processes.', prometheus.DEFAULT_BUCKETS),
+    'simpleflow_activity_tasks_total': (
+        'counter', 'Activity tasks processed, by outcome.', None),
+    'simpleflow_heartbeat_failures_total': (
+        'counter', 'Heartbeats that could not be sent.', None),
+    'simpleflow_retries_total': (
+        'counter', 'Retries of SWF requests, by operation.', None),
+    'simpleflow_errors_total': (
+        'counter', 'SWF requests that failed after all their retries, by operation.', None),
+    'simpleflow_swf_requests_total': (
+        'counter', 'SWF API calls, by API and outcome (ok, error or throttled).', None),
+    'simpleflow_swf_request_seconds': (
+        'histogram', 'Latency of the SWF API calls.', prometheus.DEFAULT_BUCKETS),
+    'simpleflow_swf_request_bytes_total': (
+        'counter', 'Size of the bodies of the SWF API requests.', None),
+    'simpleflow_swf_response_bytes_total': (
+        'counter', 'Size of the bodies of the SWF API responses.', None),
+    'simpleflow_swf_retries_total': (
+        'counter', 'SWF API calls following a failed call of the same API.', None),
+    'simpleflow_swf_rate_limit_seconds_total': (
+        'counter', 'Time spent waiting for the SWF rate limiter, by API family.', None),
+    'simpleflow_swf_rate_limit': (
+        'gauge', 'Current rate of the SWF rate limiter, by API family; the lowest of the processes.', min),
+    'simpleflow_supervised_processes': (
+        'gauge', 'Worker or decider processes alive under the supervisor.', max),
+}
+
+
+class Registry(object):
+    """
+    Metrics of the current process: values are indexed by metric name and
+    labels. A forked process starts with an empty registry. Thread-safe,
+    e.g. for the SWF calls of the storage transfer threads.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Hold the lock and yield the values.
+        """
+        if self._pid != os.getpid():
+            # The lock may have been held by another thread of the parent
+            self.values = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        with self._lock:
+            yield self.values
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increment a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._locked() as values:
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._locked() as values:
+            values[key] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation to a histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._locked() as values:
+            if key not in values:
+                values[key] = prometheus.Histogram(METRICS[name][2])
+            values[key].observe(value)
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        """
+        Observe the duration of a block in a histogram.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def to_dict(self):
+        with self._locked() as values:
+            return {
+                'values': [
+                    [name, list(labels), value.to_dict() if isinstance(value, prometheus.Histogram) else value]
+                    for (name, labels), value in values.items()
+                ]
+            }
+
+    def merge(self, data):
+        """
+        Add the values of another registry, see :py:meth:`to_dict`.
+        Counters and histograms are summed; gauges are combined with the
+        merge function of their metric (e.g. min).
+        """
+        with self._locked() as values:
+            for name, labels, value in data['values']:
+                if name not in METRICS:
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                kind, _, extra = METRICS[name]
+                if kind == 'histogram':
+                    histogram = prometheus.Histogram.from_dict(value, extra)
+                    if key in values:
+                        values[key].merge(histogram)
+                    else:
+                        values[key] = histogram
+                elif kind == 'gauge':
+                    values[key] = extra(values[key], value) if key in values else value
+                else:
+                    values[key] = values.get(key, 0) + value
+
+    def format(self):
+        """
+        Return the metrics in the Prometheus text format.
+
+        :rtype: list[str]
+        """
+        samples = {}
+        with self._locked() as values:
+            for (name, labels), value in values.items():
+                samples.setdefault(name, []).append((labels, value))
+            lines = []
+            for name in sorted(samples):
+                kind, description, _ = METRICS[name]
+                lines += prometheus.format_metric(name, kind, description, samples[name])
+        return lines
+
+
+registry = Registry()
+
+# Directory where this process dumps its registry, see set_directory()
+_directory = None
+_dump_filename = None
+_dumped_at = None
+
+
+def get_directory():
+    return _directory if _directory is not None else settings.METRICS_DIRECTORY
+
+
+def set_directory(directory):
+    """
+    Override the directory of the dumps; e.g. a supervisor gives its own
+    directory to its children.
+    """
+    global _directory
+    _directory = directory
+
+
+def dump(force=False):
+    """
+    Write the registry of this process in the metrics directory, if any,
+    at most every METRICS_INTERVAL seconds unless forced.
+    """
+    global _dump_filename, _dumped_at
+    directory = get_directory()
+    if not directory:
+        return
+    now = perf_counter()
+    pid = os.getpid()
+    if _dump_filename is None or not _dump_filename.startswith('{}-'.format(pid)):
+        # Unique, the process ids are reused
+        _dump_filename = '{}-{}.json'.format(pid, uuid.uuid4().hex)
+        _dumped_at = None
+    if not force and _dumped_at is not None and now - _dumped_at < settings.METRICS_INTERVAL:
+        return
+    _dumped_at = now
+    try:
+        write_file_atomically(
+            os.path.join(directory, _dump_filename),
+            json.dumps(registry.to_dict()).encode('utf-8'),
+        )
+    except (IOError, OSError) as err:
+        logger.warning('cannot dump metrics: {}'.format(err))
+
+
+def absorb(pid, directory=None):
+    """
+    Merge into the registry the dumps of a process that exited, e.g. an
+    activity task process, and remove them. The registry is dumped again
+    right away, so that the aggregated counters don't go down meanwhile.
+
+    :param directory: defaults to the directory of this process
+    :type directory: str
+    """
+    directory = directory or get_directory()
+    if not directory:
+        return
+    prefix = '{}-'.format(pid)
+    claimed = []
+    for filename in os.listdir(directory):
+        if not filename.startswith(prefix) or not filename.endswith('.json'):
+            continue
+        # Hidden from the other readers: the dump is only absorbed once
+        path = os.path.join(directory, '.' + filename)
+        try:
+            os.rename(os.path.join(directory, filename), path)
+        except OSError:  # absorbed meanwhile
+            continue
+        claimed.append(path)
+        try:
+            with open(path) as f:
+                registry.merge(json.load(f))
+        except (IOError, OSError, ValueError) as err:
+            logger.warning('cannot absorb metrics of {}: {}'.format(pid, err))
+    if not claimed:
+        return
+    dump(force=True)
+    for path in claimed:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def absorb_dead(directory):
+    """
+    Absorb the dumps of the processes that died without being absorbed by
+    their parent, e.g. pollers replaced by a supervisor.
+    """
+    pids = set()
+    for filename in os.listdir(directory):
+        if filename.startswith('.') or not filename.endswith('.json'):
+            continue
+        try:
+            pids.add(int(filename.split('-', 1)[0]))
+        except ValueError:
+            continue
+    pids.discard(os.getpid())
+    for pid in pids:
+        if not psutil.pid_exists(pid):
+            absorb(pid, directory)
+
+
+def aggregate(directory):
+    """
+    Return a registry summing the dumps of a directory and the registry of
+    the current process.
+
+    :rtype: Registry
+    """
+    result = Registry()
+    result.merge(registry.to_dict())
+    # Already counted above
+    own_prefix = '{}-'.format(os.getpid())
+    for filename in os.listdir(directory):
+        if filename.startswith(('.', own_prefix)) or not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                result.merge(json.load(f))
+        except (IOError, OSError, ValueError):  # removed meanwhile
+            continue
+    return result
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    directory = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = ('\n'.join(aggregate(self.directory).format()) + '\n').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class Exporter(object):
+    """
+    Aggregation and exposition of the metrics of a supervisor and its
+    children, see :py:class:`simpleflow.process.Supervisor`.
+    """
+
+    def __init__(self, directory, port=None, host='127.0.0.1', textfile=None):
+        self.directory = directory
+        self.port = port
+        self.host = host
+        self.textfile = textfile
+        self._server = None
+        self._updated_at = None
+
+    @classmethod
+    def from_settings(cls, name):
+        """
+        Return an exporter if metrics are enabled, else None.
+
+        :param name: subdirectory of METRICS_DIRECTORY, unique per supervisor
+        :type name: str
+        """
+        if not settings.METRICS_DIRECTORY:
+            return None
+        return cls(
+            os.path.join(settings.METRICS_DIRECTORY, name),
+            port=settings.METRICS_PORT,
+            host=settings.METRICS_HOST,
+            textfile=settings.METRICS_TEXTFILE,
+        )
+
+    def start(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+        set_directory(self.directory)
+        if self.port:
+            handler = type('Handler', (MetricsRequestHandler,), {'directory': self.directory})
+            self._server = HTTPServer((self.host, self.port), handler)
+            thread = threading.Thread(target=self._server.serve_forever, name='metrics')
+            thread.daemon = True
+            thread.start()
+            logger.info('serving metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+    def update(self, force=False):
+        """
+        Absorb the dumps of the dead processes and write the textfile, at
+        most every METRICS_INTERVAL seconds unless forced.
+        """
+        now = time.time()
+        if not force and self._updated_at is not None and now - self._updated_at < settings.METRICS_INTERVAL:
+            return
+        self._updated_at = now
+        try:
+            absorb_dead(self.directory)
+            if self.textfile:
+                prometheus.write_textfile(self.textfile, aggregate(self.directory).format())
+        except (IOError, OSError) as err:
+            logger.warning('cannot update metrics: {}'.format(err))
+
+    def stop(self):
+        self.update(force=True)
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -2,14 +2,28 @@ from future.standard_library import install_aliases
 install_aliases()
 
 import abc
+import gc
 import json
 import os
 import re
+import sys
 import time
 import urllib.parse
 from collections import OrderedDict
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
 from . import storage, settings
+from .compat import perf_counter
+from .metrology_sinks import StorageSink, get_sinks
 from .swf.stats.pretty import dump_history_to_json
 from .workflow import Workflow
 
@@ -38,21 +52,106 @@ class StepIO(object):
         ])
 
 
+# Time spent in garbage collections by this process, see _gc_callback()
+_gc_time = 0.0
+_gc_started = None
+
+
+def _gc_callback(phase, info):
+    global _gc_time, _gc_started
+    if phase == 'start':
+        _gc_started = perf_counter()
+    elif _gc_started is not None:
+        _gc_time += perf_counter() - _gc_started
+        _gc_started = None
+
+
+def _get_gc_usage():
+    """
+    Return the number of collections of each generation and the time spent
+    in collections; None on Python 2.
+    """
+    if not hasattr(gc, 'callbacks'):
+        return None
+    if _gc_callback not in gc.callbacks:
+        gc.callbacks.append(_gc_callback)
+    return [generation['collections'] for generation in gc.get_stats()], _gc_time
+
+
+class StepResources(object):
+    """
+    Resources used by the process during a step: CPU time, growth of the
+    peak RSS, block I/O, garbage collections and, if the
+    METROLOGY_TRACEMALLOC_TOP setting is set, the largest allocations.
+    """
+    def __init__(self):
+        self.stats = None
+        self._rusage = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        self._gc = _get_gc_usage()
+        self._snapshot = None
+        self._stop_tracemalloc = False
+        if settings.METROLOGY_TRACEMALLOC_TOP and tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._stop_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def stop(self):
+        stats = OrderedDict()
+        if self._rusage:
+            rusage = resource.getrusage(resource.RUSAGE_SELF)
+            # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+            rss_unit = 1 if sys.platform == 'darwin' else 1024
+            stats['cpu_user'] = round(rusage.ru_utime - self._rusage.ru_utime, 6)
+            stats['cpu_system'] = round(rusage.ru_stime - self._rusage.ru_stime, 6)
+            stats['max_rss_delta'] = (rusage.ru_maxrss - self._rusage.ru_maxrss) * rss_unit
+            stats['block_input'] = rusage.ru_inblock - self._rusage.ru_inblock
+            stats['block_output'] = rusage.ru_oublock - self._rusage.ru_oublock
+        if self._gc:
+            collections, gc_time = _get_gc_usage()
+            stats['gc_collections'] = [
+                after - before for after, before in zip(collections, self._gc[0])
+            ]
+            stats['gc_time'] = round(gc_time - self._gc[1], 6)
+        if self._snapshot:
+            snapshot = tracemalloc.take_snapshot()
+            if self._stop_tracemalloc:
+                tracemalloc.stop()
+            top = snapshot.compare_to(self._snapshot, 'lineno')
+            stats['allocations'] = [
+                OrderedDict([
+                    ('location', str(stat.traceback)),
+                    ('size_diff', stat.size_diff),
+                    ('count_diff', stat.count_diff),
+                ])
+                for stat in top[:settings.METROLOGY_TRACEMALLOC_TOP]
+            ]
+            self._snapshot = None
+        self.stats = stats
+
+    def get_stats(self):
+        return self.stats
+
+
 class Step(object):
     def __init__(self, name, task):
         self.name = name
         self.task = task
         self.read = StepIO()
         self.write = StepIO()
+        self.resources = StepResources()
         self.time_started = time.time()
         self.time_finished = None
         self.time_total = None
         self.metadata = {}
+        self._perf_started = perf_counter()
 
     def done(self):
         self.time_finished = time.time()
-        self.time_total = self.time_finished - self.time_started
-        self.task.upload_stats()
+        # Monotonic and precise, unlike time.time()
+        self.time_total = perf_counter() - self._perf_started
+        self.resources.stop()
+        self.task.step_done(self)
 
     def get_stats(self):
         stats = OrderedDict([
@@ -63,6 +162,7 @@ class Step(object):
             ('time_total', self.time_total),
             ('read', self.read.get_stats(self.time_total)),
             ('write', self.write.get_stats(self.time_total)),
+            ('resources', self.resources.get_stats()),
         ])
         return stats
 
@@ -84,6 +184,10 @@ class StepExecution(object):
 
 class MetrologyTask(object):
 
+    @property
+    def activity_type(self):
+        return self.context["name"]
+
     @property
     def metrology_path(self):
         path = []
@@ -105,25 +209,85 @@ class MetrologyTask(object):
         step_exec = StepExecution(step)
         if not hasattr(self, 'steps'):
             self.steps = []
+            self._stats_uploaded_at = perf_counter()
+            self._stats_pending = False
         self.steps.append(step)
         return step_exec
 
-    def upload_stats(self):
+    def step_done(self, step):
+        """
+        Buffer the stats of a finished step. They are uploaded when the
+        activity ends, and every METROLOGY_FLUSH_INTERVAL seconds if set.
+        """
+        self._stats_pending = True
+        interval = settings.METROLOGY_FLUSH_INTERVAL
+        if interval and perf_counter() - self._stats_uploaded_at >= interval:
+            self.upload_stats()
+
+    def flush_stats(self, final=False):
+        """
+        Upload the buffered stats, if any. Sinks that cannot be rewritten
+        (see simpleflow.metrology_sinks) only get the final stats.
+        """
+        if getattr(self, '_stats_pending', False):
+            self.upload_stats(final=final)
+        elif final and getattr(self, 'steps', None):
+            self.upload_stats(final=True, rewritable=False)
+
+    def after_execute(self):
+        """
+        Called by the activity once execute() returned or raised.
+        """
+        self.flush_stats(final=True)
+
+    def upload_stats(self, final=False, rewritable=True):
+        self._stats_uploaded_at = perf_counter()
+        self._stats_pending = False
         stats = []
         for step in self.steps:
             stats.append(step.get_stats())
 
-        storage.push_content(
-            settings.METROLOGY_BUCKET,
-            self.metrology_path,
-            json.dumps(stats, indent=2),
-            content_type="application/json")
+        for sink in get_sinks():
+            if (sink.rewritable and rewritable) or (not sink.rewritable and final):
+                sink.write_activity(self, stats)
 
     @abc.abstractmethod
     def execute(self):
         pass
 
 
+class MetrologyHistory(object):
+    """
+    Events of a history dumped to JSON, (name, event) pairs, with the
+    metrology of their activity. The activity stats are pulled while
+    iterating, concurrently and in batches, and not kept: the merged
+    document can be streamed whatever the number of activities.
+    """
+
+    def __init__(self, events, activity_paths):
+        """
+        :param events: (name, event) pairs
+        :type events: list
+        :param activity_paths: keys of the activity stats in METROLOGY_BUCKET
+        :type activity_paths: list[str]
+        """
+        self.events = events
+        # Index the stats by name, not to scan the paths for each event
+        self.paths = {ACTIVITY_KEY_RE.search(path).group(1): path for path in activity_paths}
+
+    def __iter__(self):
+        batch_size = settings.STORAGE_THREADS * 4
+        for start in range(0, len(self.events), batch_size):
+            batch = self.events[start:start + batch_size]
+            paths = list(set(self.paths[name] for name, _ in batch if name in self.paths))
+            contents = dict(zip(paths, storage.pull_contents(settings.METROLOGY_BUCKET, paths))) if paths else {}
+            for name, event in batch:
+                path = self.paths.get(name)
+                if path is not None:
+                    event = dict(event, metrology=json.loads(contents[path]))
+                yield [name, event]
+
+
 class MetrologyWorkflow(Workflow):
 
     def after_closed(self, history):
@@ -145,26 +309,16 @@ class MetrologyWorkflow(Workflow):
         """
         Fetch workflow history and merge it with metrology
         """
-        activity_keys = [obj for obj in storage.list_keys(
-            settings.METROLOGY_BUCKET,
-            self.metrology_path)]
+        sinks = get_sinks()
+        # Activity stats are only available from the storage
+        activity_paths = []
+        if any(isinstance(sink, StorageSink) for sink in sinks):
+            activity_prefix = os.path.join(self.metrology_path, 'activity.')
+            activity_paths = [key.name for key in storage.list_keys(
+                settings.METROLOGY_BUCKET,
+                self.metrology_path) if key.name.startswith(activity_prefix)]
         history_dumped = dump_history_to_json(history)
-        history = json.loads(history_dumped)
-
-        for key in activity_keys:
-            if not key.key.startswith(os.path.join(self.metrology_path, 'activity.')):
-                continue
-            contents = key.get_contents_as_string(encoding='utf-8')
-            result = json.loads(contents)
-            search = ACTIVITY_KEY_RE.search(key.name)
-            name = search.group(1)
-            for h in history:
-                if h[0] == name:
-                    h[1]["metrology"] = result
-
-        storage.push_content(
-            settings.METROLOGY_BUCKET,
-            os.path.join(self.metrology_path, 'metrology.json'),
-            json.dumps(history, indent=2),
-            content_type="application/json"
-        )
+        history = MetrologyHistory(json.loads(history_dumped), activity_paths)
+
+        for sink in sinks:
+            sink.write_workflow(self, history)
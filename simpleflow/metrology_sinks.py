@@ -0,0 +1,249 @@
+"""
+Destinations of the metrology of activities and workflows, see
+:py:mod:`simpleflow.metrology`.
+
+The ``METROLOGY_SINKS`` setting is a comma-separated list of:
+
+- ``storage``: JSON documents in ``METROLOGY_BUCKET``, merged into a
+  ``metrology.json`` when the workflow closes;
+- ``jsonl:///path/to/file.jsonl``: one JSON line per activity and workflow;
+  ``?max_bytes=...&backup_count=...`` rotates the file like
+  :py:class:`logging.handlers.RotatingFileHandler`;
+- ``prometheus:///path/to/file.prom``: counters and duration histograms per
+  activity type, for the node exporter textfile collector.
+"""
+from future.standard_library import install_aliases
+install_aliases()
+
+import json
+import os
+import tempfile
+import urllib.parse
+
+from . import settings, storage
+from .utils import prometheus
+from .utils.files import file_lock, write_file_atomically
+
+
+def _dump_list(items, f):
+    """
+    Write items to f like json.dump(list(items), f, indent=2) does, one
+    item at a time.
+    """
+    f.write('[')
+    separator = '\n'
+    for item in items:
+        f.write(separator)
+        f.write('\n'.join('  ' + line for line in json.dumps(item, indent=2).split('\n')))
+        separator = ',\n'
+    f.write(']' if separator == '\n' else '\n]')
+
+
+class StorageSink(object):
+    """
+    Write metrology to METROLOGY_BUCKET. Documents are overwritten, so the
+    stats of an activity can be written several times while it runs.
+    """
+    rewritable = True
+
+    def write_activity(self, task, stats):
+        storage.push_content(
+            settings.METROLOGY_BUCKET,
+            task.metrology_path,
+            json.dumps(stats, indent=2),
+            content_type="application/json")
+
+    def write_workflow(self, workflow, history):
+        # Stream the merged document to a file rather than building it in memory
+        fd, tmp_path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                _dump_list(history, f)
+            storage.push(
+                settings.METROLOGY_BUCKET,
+                os.path.join(workflow.metrology_path, 'metrology.json'),
+                tmp_path,
+                content_type="application/json"
+            )
+        finally:
+            os.remove(tmp_path)
+
+
+class JsonlSink(object):
+    """
+    Append metrology to a local file, one JSON document per line. The
+    file is locked while written, so that processes can share it.
+    """
+    rewritable = False
+
+    def __init__(self, path, max_bytes=0, backup_count=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def _rotate(self):
+        if self.backup_count:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = '{}.{}'.format(self.path, i)
+                if os.path.exists(src):
+                    os.rename(src, '{}.{}'.format(self.path, i + 1))
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+    def write(self, document):
+        line = json.dumps(document) + '\n'
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # created meanwhile
+                pass
+        with file_lock(self.path):
+            if self.max_bytes and os.path.exists(self.path) and \
+                    os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+    def write_activity(self, task, stats):
+        document = {'type': 'activity', 'activity_type': task.activity_type}
+        for key in ('workflow_id', 'run_id', 'activity_id'):
+            document[key] = task.context[key]
+        document['steps'] = stats
+        self.write(document)
+
+    def write_workflow(self, workflow, history):
+        context = workflow.get_execution_context()
+        self.write({
+            'type': 'workflow',
+            'workflow_id': context['workflow_id'],
+            'run_id': context['run_id'],
+            'history': list(history),
+        })
+
+
+class PrometheusTextfileSink(object):
+    """
+    Aggregate the metrology of the activities of all the processes of the
+    host in a textfile for the Prometheus node exporter. The aggregated
+    values are kept in a JSON file next to it.
+    """
+    rewritable = False
+
+    def __init__(self, path, buckets=prometheus.DEFAULT_BUCKETS):
+        self.path = path
+        self.buckets = buckets
+
+    def _load_state(self):
+        try:
+            with open(self.path + '.json') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'activities': {}, 'steps': {}}
+
+    def _save_state(self, state):
+        write_file_atomically(self.path + '.json', json.dumps(state).encode('utf-8'))
+
+    def _observe(self, entry, duration):
+        histogram = prometheus.Histogram.from_dict(entry['duration'], self.buckets) \
+            if 'duration' in entry else prometheus.Histogram(self.buckets)
+        histogram.observe(duration)
+        entry['duration'] = histogram.to_dict()
+
+    def write_activity(self, task, stats):
+        activity_type = task.activity_type
+        finished = [step for step in stats if step['time_total'] is not None]
+        if not finished:
+            return
+        with file_lock(self.path):
+            state = self._load_state()
+            entry = state['activities'].setdefault(activity_type, {})
+            self._observe(entry, max(step['time_finished'] for step in finished) -
+                          min(step['time_started'] for step in finished))
+            for step in finished:
+                key = json.dumps([activity_type, step['name']])
+                entry = state['steps'].setdefault(key, {})
+                self._observe(entry, step['time_total'])
+                for direction in ('read', 'write'):
+                    step_io = step[direction]
+                    totals = entry.setdefault(direction, {'bytes': 0, 'records': 0})
+                    totals['bytes'] += step_io['bytes']
+                    totals['records'] += step_io['records']
+                    totals['mb_s'] = step_io['mb_s']
+                    totals['rec_s'] = step_io['rec_s']
+            self._save_state(state)
+            prometheus.write_textfile(self.path, self.format_state(state))
+
+    def write_workflow(self, workflow, history):
+        pass
+
+    def format_state(self, state):
+        activities = [
+            ((('activity_type', activity_type),),
+             prometheus.Histogram.from_dict(entry['duration'], self.buckets))
+            for activity_type, entry in state['activities'].items()
+        ]
+        steps = [(tuple(zip(('activity_type', 'step'), json.loads(key))), entry)
+                 for key, entry in state['steps'].items()]
+
+        def io_samples(field):
+            return [
+                (labels + (('direction', direction),), entry[direction][field])
+                for labels, entry in steps for direction in ('read', 'write')
+                if entry[direction].get(field) is not None
+            ]
+
+        lines = []
+        lines += prometheus.format_metric(
+            'simpleflow_activity_duration_seconds', 'histogram',
+            'Duration of the activities, from their first step to their last one.',
+            activities)
+        lines += prometheus.format_metric(
+            'simpleflow_step_duration_seconds', 'histogram',
+            'Duration of the metrology steps.',
+            [(labels, prometheus.Histogram.from_dict(entry['duration'], self.buckets))
+             for labels, entry in steps])
+        lines += prometheus.format_metric(
+            'simpleflow_step_records_total', 'counter',
+            'Records read or written by the metrology steps.',
+            io_samples('records'))
+        lines += prometheus.format_metric(
+            'simpleflow_step_bytes_total', 'counter',
+            'Bytes read or written by the metrology steps.',
+            io_samples('bytes'))
+        lines += prometheus.format_metric(
+            'simpleflow_step_records_per_second', 'gauge',
+            'Throughput of the last execution of the metrology steps, in records per second.',
+            io_samples('rec_s'))
+        lines += prometheus.format_metric(
+            'simpleflow_step_megabytes_per_second', 'gauge',
+            'Throughput of the last execution of the metrology steps, in MB per second.',
+            io_samples('mb_s'))
+        return lines
+
+
+def get_sink(url):
+    """
+    Return the sink described by url, see the module documentation.
+    """
+    if url == 'storage':
+        return StorageSink()
+    parsed = urllib.parse.urlparse(url)
+    options = dict(urllib.parse.parse_qsl(parsed.query))
+    if parsed.scheme == 'jsonl':
+        return JsonlSink(
+            parsed.path,
+            max_bytes=int(options.get('max_bytes', 0)),
+            backup_count=int(options.get('backup_count', 0)),
+        )
+    if parsed.scheme == 'prometheus':
+        return PrometheusTextfileSink(parsed.path)
+    raise ValueError('unknown metrology sink: {}'.format(url))
+
+
+def get_sinks():
+    """
+    Return the sinks of the METROLOGY_SINKS setting.
+    """
+    return [get_sink(url.strip()) for url in settings.METROLOGY_SINKS.split(',') if url.strip()]
@@ -0,0 +1,217 @@
+"""
+Offloading of large payloads (activity inputs and results) to a blob store.
+
+SWF truncates inputs and results bigger than ~32KB. When a payload store is
+configured (``PAYLOAD_STORE`` setting), serialized payloads longer than
+``PAYLOAD_THRESHOLD`` characters are written to the store and replaced with
+a small reference; references are resolved when the value is accessed.
+
+``PAYLOAD_STORE`` is either a local directory (absolute path, e.g. for a
+single host or tests) or a location on :py:mod:`simpleflow.storage`
+(``bucket``, ``host/bucket``, ``file:///directory``...), with keys prefixed by
+``PAYLOAD_PATH_PREFIX``.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from simpleflow import settings, storage
+from simpleflow.compat import string_types
+from simpleflow.utils import LRUCache, json_dumps, json_loads_or_raw
+from simpleflow.utils.json_tools import decompress_value
+
+logger = logging.getLogger(__name__)
+
+
+PAYLOAD_REFERENCE_KEY = '__simpleflow_payload__'
+_REFERENCE_PREFIX = '{{"{}":'.format(PAYLOAD_REFERENCE_KEY)
+
+
+class StoragePayloadStore(object):
+    """
+    Store payloads in a bucket, see :py:mod:`simpleflow.storage`.
+    """
+
+    def __init__(self, bucket, path_prefix=None):
+        self.bucket = bucket
+        self.path_prefix = path_prefix
+        self.backend = storage.get_backend(bucket)
+
+    def _get_path(self, key):
+        if self.path_prefix:
+            return os.path.join(self.path_prefix, key)
+        return key
+
+    def put(self, key, data):
+        path = self._get_path(key)
+        # Content-addressed: no need to upload it again
+        if self.backend.stat(path) is not None:
+            return
+        self.backend.push_content(path, data)
+
+    def get(self, key):
+        return self.backend.pull_content(self._get_path(key))
+
+
+class LocalPayloadStore(StoragePayloadStore):
+    """
+    Store payloads as files in a local directory.
+    """
+
+    def __init__(self, directory):
+        super(LocalPayloadStore, self).__init__('file://' + directory)
+        self.directory = directory
+
+
+_store = None
+
+# Payloads fetched by this process, e.g. broadcast values shared by many
+# activities (see simpleflow.canvas.Broadcast) or the results replayed by
+# a decider; bounded by their total length.
+_fetched = LRUCache(maxsize=None, max_weight=settings.PAYLOAD_CACHE_SIZE)
+
+# Keys this process wrote to the store, e.g. by a decider serializing the
+# same Broadcast value on every decision: no need to check them again.
+_stored = LRUCache(maxsize=10000)
+
+
+def get_store():
+    """
+    Return the configured payload store, or None if offloading is disabled.
+    """
+    global _store
+    if _store is None:
+        if not settings.PAYLOAD_STORE:
+            return None
+        if settings.PAYLOAD_STORE.startswith('/'):
+            _store = LocalPayloadStore(settings.PAYLOAD_STORE)
+        else:
+            _store = StoragePayloadStore(settings.PAYLOAD_STORE, settings.PAYLOAD_PATH_PREFIX)
+    return _store
+
+
+def set_store(store):
+    """
+    Override the payload store; None goes back to the ``PAYLOAD_STORE``
+    setting.
+    """
+    global _store
+    _store = store
+    _stored.clear()
+
+
+def is_reference(data):
+    """
+    :param data: serialized payload
+    :type data: str
+    :rtype: bool
+    """
+    return isinstance(data, string_types) and data.startswith(_REFERENCE_PREFIX)
+
+
+def _get(key):
+    data = _fetched.get(key)
+    if data is None:
+        store = get_store()
+        if store is None:
+            raise ValueError('cannot load payload {}: no payload store configured'.format(key))
+        data = store.get(key)
+        _fetched.set(key, data)
+    return data
+
+
+def _put(store, data):
+    key = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    if key not in _stored:
+        store.put(key, data)
+        _stored.set(key, True)
+        logger.debug('payload of {} chars offloaded to {}'.format(len(data), key))
+    return {PAYLOAD_REFERENCE_KEY: key}
+
+
+def offload(data):
+    """
+    Write a serialized payload to the store if it's too large, and return
+    a serialized reference to it. Otherwise return the payload unchanged.
+
+    :param data: serialized payload
+    :type data: str
+    :rtype: str
+    """
+    store = get_store()
+    if store is None or not data or len(data) <= settings.PAYLOAD_THRESHOLD:
+        return data
+    return json_dumps(_put(store, data))
+
+
+def offload_value(value, threshold=None):
+    """
+    Return value, or a reference to it if it's too large once serialized.
+    The reference is a dict, so that it can be embedded in a JSON document.
+
+    :param value: JSON-serializable value
+    :type value: Any
+    :param threshold: defaults to the PAYLOAD_THRESHOLD setting
+    :type threshold: Optional[int]
+    :rtype: Any
+    """
+    store = get_store()
+    if store is None:
+        return value
+    if threshold is None:
+        threshold = settings.PAYLOAD_THRESHOLD
+    data = json_dumps(value)
+    if len(data) <= threshold:
+        return value
+    return _put(store, data)
+
+
+def resolve_value(value):
+    """
+    Return the value a reference (see :py:func:`offload_value`) points to,
+    or value itself if it isn't a reference.
+    """
+    if isinstance(value, dict) and len(value) == 1 and PAYLOAD_REFERENCE_KEY in value:
+        return json.loads(_get(value[PAYLOAD_REFERENCE_KEY]))
+    return value
+
+
+def resolve_input(input):
+    """
+    Decode the input of an activity task as read from SWF or its history,
+    like the worker does: resolve the reference to it, decompress it and
+    resolve the references of its arguments (see
+    :py:class:`simpleflow.canvas.Broadcast`).
+
+    :param input: parsed input
+    :type input: Optional[dict]
+    :returns: input with "args" and "kwargs"
+    :rtype: dict
+    """
+    input = decompress_value(resolve_value(input)) or {}
+    return {
+        'args': [resolve_value(arg) for arg in input.get('args', ())],
+        'kwargs': {key: resolve_value(value) for key, value in input.get('kwargs', {}).items()},
+    }
+
+
+def load(data):
+    """
+    Return the serialized payload a reference points to, or data itself
+    if it isn't a reference.
+
+    :param data: serialized payload or reference
+    :type data: str
+    :rtype: str
+    """
+    if not is_reference(data):
+        return data
+    return _get(json.loads(data)[PAYLOAD_REFERENCE_KEY])
+
+
+def loads_or_raw(data):
+    """
+    Like :py:func:`simpleflow.utils.json_loads_or_raw`, resolving references.
+    """
+    return json_loads_or_raw(load(data))
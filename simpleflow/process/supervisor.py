@@ -8,6 +8,7 @@ import types
 
 import psutil
 
+from simpleflow import metrics
 from .named_mixin import NamedMixin, with_state
 
 logger = logging.getLogger(__name__)
@@ -116,16 +117,28 @@ class Supervisor(NamedMixin):
         if len(self._processes) != 0:
             raise Exception("Child processes list is not empty, already called .start() ?")
 
+        # aggregate the metrics of the children, see simpleflow.metrics
+        exporter = metrics.Exporter.from_settings(str(os.getpid()))
+        if exporter:
+            exporter.start()
+
         # start worker processes
         self._start_worker_processes()
 
         # wait for all processes to finish
         while True:
+            if exporter:
+                metrics.registry.set('simpleflow_supervised_processes', len(self._processes),
+                                     supervisor=self._payload_friendly_name)
+                exporter.update()
+
             # if terminating, join all processes and exit the loop so we finish
             # the supervisor process
             if self._terminating:
                 for proc in self._processes:
                     proc.join()
+                if exporter:
+                    exporter.stop()
                 break
 
             # wait 0.1s
@@ -0,0 +1,204 @@
+"""
+Cache of the results of idempotent activities, shared across executions.
+
+When the ``RESULT_CACHE`` setting is defined (a local directory, or a bucket
+on :py:mod:`simpleflow.storage`), activity workers look idempotent
+activities up before executing them: an entry younger than
+``RESULT_CACHE_TTL`` seconds completes the activity immediately.
+
+Entries are keyed by activity name, version and a hash of the arguments.
+The local cache keeps at most ``RESULT_CACHE_MAX_SIZE`` bytes, evicting the
+least recently used entries; expiration in buckets is left to their
+lifecycle rules.
+"""
+import hashlib
+import logging
+import os
+import time
+
+from simpleflow import settings, storage
+from simpleflow.utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+
+def get_key(name, version, args, kwargs):
+    """
+    Return the cache key of an activity execution.
+    :param name: activity name
+    :type name: str
+    :param version: activity version
+    :type version: str
+    :param args:
+    :type args: list
+    :param kwargs:
+    :type kwargs: dict
+    :rtype: str
+    """
+    # sort_keys: stable, standard library serialization
+    arguments = json_dumps({'args': args, 'kwargs': kwargs}, sort_keys=True)
+    h = hashlib.sha1()
+    for part in (name, version, arguments):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _encode_entry(data):
+    return '{}\n{}'.format(time.time(), data)
+
+
+def _decode_entry(content, ttl):
+    """
+    Return the data of an entry, or None if it expired.
+    Raise ValueError if the entry is corrupt.
+    """
+    created, data = content.split('\n', 1)
+    if ttl and float(created) + ttl < time.time():
+        return None
+    return data
+
+
+class StorageResultCache(object):
+    """
+    Result cache in a bucket, see :py:mod:`simpleflow.storage`.
+    """
+
+    def __init__(self, bucket, path_prefix=None, ttl=None):
+        self.bucket = bucket
+        self.path_prefix = path_prefix
+        self.ttl = ttl
+        self.backend = storage.get_backend(bucket)
+
+    def _get_path(self, key):
+        if self.path_prefix:
+            return os.path.join(self.path_prefix, key)
+        return key
+
+    def get(self, key):
+        try:
+            content = self.backend.pull_content(self._get_path(key))
+        except Exception:
+            return None
+        try:
+            return _decode_entry(content, self.ttl)
+        except ValueError as err:
+            logger.warning('corrupt cached result {}, ignored: {}'.format(key, err))
+            return None
+
+    def set(self, key, data):
+        try:
+            self.backend.push_content(self._get_path(key), _encode_entry(data))
+        except Exception as err:
+            logger.warning('cannot cache result {}: {}'.format(key, err))
+
+
+class LocalResultCache(StorageResultCache):
+    """
+    Result cache in a local directory, with LRU eviction by total size.
+
+    The size of the directory is only listed again when the entries set
+    by this process may have exceeded max_size, or after
+    ``scan_interval`` seconds for those set by other processes.
+    """
+    scan_interval = 60
+
+    def __init__(self, directory, ttl=None, max_size=None):
+        super(LocalResultCache, self).__init__('file://' + directory, ttl=ttl)
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None  # estimated size of the directory
+        self._scanned_at = None
+
+    def get(self, key):
+        data = super(LocalResultCache, self).get(key)
+        path = os.path.join(self.directory, key)
+        try:
+            if data is None:
+                if os.path.exists(path):  # expired or corrupt
+                    os.remove(path)
+            else:
+                os.utime(path, None)  # mtime = last access, for the LRU
+        except OSError:  # removed meanwhile
+            pass
+        return data
+
+    def set(self, key, data):
+        super(LocalResultCache, self).set(key, data)
+        if not self.max_size:
+            return
+        if self._size is not None:
+            self._size += len(data)
+        if (
+            self._size is None or self._size > self.max_size or
+            time.time() - self._scanned_at > self.scan_interval
+        ):
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries above max_size.
+        """
+        if not self.max_size:
+            return
+        entries = []
+        total_size = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if name.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:  # removed meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total_size += stat.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total_size -= size
+        self._size = total_size
+        self._scanned_at = time.time()
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Return the configured result cache, or None if disabled.
+    """
+    global _cache
+    if _cache is None:
+        if not settings.RESULT_CACHE:
+            return None
+        if settings.RESULT_CACHE.startswith('/'):
+            _cache = LocalResultCache(
+                settings.RESULT_CACHE,
+                ttl=settings.RESULT_CACHE_TTL,
+                max_size=settings.RESULT_CACHE_MAX_SIZE,
+            )
+        else:
+            _cache = StorageResultCache(
+                settings.RESULT_CACHE,
+                path_prefix=settings.RESULT_CACHE_PATH_PREFIX,
+                ttl=settings.RESULT_CACHE_TTL,
+            )
+    return _cache
+
+
+def set_cache(cache):
+    """
+    Override the result cache; None goes back to the ``RESULT_CACHE``
+    setting.
+    """
+    global _cache
+    _cache = cache
@@ -75,7 +75,50 @@ LOGGING = dict
 
 SIMPLEFLOW_S3_HOST = str
 
+STORAGE_CACHE_DIRECTORY = str_or_none
+STORAGE_CACHE_MAX_SIZE = int
+STORAGE_PART_SIZE = int
+STORAGE_THREADS = int
+
 STEP_BUCKET = str
 
 METROLOGY_BUCKET = str
 METROLOGY_PATH_PREFIX = str_or_none
+METROLOGY_SINKS = str
+METROLOGY_TRACEMALLOC_TOP = int
+METROLOGY_FLUSH_INTERVAL = int
+
+JSON_BACKEND = str_or_none
+
+COMPRESSION_CODEC = str_or_none
+COMPRESSION_THRESHOLD = int
+
+PAYLOAD_STORE = str_or_none
+PAYLOAD_PATH_PREFIX = str_or_none
+PAYLOAD_THRESHOLD = int
+PAYLOAD_CACHE_SIZE = int
+
+RESULT_CACHE = str_or_none
+RESULT_CACHE_PATH_PREFIX = str_or_none
+RESULT_CACHE_TTL = int
+RESULT_CACHE_MAX_SIZE = int
+
+DECISION_PROFILE_DIRECTORY = str_or_none
+DECISION_PROFILE_THRESHOLD = float
+
+SWF_RATE_LIMITS = str
+SWF_RATE_LIMIT_DECREASE = float
+SWF_RATE_LIMIT_INCREASE = float
+
+SWF_RETRY_BUDGET_RATIO = float
+SWF_RETRY_BUDGET_WINDOW = int
+SWF_RETRY_BUDGET_MIN_RETRIES = int
+
+SWF_CIRCUIT_BREAKER_FAILURES = int
+SWF_CIRCUIT_BREAKER_RESET_TIMEOUT = float
+
+METRICS_DIRECTORY = str_or_none
+METRICS_INTERVAL = int
+METRICS_HOST = str
+METRICS_PORT = int
+METRICS_TEXTFILE = str_or_none
@@ -19,10 +19,57 @@ ACTIVITY_HEARTBEAT_TIMEOUT = ACTIVITY_DEFAULT_TIMEOUT
 
 SIMPLEFLOW_S3_HOST = 's3.amazonaws.com'
 
-STEP_BUCKET = 'step_bucket'
+STORAGE_CACHE_DIRECTORY = None  # local cache of pulled keys; None disables it
+STORAGE_CACHE_MAX_SIZE = 10 * 1024 ** 3  # 10GB
+STORAGE_PART_SIZE = 16 * 1024 ** 2  # multipart transfers above 16MB (5MB minimum); 0 disables them
+STORAGE_THREADS = 8  # concurrent parts or files
 
-METROLOGY_BUCKET = 'metrology_bucket'
+STEP_BUCKET = 'step_bucket'  # bucket, or storage URL (s3://, file://, memory://)
+
+METROLOGY_BUCKET = 'metrology_bucket'  # bucket, or storage URL (s3://, file://, memory://)
 METROLOGY_PATH_PREFIX = None
+METROLOGY_SINKS = 'storage'  # comma-separated, see simpleflow.metrology_sinks
+METROLOGY_TRACEMALLOC_TOP = 0  # largest allocations recorded per step; 0 disables tracemalloc
+METROLOGY_FLUSH_INTERVAL = 0  # seconds between uploads of step stats; 0: once, when the activity ends
+
+JSON_BACKEND = None  # "orjson", "ujson", "rapidjson" or "json"; None: first installed
+
+COMPRESSION_CODEC = None  # "zlib" or "lzma"; None disables compression
+COMPRESSION_THRESHOLD = 1024
+
+PAYLOAD_STORE = None  # local directory or bucket; None disables offloading
+PAYLOAD_PATH_PREFIX = None
+PAYLOAD_THRESHOLD = 32000  # swf.constants.MAX_INPUT_LENGTH
+PAYLOAD_CACHE_SIZE = 64 * 1024 ** 2  # chars of payloads kept in memory, per process
+
+RESULT_CACHE = None  # local directory or bucket; None disables the cache
+RESULT_CACHE_PATH_PREFIX = None
+RESULT_CACHE_TTL = 7 * 24 * 3600  # 1 week
+RESULT_CACHE_MAX_SIZE = 1024 ** 3  # 1GB, local directory only
+
+DECISION_PROFILE_DIRECTORY = None  # profiles of the slow decisions; None disables profiling
+DECISION_PROFILE_THRESHOLD = 10  # seconds
+
+SWF_RATE_LIMITS = ''  # calls per second per process and API family, see simpleflow.swf.client
+SWF_RATE_LIMIT_DECREASE = 0.5  # rate factor on throttling
+SWF_RATE_LIMIT_INCREASE = 1  # rate recovery, in calls per second per second
+
+# Retries of the SWF calls of a process, over a window, at most:
+# min retries + ratio * calls
+SWF_RETRY_BUDGET_RATIO = 0.2
+SWF_RETRY_BUDGET_WINDOW = 60  # seconds
+SWF_RETRY_BUDGET_MIN_RETRIES = 10
+
+# The SWF calls of the pollers of a process fail fast for RESET_TIMEOUT
+# seconds after FAILURES consecutive errors
+SWF_CIRCUIT_BREAKER_FAILURES = 5
+SWF_CIRCUIT_BREAKER_RESET_TIMEOUT = 30  # seconds
+
+METRICS_DIRECTORY = None  # dumps of the process metrics; None disables the metrics export
+METRICS_INTERVAL = 10  # seconds between dumps
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 0  # HTTP port of the supervisors; 0 disables it
+METRICS_TEXTFILE = None  # Prometheus textfile written by the supervisors
 
 LOGGING = {
     'version': 1,
@@ -1,12 +1,8 @@
 import copy
-from .tasks import MarkStepDoneTask
 
 from simpleflow.base import SubmittableContainer
-from simpleflow import activity
 from simpleflow.canvas import Chain, FuncGroup
 from .utils import (
-    get_step_force_reasons,
-    get_step_skip_reasons,
     step_will_run,
     step_is_forced,
     step_is_skipped_by_force)
@@ -43,15 +39,12 @@ class Step(SubmittableContainer):
                 "reasons": []
             }
             chain = Chain()
-            forced_steps = workflow.get_forced_steps()
-            skipped_steps = workflow.get_skipped_steps()
+            forced_steps = workflow.get_forced_step_rules()
+            skipped_steps = workflow.get_skipped_step_rules()
             if step_will_run(self.step_name, forced_steps, skipped_steps, steps_done, self.force):
                 if step_is_forced(self.step_name, forced_steps, self.force):
                     marker["forced"] = True
-                    marker["reasons"] = get_step_force_reasons(
-                        self.step_name,
-                        getattr(workflow, 'steps_forced_reasons', {})
-                    )
+                    marker["reasons"] = forced_steps.get_reasons(self.step_name)
 
                 marker_done = copy.copy(marker)
                 marker_done["status"] = "completed"
@@ -60,20 +53,13 @@ class Step(SubmittableContainer):
                 chain += (
                     workflow.record_marker('log.step', marker),
                     self.activities,
-                    (activity.Activity(MarkStepDoneTask, **workflow._get_step_activity_params()),
-                     workflow.get_step_bucket(),
-                     workflow.get_step_path_prefix(),
-                     self.step_name),
                     workflow.record_marker('log.step', marker_done)
                 )
             else:
                 marker["status"] = "skipped"
                 if step_is_skipped_by_force(self.step_name, skipped_steps):
                     marker["forced"] = True
-                    marker["reasons"] = get_step_skip_reasons(
-                        self.step_name,
-                        getattr(workflow, 'steps_skipped_reasons', {})
-                    )
+                    marker["reasons"] = skipped_steps.get_reasons(self.step_name)
                 else:
                     marker["reasons"] = ["Step was already played"]
 
@@ -88,6 +74,8 @@ class Step(SubmittableContainer):
             chain.bubbles_exception_on_failure = self.bubbles_exception_on_failure
             return chain
 
+        # Completed steps are written into the bucket in the background
+        workflow.flush_steps_done()
         return workflow.submit(Chain(
             workflow.get_steps_done_activity(),
             FuncGroup(fn_steps_done),
@@ -8,7 +8,7 @@ from .constants import UNKNOWN_CONTEXT
 class GetStepsDoneTask(object):
     """
     List all the steps that are done by parsing
-    S3 bucket + path
+    bucket + path (see simpleflow.storage)
     """
 
     def __init__(self, bucket, path):
@@ -18,7 +18,7 @@ class GetStepsDoneTask(object):
     def execute(self):
         steps = []
         for f in storage.list_keys(self.bucket, self.path):
-            steps.append(f.key[len(self.path) + 1:])
+            steps.append(f.name[len(self.path) + 1:])
         return steps
 
 
@@ -34,13 +34,35 @@ class MarkStepDoneTask(object):
 
     def execute(self):
         path = os.path.join(self.path, self.step_name)
-        if hasattr(self, 'context'):
-            context = self.context
-            content = {
-                "run_id": context["run_id"],
-                "workflow_id": context["workflow_id"],
-                "version": context["version"]
-            }
-        else:
-            content = UNKNOWN_CONTEXT
-        storage.push_content(self.bucket, path, json.dumps(content))
+        storage.push_content(self.bucket, path, json.dumps(get_step_content(self)))
+
+
+class MarkStepsDoneTask(object):
+    """
+    Push a file for each of `step_names` into bucket/path
+    """
+
+    def __init__(self, bucket, path, step_names):
+        self.bucket = bucket
+        self.path = path
+        self.step_names = step_names
+
+    def execute(self):
+        content = json.dumps(get_step_content(self))
+        for step_name in self.step_names:
+            storage.push_content(self.bucket, os.path.join(self.path, step_name), content)
+
+
+def get_step_content(task):
+    """
+    Return the content of a step file, describing the execution
+    that played the step.
+    """
+    if hasattr(task, 'context'):
+        context = task.context
+        return {
+            "run_id": context["run_id"],
+            "workflow_id": context["workflow_id"],
+            "version": context["version"]
+        }
+    return UNKNOWN_CONTEXT
@@ -1,10 +1,87 @@
+class _StepRulesNode(object):
+    __slots__ = ('children', 'is_rule', 'reasons')
+
+    def __init__(self):
+        self.children = {}
+        self.is_rule = False
+        self.reasons = set()
+
+
+class StepRules(object):
+    """
+    Index of step rules (forced or skipped steps) with their reasons.
+
+    Rules are stored in a trie of the dotted segments of their names, so
+    that matching a step only walks the segments of this step:
+    for step_name = "a.b.c", rules "a", "a.b" and "a.b.c" match.
+    The wildcard rule (*) is the root of the trie and matches every step.
+    """
+
+    def __init__(self, steps=(), reasons=None):
+        """
+        :param steps: rules
+        :type steps: iterable[str]
+        :param reasons: rule -> reasons
+        :type reasons: dict[str, iterable[str]]
+        """
+        self._root = _StepRulesNode()
+        reasons = reasons or {}
+        for step in steps:
+            self.add(step)
+            for reason in reasons.get(step, ()):
+                self.add(step, reason)
+
+    def add(self, step, reason=None):
+        node = self._root
+        if step != "*":
+            for segment in step.split("."):
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _StepRulesNode()
+                node = child
+        node.is_rule = True
+        if reason:
+            node.reasons.add(reason)
+
+    def _iter_matching_nodes(self, step_name):
+        node = self._root
+        if node.is_rule:
+            yield node
+        for segment in step_name.split("."):
+            node = node.children.get(segment)
+            if node is None:
+                return
+            if node.is_rule:
+                yield node
+
+    def match(self, step_name):
+        """
+        Return True if a rule matches step_name.
+        """
+        for _ in self._iter_matching_nodes(step_name):
+            return True
+        return False
+
+    def get_reasons(self, step_name):
+        """
+        Return the reasons of the rules matching step_name.
+        """
+        reasons = []
+        for node in self._iter_matching_nodes(step_name):
+            reasons += node.reasons
+        return reasons
+
+
 def should_force_step(step_name, force_steps):
     """
     Check if step_name is in force_steps
     We support multi-level flags, ex for step_name = "a.b.c",
     we allow : "a", "a.b", "a.b.c"
     If one of force_steps is a wildcard (*), it will also force the step
+    force_steps may also be a StepRules index.
     """
+    if isinstance(force_steps, StepRules):
+        return force_steps.match(step_name)
     for step in force_steps:
         if step == "*" or step == step_name or step_name.startswith(step + "."):
             return True
@@ -39,11 +116,10 @@ def step_is_forced(step_name, force_steps, force):
 
 
 def _get_step_reasons(step_name, step_reasons):
-    reasons = []
-    for step, sreasons in step_reasons.items():
-        if step == "*" or step == step_name or step_name.startswith(step + "."):
-            reasons += sreasons
-    return reasons
+    """
+    Kept for compatibility, see :py:meth:`StepRules.get_reasons`.
+    """
+    return StepRules(step_reasons, step_reasons).get_reasons(step_name)
 
 
 def get_step_force_reasons(step_name, step_force_reasons):
@@ -56,3 +132,4 @@ def step_is_skipped_by_force(step_name, skipped_steps):
 
 def get_step_skip_reasons(step_name, step_skip_reasons):
     return _get_step_reasons(step_name, step_skip_reasons)
+
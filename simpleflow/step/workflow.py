@@ -4,16 +4,22 @@ from collections import defaultdict
 
 from .constants import STEP_ACTIVITY_PARAMS_DEFAULT
 from .submittable import Step
-from .tasks import GetStepsDoneTask
-from simpleflow import activity, settings, task
+from .tasks import GetStepsDoneTask, MarkStepsDoneTask
+from .utils import StepRules
+from simpleflow import activity, futures, payload, settings, task
+from simpleflow.utils.json_tools import decompress_value
 
 
 class WorkflowStepMixin(object):
 
     def get_step_bucket(self):
         """
-        Return the S3 bucket where to store the steps files
+        Return the S3 bucket where to store the steps files, or the
+        STEP_BUCKET storage URL (e.g. file:///directory), see
+        :py:func:`simpleflow.storage.get_backend`.
         """
+        if '://' in settings.STEP_BUCKET:
+            return settings.STEP_BUCKET
         return '/'.join((settings.SIMPLEFLOW_S3_HOST, settings.STEP_BUCKET))
 
     def get_step_path_prefix(self):
@@ -24,7 +30,7 @@ class WorkflowStepMixin(object):
 
     def get_step_activity_params(self):
         """
-        Returns the params for GetStepsDoneTask and MarkStepAsDone activities
+        Returns the params for GetStepsDoneTask and MarkStepsDoneTask activities
         Will be merged with the default ones
         """
         return {}
@@ -37,6 +43,7 @@ class WorkflowStepMixin(object):
             self.steps_forced = set()
             self.steps_forced_reasons = defaultdict(set)
         steps = set(steps)
+        self._add_step_rules('forced', steps, reason)
         self.steps_forced |= set(steps)
         if reason:
             for step in steps:
@@ -45,6 +52,12 @@ class WorkflowStepMixin(object):
     def get_forced_steps(self):
         return list(getattr(self, 'steps_forced', []))
 
+    def get_forced_step_rules(self):
+        """
+        Return the forced steps as a :py:class:`StepRules` index.
+        """
+        return self._get_step_rules('forced')
+
     def add_skipped_steps(self, steps, reason=None):
         """
         Add steps to skip
@@ -53,6 +66,7 @@ class WorkflowStepMixin(object):
             self.steps_skipped = set()
             self.steps_skipped_reasons = defaultdict(set)
         steps = set(steps)
+        self._add_step_rules('skipped', steps, reason)
         self.steps_skipped |= set(steps)
         if reason:
             for step in steps:
@@ -61,6 +75,55 @@ class WorkflowStepMixin(object):
     def get_skipped_steps(self):
         return list(getattr(self, 'steps_skipped', []))
 
+    def get_skipped_step_rules(self):
+        """
+        Return the skipped steps as a :py:class:`StepRules` index.
+        """
+        return self._get_step_rules('skipped')
+
+    def _get_step_rules(self, kind):
+        """
+        Return the StepRules index of the forced or skipped steps. It is
+        maintained by add_forced_steps() and add_skipped_steps(), and only
+        rebuilt when the steps change otherwise: get_forced_steps() or
+        get_skipped_steps() overridden, steps_forced or steps_skipped
+        assigned.
+
+        :param kind: 'forced' or 'skipped'
+        :type kind: str
+        :rtype: StepRules
+        """
+        method = 'get_{}_steps'.format(kind)
+        if getattr(type(self), method) is getattr(WorkflowStepMixin, method):
+            steps = getattr(self, 'steps_' + kind, ())
+            key = (id(steps), len(steps))
+        else:
+            steps = getattr(self, method)()
+            key = tuple(steps)
+        cache = self.__dict__.setdefault('_step_rules', {})
+        if kind not in cache or cache[kind][0] != key:
+            cache[kind] = (key, StepRules(steps, getattr(self, 'steps_{}_reasons'.format(kind), {})))
+        return cache[kind][1]
+
+    def _add_step_rules(self, kind, steps, reason):
+        """
+        Add steps to the StepRules index of the forced or skipped steps,
+        before they are added to steps_forced or steps_skipped, if it is up
+        to date; otherwise drop it, see _get_step_rules().
+        """
+        cache = self.__dict__.get('_step_rules', {})
+        if kind not in cache:
+            return
+        key, rules = cache.pop(kind)
+        all_steps = getattr(self, 'steps_' + kind)
+        method = 'get_{}_steps'.format(kind)
+        if getattr(type(self), method) is not getattr(WorkflowStepMixin, method) or \
+                key != (id(all_steps), len(all_steps)):
+            return
+        for step in steps:
+            rules.add(step, reason)
+        cache[kind] = ((id(all_steps), len(all_steps | steps)), rules)
+
     def _get_step_activity_params(self):
         """
         Returns the merged version between self.get_step_activity_params()
@@ -87,3 +150,101 @@ class WorkflowStepMixin(object):
     def get_steps_done(self):
         return self.submit(
             self.get_steps_done_activity()).result
+
+    def get_mark_steps_done_activity(self, step_names):
+        # Always idempotent: the writes in flight are resubmitted on each
+        # replay, see _get_steps_done_flush_state(), and must keep their
+        # task id whatever get_step_activity_params() returns.
+        params = self._get_step_activity_params()
+        params['idempotent'] = True
+        return task.ActivityTask(activity.Activity(
+            MarkStepsDoneTask,
+            **params),
+            self.get_step_bucket(),
+            self.get_step_path_prefix(),
+            step_names)
+
+    def flush_steps_done(self):
+        """
+        Write the steps completed so far, as recorded by their "log.step"
+        markers, into the S3 bucket.
+
+        Writes happen in the background and in bulk: a single
+        MarkStepsDoneTask is in flight at a time, the next one takes all
+        the steps completed meanwhile.
+
+        :returns: futures of the writes not finished yet
+        :rtype: list[simpleflow.futures.Future]
+        """
+        state = self._get_steps_done_flush_state()
+        if state['completed'] is None or state['history'] is None:
+            state['completed'] = self._get_steps_completed()
+        pending = [step for step in state['completed'] if step not in state['flushed']]
+        if pending and all(f.done for f in state['futures']):
+            state['futures'].append(self.submit(self.get_mark_steps_done_activity(pending)))
+            state['flushed'].update(pending)
+        return [f for f in state['futures'] if not f.done]
+
+    def before_close(self):
+        """
+        Don't close the workflow, completed or failed, before its steps
+        are written.
+        """
+        futures.wait(*self.flush_steps_done())
+
+    def _get_steps_completed(self):
+        """
+        Return the names of the completed steps, from the recorded "log.step"
+        markers.
+        """
+        steps = []
+        for marker in self.list_markers(all=True):
+            if marker.name != 'log.step' or marker.state != 'recorded':
+                continue
+            if not isinstance(marker.details, dict):
+                continue
+            step = marker.details.get('step')
+            if marker.details.get('status') == 'completed' and step not in steps:
+                steps.append(step)
+        return steps
+
+    def _get_steps_done_flush_state(self):
+        """
+        Return the state of the steps writes for the current replay, rebuilt
+        from the MarkStepsDoneTask activities found in the history.
+        Without history (e.g. local executor), the state lasts for the
+        whole execution.
+        """
+        history = getattr(self.executor, 'history', None)
+        state = getattr(self, '_steps_done_flush_state', None)
+        if state is not None and state['history'] is history:
+            return state
+
+        state = {
+            'history': history,
+            'completed': None,
+            'flushed': set(),
+            'futures': [],
+        }
+        if history is not None:
+            name = self.get_mark_steps_done_activity([]).activity.name
+            for event in history.activities.values():
+                if event.get('name') != name:
+                    continue
+                step_names = self._get_mark_steps_done_step_names(event['input'])
+                state['flushed'].update(step_names)
+                if event['state'] != 'completed':
+                    # Resubmit to resume it: same arguments, same task id
+                    state['futures'].append(self.submit(self.get_mark_steps_done_activity(step_names)))
+        self._steps_done_flush_state = state
+        return state
+
+    @staticmethod
+    def _get_mark_steps_done_step_names(input):
+        """
+        Return the step names of a MarkStepsDoneTask input, read from the
+        history: like the worker does, resolve the payload references and
+        decompress it.
+        """
+        input = decompress_value(payload.resolve_value(input))
+        return payload.resolve_value(input['args'][2])
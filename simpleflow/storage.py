@@ -1,14 +1,47 @@
+import base64
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
 from boto.s3 import connection
 from boto.s3.key import Key
 
 from . import settings
+from .utils.files import atomic_file, file_lock, write_file_atomically
 
 
+# Per-process caches: connections must not be shared with forked children
+# (e.g. activity workers), see _check_caches_pid().
+CONNECTION_CACHE = {}
 BUCKET_CACHE = {}
+_caches_pid = None
+
+
+def _check_caches_pid():
+    """
+    Clear the caches inherited from a parent process.
+    """
+    global _caches_pid
+    pid = os.getpid()
+    if _caches_pid != pid:
+        CONNECTION_CACHE.clear()
+        BUCKET_CACHE.clear()
+        _caches_pid = pid
 
 
 def get_connection(host):
-    return connection.S3Connection(host=host)
+    _check_caches_pid()
+    conn = CONNECTION_CACHE.get(host)
+    if conn is None:
+        conn = CONNECTION_CACHE[host] = connection.S3Connection(host=host)
+    return conn
 
 
 def sanitize_bucket_and_host(bucket):
@@ -29,42 +62,472 @@ def sanitize_bucket_and_host(bucket):
 def get_bucket(bucket):
     bucket, host = sanitize_bucket_and_host(bucket)
     conn = get_connection(host)
-    if bucket not in BUCKET_CACHE:
-        bucket = conn.get_bucket(bucket)
-        BUCKET_CACHE[bucket] = bucket
-    return BUCKET_CACHE[bucket]
+    key = (host, bucket)
+    if key not in BUCKET_CACHE:
+        BUCKET_CACHE[key] = conn.get_bucket(bucket)
+    return BUCKET_CACHE[key]
+
+
+def _evict_cache(directory, max_size, keep=None):
+    """
+    Remove the least recently used files of the cache above max_size,
+    except keep and the files in use, see :py:func:`_cached_file`.
+    """
+    entries = []
+    total_size = 0
+    for name in os.listdir(directory):
+        if name.startswith('.') or name.endswith('.lock'):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:  # removed meanwhile
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+        total_size += stat.st_size
+    entries.sort()
+    for _, size, name in entries:
+        if total_size <= max_size:
+            break
+        path = os.path.join(directory, name)
+        if path == keep:
+            continue
+        with file_lock(path, blocking=False) as locked:
+            if not locked:  # in use
+                continue
+            for filename in (path, path + '.lock'):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+        total_size -= size
+
+
+@contextlib.contextmanager
+def _cached_file(key):
+    """
+    Yield the path of a local copy of key, downloaded in the
+    STORAGE_CACHE_DIRECTORY if not already there; it is not evicted until
+    the end of the block. Files are identified by bucket, key name and
+    ETag, so a modified key is downloaded again.
+
+    Keys larger than STORAGE_CACHE_MAX_SIZE are not cached: yield None.
+
+    :param key:
+    :type key: boto.s3.key.Key
+    """
+    directory = settings.STORAGE_CACHE_DIRECTORY
+    max_size = settings.STORAGE_CACHE_MAX_SIZE
+    if max_size and key.size and key.size > max_size:
+        yield None
+        return
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:  # created meanwhile
+            pass
+    name = hashlib.sha1('{}/{}/{}'.format(key.bucket.name, key.name, key.etag).encode('utf-8')).hexdigest()
+    path = os.path.join(directory, name)
+    downloaded = False
+    while True:
+        with file_lock(path, shared=True):
+            if os.path.exists(path):
+                os.utime(path, None)  # mtime = last access, for the LRU
+                if downloaded and max_size:
+                    with file_lock(os.path.join(directory, '.evict')):
+                        _evict_cache(directory, max_size, keep=path)
+                yield path
+                return
+        # Missing, or evicted before the shared lock was taken
+        with file_lock(path):
+            if not os.path.exists(path):
+                with atomic_file(path) as f:
+                    _download(key, f)
+                downloaded = True
+
+
+def _map(func, items, threads=None):
+    """
+    Call func on each item from a pool of threads (STORAGE_THREADS by
+    default) and return the results; the first exception is raised.
+    """
+    items = list(items)
+    threads = min(threads or settings.STORAGE_THREADS, len(items))
+    if threads <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.terminate()
+
+
+def _get_parts(size, part_size):
+    """
+    Return the (offset, length) of the parts of a file.
+    """
+    return [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+
+
+def _multipart_etag(digests):
+    """
+    Return the ETag S3 computes for an object uploaded in parts: the MD5 of
+    the binary MD5s of the parts, followed by the number of parts.
+
+    :param digests: binary MD5 of each part
+    :type digests: list[bytes]
+    :rtype: str
+    """
+    return '{}-{}'.format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+
+
+def _download(key, f):
+    """
+    Download key to the file object f. Keys larger than STORAGE_PART_SIZE
+    are fetched in ranges, STORAGE_THREADS at a time; each range length is
+    checked, and the MD5s of the ranges against the ETag when the key was
+    uploaded in parts of the same size.
+
+    :type key: boto.s3.key.Key
+    :param f: file object open for writing
+    """
+    part_size = settings.STORAGE_PART_SIZE
+    if not part_size or not key.size or key.size <= part_size:
+        key.get_contents_to_file(f)
+        return
+
+    lock = threading.Lock()
+    start = f.tell()
+
+    def download_part(part):
+        offset, length = part
+        part_key = Key(key.bucket, key.name)
+        headers = {'Range': 'bytes={}-{}'.format(offset, offset + length - 1)}
+        data = part_key.get_contents_as_string(headers=headers)
+        if len(data) != length:
+            raise IOError('{}: got {} bytes at offset {}, expected {}'.format(
+                key.name, len(data), offset, length))
+        with lock:
+            f.seek(start + offset)
+            f.write(data)
+        return hashlib.md5(data).digest()
+
+    parts = _get_parts(key.size, part_size)
+    digests = _map(download_part, parts)
+    f.seek(start + key.size)
+    etag = (key.etag or '').strip('"')
+    if etag.endswith('-{}'.format(len(parts))) and etag != _multipart_etag(digests):
+        raise IOError('{}: checksum mismatch, ETag is {}'.format(key.name, etag))
+
+
+def _upload_multipart(bucket, path, src_file, size, headers):
+    """
+    Upload src_file in parts of STORAGE_PART_SIZE, STORAGE_THREADS at a
+    time. S3 checks each part against its Content-MD5, then the object
+    against the ETag expected from the parts.
+    """
+    part_size = settings.STORAGE_PART_SIZE
+    upload = bucket.initiate_multipart_upload(path, headers=headers)
+
+    def upload_part(numbered_part):
+        part_num, (offset, length) = numbered_part
+        with open(src_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        digest = hashlib.md5(data)
+        md5 = (digest.hexdigest(), base64.b64encode(digest.digest()).decode('ascii'))
+        upload.upload_part_from_file(io.BytesIO(data), part_num, md5=md5, size=length)
+        return digest.digest()
+
+    try:
+        digests = _map(upload_part, enumerate(_get_parts(size, part_size), 1))
+        completed = upload.complete_upload()
+    except Exception:
+        upload.cancel_upload()
+        raise
+    etag = (completed.etag or '').strip('"')
+    if etag != _multipart_etag(digests):
+        raise IOError('{}: checksum mismatch, ETag is {}'.format(path, etag))
+
+
+class KeyInfo(namedtuple('KeyInfo', ['name', 'size'])):
+    """
+    Description of a stored file, as returned by the non-S3 backends.
+    """
+    __slots__ = ()
+
+
+class S3Backend(object):
+    """
+    Storage in an S3 bucket, ``bucket`` or ``host/bucket``.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def _get_key(self, path):
+        key = get_bucket(self.bucket).get_key(path)
+        if key is None:
+            raise KeyError(path)
+        return key
+
+    def push(self, path, src_file, content_type=None):
+        bucket = get_bucket(self.bucket)
+        headers = {}
+        if content_type:
+            headers["content_type"] = content_type
+        size = os.path.getsize(src_file)
+        part_size = settings.STORAGE_PART_SIZE
+        if part_size and size > part_size:
+            _upload_multipart(bucket, path, src_file, size, headers)
+            return
+        key = Key(bucket, path)
+        key.set_contents_from_filename(src_file, headers=headers)
+
+    def push_content(self, path, content, content_type=None):
+        key = Key(get_bucket(self.bucket), path)
+        headers = {}
+        if content_type:
+            headers["content_type"] = content_type
+        key.set_contents_from_string(content, headers=headers)
+
+    def pull(self, path, dest_file):
+        key = self._get_key(path)
+        if settings.STORAGE_CACHE_DIRECTORY:
+            with _cached_file(key) as filename:
+                if filename is not None:
+                    shutil.copyfile(filename, dest_file)
+                    return
+        with open(dest_file, 'wb') as f:
+            _download(key, f)
+
+    def pull_content(self, path):
+        key = self._get_key(path)
+        if settings.STORAGE_CACHE_DIRECTORY:
+            with _cached_file(key) as filename:
+                if filename is not None:
+                    with open(filename, 'rb') as f:
+                        return f.read().decode('utf-8')
+        return key.get_contents_as_string(encoding='utf-8')
+
+    def pull_mmap(self, path):
+        if not settings.STORAGE_CACHE_DIRECTORY:
+            raise ValueError('pull_mmap() needs a STORAGE_CACHE_DIRECTORY')
+        key = self._get_key(path)
+        with _cached_file(key) as filename:
+            if filename is not None:
+                return _mmap_file(filename, path)
+        # Too large for the cache: map an unlinked temporary file
+        with tempfile.TemporaryFile(dir=settings.STORAGE_CACHE_DIRECTORY) as f:
+            _download(key, f)
+            f.flush()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def list_keys(self, path=None):
+        return get_bucket(self.bucket).list(path)
+
+    def stat(self, path):
+        key = get_bucket(self.bucket).get_key(path)
+        if key is None:
+            return None
+        return KeyInfo(key.name, key.size)
+
+
+class LocalBackend(object):
+    """
+    Storage in a local directory, e.g. for on-premises runs. Files are
+    written atomically, see :py:func:`simpleflow.utils.files.atomic_file`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _get_filename(self, path):
+        return os.path.join(self.directory, *path.split('/'))
+
+    def push(self, path, src_file, content_type=None):
+        with atomic_file(self._get_filename(path)) as f, open(src_file, 'rb') as src:
+            shutil.copyfileobj(src, f)
+
+    def push_content(self, path, content, content_type=None):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        write_file_atomically(self._get_filename(path), content)
+
+    def pull(self, path, dest_file):
+        shutil.copyfile(self._get_filename(path), dest_file)
+
+    def pull_content(self, path):
+        with open(self._get_filename(path), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def pull_mmap(self, path):
+        return _mmap_file(self._get_filename(path), path)
+
+    def list_keys(self, path=None):
+        """
+        Like S3, path is a prefix of the names, not necessarily a directory.
+        """
+        path = path or ''
+        start = os.path.join(self.directory, *path.split('/')[:-1])
+        names = []
+        for root, _, files in os.walk(start):
+            for filename in files:
+                if filename.startswith('.'):  # being written
+                    continue
+                name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, '/')
+                if name.startswith(path):
+                    names.append(name)
+        return [self.stat(name) for name in sorted(names)]
+
+    def stat(self, path):
+        try:
+            return KeyInfo(path, os.path.getsize(self._get_filename(path)))
+        except OSError:
+            return None
+
+
+class MemoryBackend(object):
+    """
+    Storage in memory, for tests. Backends with the same name share their
+    content within a process.
+    """
+    stores = {}
+
+    def __init__(self, name):
+        self.name = name
+        self.files = self.stores.setdefault(name, {})
+
+    def push(self, path, src_file, content_type=None):
+        with open(src_file, 'rb') as f:
+            self.files[path] = f.read()
+
+    def push_content(self, path, content, content_type=None):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self.files[path] = content
+
+    def pull(self, path, dest_file):
+        with open(dest_file, 'wb') as f:
+            f.write(self.files[path])
+
+    def pull_content(self, path):
+        return self.files[path].decode('utf-8')
+
+    def pull_mmap(self, path):
+        raise ValueError('cannot mmap {}: in-memory storage'.format(path))
+
+    def list_keys(self, path=None):
+        path = path or ''
+        return [self.stat(name) for name in sorted(self.files) if name.startswith(path)]
+
+    def stat(self, path):
+        if path not in self.files:
+            return None
+        return KeyInfo(path, len(self.files[path]))
+
+
+BACKENDS = {
+    's3': S3Backend,
+    'file': LocalBackend,
+    'memory': MemoryBackend,
+}
+
+
+def get_backend(bucket):
+    """
+    Return the storage backend of a location: ``s3://[host/]bucket``,
+    ``file:///directory`` or ``memory://name``. Locations without a scheme
+    are S3 buckets.
+
+    :param bucket: location
+    :type bucket: str
+    """
+    scheme, sep, location = bucket.partition('://')
+    if not sep:
+        return S3Backend(bucket)
+    if scheme not in BACKENDS:
+        raise ValueError('unknown storage scheme: {}'.format(bucket))
+    return BACKENDS[scheme](location)
+
+
+def _mmap_file(filename, path):
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('cannot mmap an empty key: {}'.format(path))
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 def pull(bucket, path, dest_file):
-    bucket = get_bucket(bucket)
-    key = bucket.get_key(path)
-    key.get_contents_to_filename(dest_file)
+    get_backend(bucket).pull(path, dest_file)
+
+
+def pull_many(bucket, items):
+    """
+    Pull many keys concurrently.
+
+    :param items: (path, dest_file) pairs
+    :type items: iterable[(str, str)]
+    """
+    backend = get_backend(bucket)
+    _map(lambda item: backend.pull(*item), items)
 
 
 def pull_content(bucket, path):
-    bucket = get_bucket(bucket)
-    key = bucket.get_key(path)
-    return key.get_contents_as_string(encoding='utf-8')
+    return get_backend(bucket).pull_content(path)
+
+
+def pull_contents(bucket, paths):
+    """
+    Pull the content of many keys concurrently.
+
+    :param paths: keys to pull
+    :type paths: iterable[str]
+    :return: the contents, in the order of paths
+    :rtype: list[str]
+    """
+    backend = get_backend(bucket)
+    return _map(backend.pull_content, paths)
+
+
+def pull_mmap(bucket, path):
+    """
+    Return a read-only memory map of the content of a key, to consume large
+    files without copying them. Needs a STORAGE_CACHE_DIRECTORY on S3.
+
+    :rtype: mmap.mmap
+    """
+    return get_backend(bucket).pull_mmap(path)
 
 
 def push(bucket, path, src_file, content_type=None):
-    bucket = get_bucket(bucket)
-    key = Key(bucket, path)
-    headers = {}
-    if content_type:
-        headers["content_type"] = content_type
-    key.set_contents_from_filename(src_file, headers=headers)
+    get_backend(bucket).push(path, src_file, content_type=content_type)
+
+
+def push_many(bucket, items, content_type=None):
+    """
+    Push many files concurrently.
+
+    :param items: (path, src_file) pairs
+    :type items: iterable[(str, str)]
+    """
+    backend = get_backend(bucket)
+    _map(lambda item: backend.push(*item, content_type=content_type), items)
 
 
 def push_content(bucket, path, content, content_type=None):
-    bucket = get_bucket(bucket)
-    key = Key(bucket, path)
-    headers = {}
-    if content_type:
-        headers["content_type"] = content_type
-    key.set_contents_from_string(content, headers=headers)
+    get_backend(bucket).push_content(path, content, content_type=content_type)
 
 
 def list_keys(bucket, path=None):
-    bucket = get_bucket(bucket)
-    return bucket.list(path)
+    """
+    Return the keys whose name starts with path: boto keys on S3, KeyInfo
+    otherwise; both have a name and a size.
+    """
+    return get_backend(bucket).list_keys(path)
+
+
+def stat(bucket, path):
+    """
+    Return the KeyInfo of a key, or None if it doesn't exist.
+    """
+    return get_backend(bucket).stat(path)
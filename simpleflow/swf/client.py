@@ -0,0 +1,342 @@
+"""
+Instrumentation of the SWF API calls.
+
+The objects of the swf library (actors, models, querysets) call SWF through
+a :py:class:`boto.swf.layer1.Layer1` connection, whose API methods all end
+in ``make_request()``. :py:func:`install` wraps this method to record, for
+each API (e.g. ``PollForDecisionTask``), the number of calls, their latency,
+the size of the requests and responses, the throttled calls and the retries:
+
+- in the metrics of the process, see :py:mod:`simpleflow.metrics`;
+- in the :py:class:`Usage` objects opened with :py:func:`track`, to attribute
+  the cost of a decision or of an activity.
+
+A retry is a call made after a failed call of the same API in the same
+thread; the retries done by boto itself on network errors are not seen.
+
+The calls are also rate limited per API family (see :py:func:`get_family`)
+when the ``SWF_RATE_LIMITS`` setting is defined, e.g.
+``poll=5,respond=20,heartbeat=10:20,list=2`` (calls per second and
+optional burst, per process). The rate of a family is divided on each
+ThrottlingException and grows back linearly, see
+:py:class:`simpleflow.utils.ratelimit.TokenBucket`.
+
+The retries of the SWF calls of a process share a
+:py:class:`simpleflow.utils.retry.RetryBudget` and the calls of its pollers
+a :py:class:`simpleflow.utils.retry.CircuitBreaker`, see
+:py:func:`get_retry_budget` and :py:func:`get_circuit_breaker`.
+"""
+import contextlib
+import functools
+import logging
+import os
+import threading
+
+import boto.swf.layer1
+
+from simpleflow import metrics, settings
+from simpleflow.compat import perf_counter
+from simpleflow.utils.ratelimit import TokenBucket
+from simpleflow.utils.retry import CircuitBreaker, RetryBudget
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('calls', 'errors', 'throttled', 'retries', 'seconds', 'request_bytes', 'response_bytes')
+
+_local = threading.local()
+_original_make_request = None
+_original_mexe = None
+
+# family -> TokenBucket, see get_limiter()
+_limiters = {}
+# Parsed SWF_RATE_LIMITS, see get_limiter()
+_rate_limits = None
+_limiters_pid = None
+_limiters_lock = threading.Lock()
+
+# pid -> RetryBudget or CircuitBreaker, see get_retry_budget()
+_retry_budgets = {}
+_circuit_breakers = {}
+
+
+def is_throttling(error):
+    """
+    Tell if an exception is a SWF ThrottlingException.
+
+    :type error: Exception
+    :rtype: bool
+    """
+    body = getattr(error, 'body', None)
+    if not isinstance(body, dict):
+        return False
+    return (body.get('__type') or '').endswith('ThrottlingException')
+
+
+def get_family(api):
+    """
+    Return the rate limiting family of an API: poll, heartbeat, respond,
+    list (read-only calls) or other.
+
+    :type api: str
+    :rtype: str
+    """
+    if api.startswith('Poll'):
+        return 'poll'
+    if api == 'RecordActivityTaskHeartbeat':
+        return 'heartbeat'
+    if api.startswith('Respond'):
+        return 'respond'
+    if api.startswith(('List', 'Describe', 'Count', 'Get')):
+        return 'list'
+    return 'other'
+
+
+def parse_rate_limits(value):
+    """
+    Parse the SWF_RATE_LIMITS setting.
+
+    :type value: str
+    :returns: family -> (rate, burst or None)
+    :rtype: dict[str, (float, float)]
+    :raises ValueError: if the value is malformed
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        family, _, limit = item.partition('=')
+        rate, _, burst = limit.partition(':')
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else None
+        except ValueError:
+            raise ValueError('invalid SWF_RATE_LIMITS item: {!r}'.format(item))
+        if rate <= 0:
+            raise ValueError('invalid SWF_RATE_LIMITS item: {!r}'.format(item))
+        limits[family.strip()] = (rate, burst)
+    return limits
+
+
+def get_limiter(family):
+    """
+    Return the token bucket of a family in this process, or None if its
+    calls are not limited. A malformed SWF_RATE_LIMITS is logged once and
+    disables the rate limiting.
+
+    :rtype: TokenBucket
+    """
+    global _limiters_pid, _rate_limits
+    with _limiters_lock:
+        if _limiters_pid != os.getpid():
+            _limiters.clear()
+            _limiters_pid = os.getpid()
+        if _rate_limits is None:
+            try:
+                _rate_limits = parse_rate_limits(settings.SWF_RATE_LIMITS)
+            except ValueError as err:
+                logger.error('SWF calls not rate limited: {}'.format(err))
+                _rate_limits = {}
+        if family not in _limiters:
+            limit = _rate_limits.get(family)
+            _limiters[family] = limit and TokenBucket(
+                limit[0],
+                burst=limit[1],
+                decrease=settings.SWF_RATE_LIMIT_DECREASE,
+                increase=settings.SWF_RATE_LIMIT_INCREASE,
+            )
+        return _limiters[family]
+
+
+def reset_limiters():
+    """
+    Forget the token buckets, e.g. after a change of SWF_RATE_LIMITS.
+    """
+    global _rate_limits
+    with _limiters_lock:
+        _limiters.clear()
+        _rate_limits = None
+
+
+def get_retry_budget():
+    """
+    Return the retry budget of the SWF calls of this process, from the
+    SWF_RETRY_BUDGET_* settings.
+
+    :rtype: RetryBudget
+    """
+    pid = os.getpid()
+    with _limiters_lock:
+        if pid not in _retry_budgets:
+            _retry_budgets.clear()
+            _retry_budgets[pid] = RetryBudget(
+                ratio=settings.SWF_RETRY_BUDGET_RATIO,
+                window=settings.SWF_RETRY_BUDGET_WINDOW,
+                min_retries=settings.SWF_RETRY_BUDGET_MIN_RETRIES,
+            )
+        return _retry_budgets[pid]
+
+
+def get_circuit_breaker():
+    """
+    Return the circuit breaker of the SWF calls of the pollers of this
+    process, from the SWF_CIRCUIT_BREAKER_* settings.
+
+    :rtype: CircuitBreaker
+    """
+    pid = os.getpid()
+    with _limiters_lock:
+        if pid not in _circuit_breakers:
+            _circuit_breakers.clear()
+            _circuit_breakers[pid] = CircuitBreaker(
+                failure_threshold=settings.SWF_CIRCUIT_BREAKER_FAILURES,
+                reset_timeout=settings.SWF_CIRCUIT_BREAKER_RESET_TIMEOUT,
+            )
+        return _circuit_breakers[pid]
+
+
+class Usage(object):
+    """
+    Cost of the SWF calls made in a :py:func:`track` block.
+
+    :ivar apis: API name -> field -> value, see FIELDS
+    :type apis: dict[str, dict[str, float]]
+    """
+
+    def __init__(self):
+        self.apis = {}
+
+    def add(self, api, **values):
+        entry = self.apis.get(api)
+        if entry is None:
+            entry = self.apis[api] = dict.fromkeys(FIELDS, 0)
+        for field, value in values.items():
+            entry[field] += value
+
+    def total(self, field):
+        return sum(entry[field] for entry in self.apis.values())
+
+    def to_dict(self):
+        return {api: dict(entry) for api, entry in self.apis.items()}
+
+    def __str__(self):
+        totals = ' '.join(
+            '{}={:.3f}'.format(field, self.total(field)) if field == 'seconds'
+            else '{}={}'.format(field, self.total(field))
+            for field in FIELDS
+        )
+        apis = ','.join('{}:{}'.format(api, self.apis[api]['calls']) for api in sorted(self.apis))
+        return '{} apis={}'.format(totals, apis)
+
+
+def _get_usages():
+    if not hasattr(_local, 'usages'):
+        _local.usages = []
+        _local.failed = set()
+    return _local.usages
+
+
+@contextlib.contextmanager
+def track():
+    """
+    Attribute the SWF calls made by this thread in the block to the yielded
+    :py:class:`Usage`. Blocks can be nested.
+    """
+    usage = Usage()
+    usages = _get_usages()
+    usages.append(usage)
+    try:
+        yield usage
+    finally:
+        usages.remove(usage)
+
+
+def record(api, seconds, request_bytes, response_bytes, error=None):
+    """
+    Record a call to the metrics and to the current usages.
+    """
+    usages = _get_usages()
+    failed = _local.failed
+    retries = 1 if api in failed else 0
+    throttled = 1 if error is not None and is_throttling(error) else 0
+    if error is None:
+        failed.discard(api)
+        outcome = 'ok'
+    else:
+        failed.add(api)
+        outcome = 'throttled' if throttled else 'error'
+
+    registry = metrics.registry
+    registry.inc('simpleflow_swf_requests_total', api=api, outcome=outcome)
+    registry.observe('simpleflow_swf_request_seconds', seconds, api=api)
+    registry.inc('simpleflow_swf_request_bytes_total', request_bytes, api=api)
+    registry.inc('simpleflow_swf_response_bytes_total', response_bytes, api=api)
+    if retries:
+        registry.inc('simpleflow_swf_retries_total', api=api)
+    for usage in usages:
+        usage.add(
+            api,
+            calls=1,
+            errors=0 if error is None else 1,
+            throttled=throttled,
+            retries=retries,
+            seconds=seconds,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+        )
+
+
+def _mexe(self, *args, **kwargs):
+    response = _original_mexe(self, *args, **kwargs)
+    try:
+        _local.response_bytes = int(response.getheader('content-length') or 0)
+    except (AttributeError, TypeError, ValueError):
+        _local.response_bytes = 0
+    return response
+
+
+def _make_request(self, action, body='', object_hook=None):
+    family = get_family(action)
+    limiter = get_limiter(family)
+    if limiter is not None:
+        waited = limiter.acquire()
+        if waited:
+            metrics.registry.inc('simpleflow_swf_rate_limit_seconds_total', waited, family=family)
+        # Refilled by acquire(), growing back after a throttling
+        metrics.registry.set('simpleflow_swf_rate_limit', limiter.rate, family=family)
+    _local.response_bytes = 0
+    start = perf_counter()
+    try:
+        result = _original_make_request(self, action, body, object_hook)
+    except Exception as error:
+        record(action, perf_counter() - start, len(body), _local.response_bytes, error)
+        if limiter is not None and is_throttling(error):
+            limiter.throttled()
+            metrics.registry.set('simpleflow_swf_rate_limit', limiter.rate, family=family)
+        raise
+    record(action, perf_counter() - start, len(body), _local.response_bytes)
+    return result
+
+
+def install():
+    """
+    Instrument all the SWF connections, existing or not. Idempotent.
+    """
+    global _original_make_request, _original_mexe
+    if _original_make_request is not None:
+        return
+    layer1 = boto.swf.layer1.Layer1
+    _original_make_request = layer1.make_request
+    _original_mexe = layer1._mexe
+    layer1.make_request = functools.wraps(_original_make_request)(_make_request)
+    layer1._mexe = functools.wraps(_original_mexe)(_mexe)
+
+
+def uninstall():
+    global _original_make_request, _original_mexe
+    if _original_make_request is None:
+        return
+    layer1 = boto.swf.layer1.Layer1
+    layer1.make_request = _original_make_request
+    layer1._mexe = _original_mexe
+    _original_make_request = _original_mexe = None
@@ -2,10 +2,12 @@ from __future__ import absolute_import
 
 import inspect
 
+import cProfile
 import hashlib
 import json
 import logging
 import multiprocessing
+import os
 import re
 import traceback
 
@@ -18,10 +20,13 @@ from simpleflow import (
     exceptions,
     executor,
     futures,
+    payload,
+    settings,
     task,
 )
 from simpleflow.activity import Activity, PRIORITY_NOT_SET
 from simpleflow.base import Submittable
+from simpleflow.compat import integer_types, perf_counter, string_types, urlquote
 from simpleflow.history import History
 from simpleflow.marker import Marker
 from simpleflow.signal import WaitForSignal
@@ -29,12 +34,14 @@ from simpleflow.swf import constants
 from simpleflow.swf.helpers import swf_identity
 from simpleflow.swf.task import ActivityTask, WorkflowTask, SignalTask, MarkerTask, SwfTask
 from simpleflow.utils import (
+    LRUCache,
     hex_hash,
     issubclass_,
     json_dumps,
     json_loads_or_raw,
     retry,
 )
+from simpleflow.utils.json_tools import compress_value, decompress_value
 from simpleflow.workflow import Workflow
 from swf.core import ConnectedSWFObject
 
@@ -120,6 +127,60 @@ def run_fake_task_worker(domain, task_list, former_event):
     worker_proc.start()
 
 
+# Argument types whose values can key TASK_ID_CACHE without serializing them.
+_TASK_ID_CACHEABLE_TYPES = (bool, float, type(None)) + integer_types + string_types
+
+# Decider-process cache of the arguments hash of idempotent tasks: the same
+# workflows are replayed over and over, no need to dump and hash the same
+# arguments each time.
+TASK_ID_CACHE = LRUCache(maxsize=10000)
+
+
+def _get_task_id_cache_key(args, kwargs):
+    """
+    Get a hashable key for *args* and *kwargs* if they only contain simple
+    values; the types are part of the key because e.g. 1, 1.0 and True are
+    equal but don't serialize the same way.
+
+    :type args: Sequence
+    :type kwargs: dict
+    :return: key or None if the arguments cannot be used as is.
+    :rtype: Optional[tuple]
+    """
+    key = []
+    for value in args:
+        if not isinstance(value, _TASK_ID_CACHEABLE_TYPES):
+            return None
+        key.append((type(value), value))
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        if not isinstance(value, _TASK_ID_CACHEABLE_TYPES):
+            return None
+        key.append((name, type(value), value))
+    return tuple(key)
+
+
+def _hash_arguments(args, kwargs):
+    """
+    md5 hex digest of the JSON-serialized arguments, memoized in TASK_ID_CACHE
+    when possible.
+
+    :type args: Sequence
+    :type kwargs: dict
+    :rtype: str
+    """
+    key = _get_task_id_cache_key(args, kwargs)
+    if key is not None:
+        digest = TASK_ID_CACHE.get(key)
+        if digest is not None:
+            return digest
+    arguments = json_dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
+    digest = hashlib.md5(arguments.encode('utf-8')).hexdigest()
+    if key is not None:
+        TASK_ID_CACHE.set(key, digest)
+    return digest
+
+
 class TaskRegistry(dict):
     """This registry tracks tasks and assign them an integer identifier.
 
@@ -189,6 +250,8 @@ class Executor(executor.Executor):
         self._open_activity_count = 0
         self._decisions = []
         self._append_timer = False  # Append an immediate timer decision
+        self._has_scheduled_markers = False  # Markers were recorded in this replay
+        self._has_inflight_tasks = False  # Something will wake the workflow up later
         self._tasks = TaskRegistry()
         self._idempotent_tasks_to_submit = set()
         self._execution = None
@@ -216,8 +279,7 @@ class Executor(executor.Executor):
             # If a_task is idempotent, we can do better and hash arguments.
             # It makes the workflow resistant to retries or variations on the
             # same task name (see #11).
-            arguments = json_dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
-            suffix = hashlib.md5(arguments.encode('utf-8')).hexdigest()
+            suffix = _hash_arguments(args, kwargs)
 
         if isinstance(a_task, (WorkflowTask,)):
             # Some task types must have globally unique names.
@@ -267,8 +329,7 @@ class Executor(executor.Executor):
         elif state == 'started':
             future.set_running()
         elif state == 'completed':
-            result = event['result']
-            future.set_finished(json_loads_or_raw(result))
+            future.set_finished(event['result'], decode=payload.loads_or_raw)
         elif state == 'canceled':
             future.set_cancelled()
         elif state == 'failed':
@@ -322,7 +383,7 @@ class Executor(executor.Executor):
         elif state == 'started':
             future.set_running()
         elif state == 'completed':
-            future.set_finished(json_loads_or_raw(event['result']))
+            future.set_finished(event['result'], decode=json_loads_or_raw)
         elif state == 'failed':
             future.set_exception(exceptions.TaskFailed(
                 name=event['id'],
@@ -504,6 +565,39 @@ class Executor(executor.Executor):
         MarkerTask: find_marker_event,
     }
 
+    # Maps (executor class, table name, task class) to the value resolved
+    # through the task MRO; filled lazily by _lookup_by_task_type().
+    _task_type_dispatch_cache = {}
+
+    @classmethod
+    def _lookup_by_task_type(cls, table_name, task_type):
+        """
+        Get the entry of a class-level dispatch table for a task class. The MRO
+        walk is only done once per class, so subclasses like
+        NonPythonicActivityTask resolve to their parent's entry without paying
+        for it on each submit.
+
+        :param table_name: name of the dispatch table, e.g. TASK_TYPE_TO_EVENT_FINDER
+        :type table_name: str
+        :param task_type:
+        :type task_type: type
+        :return: entry or None
+        :rtype: Optional[Callable]
+        """
+        key = (cls, table_name, task_type)
+        try:
+            return cls._task_type_dispatch_cache[key]
+        except KeyError:
+            pass
+        table = getattr(cls, table_name)
+        value = None
+        for typ in inspect.getmro(task_type):
+            value = table.get(typ)
+            if value:
+                break
+        cls._task_type_dispatch_cache[key] = value
+        return value
+
     def find_event(self, a_task, history):
         """
         Get the event corresponding to an activity or child workflow, if any
@@ -514,12 +608,11 @@ class Executor(executor.Executor):
         :return:
         :rtype: Optional[dict]
         """
-        for typ in inspect.getmro(type(a_task)):
-            finder = self.TASK_TYPE_TO_EVENT_FINDER.get(typ)
-            if finder:
-                return finder(self, a_task, history)
-        raise TypeError('invalid type {} for task {}'.format(
-            type(a_task), a_task))
+        finder = self._lookup_by_task_type('TASK_TYPE_TO_EVENT_FINDER', type(a_task))
+        if finder is None:
+            raise TypeError('invalid type {} for task {}'.format(
+                type(a_task), a_task))
+        return finder(self, a_task, history)
 
     def resume_activity(self, a_task, event):
         """
@@ -604,10 +697,15 @@ class Executor(executor.Executor):
         decisions = a_task.schedule(self.domain, task_list, priority=self.current_priority)
 
         # Ready to schedule
-        if isinstance(a_task, ActivityTask):
-            self._open_activity_count += 1
-        elif isinstance(a_task, MarkerTask):
-            self._append_timer = True  # markers don't generate decisions, so force a wake-up timer
+        if isinstance(a_task, MarkerTask):
+            # Markers don't generate decision tasks; they are sent along with the
+            # other decisions, and only get a wake-up timer if nothing else
+            # will wake the workflow up (see replay()).
+            self._has_scheduled_markers = True
+        else:
+            if isinstance(a_task, ActivityTask):
+                self._open_activity_count += 1
+            self._has_inflight_tasks = True
 
         # Check if we won't violate the 1MB limit on API requests ; if so, do NOT
         # schedule the requested task and block execution instead, with a timer
@@ -703,9 +801,11 @@ class Executor(executor.Executor):
             ttf = self.EVENT_TYPE_TO_FUTURE.get(event['type'])
             if ttf:
                 future = ttf(self, a_task, event)
-            if event['type'] == 'activity':
+            if event['type'] in ('activity', 'child_workflow'):
                 if future and future.state in (futures.PENDING, futures.RUNNING):
-                    self._open_activity_count += 1
+                    self._has_inflight_tasks = True
+                    if event['type'] == 'activity':
+                        self._open_activity_count += 1
 
         if not future:
             self.schedule_task(a_task, task_list=self.task_list)
@@ -745,6 +845,14 @@ class Executor(executor.Executor):
             return self._workflow.task_priority
         return None
 
+    GENERIC_TASK_TYPE_TO_SWF_TASK = {
+        base_task.ActivityTask: lambda self, a_task: ActivityTask.from_generic_task(a_task),
+        base_task.WorkflowTask: lambda self, a_task: WorkflowTask.from_generic_task(a_task),
+        base_task.SignalTask: lambda self, a_task: SignalTask.from_generic_task(
+            a_task, self._workflow_id, self._run_id, None, None),
+        base_task.MarkerTask: lambda self, a_task: MarkerTask.from_generic_task(a_task),
+    }
+
     def submit(self, func, *args, **kwargs):
         """Register a function and its arguments for asynchronous execution.
 
@@ -760,14 +868,9 @@ class Executor(executor.Executor):
 
         # casts simpleflow.task.*Task to their equivalent in simpleflow.swf.task
         if not isinstance(func, SwfTask):
-            if isinstance(func, base_task.ActivityTask):
-                func = ActivityTask.from_generic_task(func)
-            elif isinstance(func, base_task.WorkflowTask):
-                func = WorkflowTask.from_generic_task(func)
-            elif isinstance(func, base_task.SignalTask):
-                func = SignalTask.from_generic_task(func, self._workflow_id, self._run_id, None, None)
-            elif isinstance(func, base_task.MarkerTask):
-                func = MarkerTask.from_generic_task(func)
+            cast = self._lookup_by_task_type('GENERIC_TASK_TYPE_TO_SWF_TASK', type(func))
+            if cast:
+                func = cast(self, func)
 
         try:
             # do not use directly "Submittable" here because we want to catch if
@@ -818,6 +921,14 @@ class Executor(executor.Executor):
         """Replay the workflow from the start until it blocks.
         Called by the DeciderWorker.
 
+        Logs the time spent parsing the history and running the workflow.
+        The decisions are serialized again to log their size and
+        serialization time only when logging at DEBUG level or profiling a
+        slow decision; otherwise they show in the SWF usage of the decision
+        (``request_bytes`` of ``RespondDecisionTaskCompleted``). If
+        DECISION_PROFILE_DIRECTORY is set, decisions are profiled and those
+        slower than DECISION_PROFILE_THRESHOLD seconds dumped there.
+
         :param decision_response: an object wrapping the PollForDecisionTask response
         :type  decision_response: swf.responses.Response
         :param decref_workflow : Decref workflow once replay is done (to save memory)
@@ -826,6 +937,70 @@ class Executor(executor.Executor):
         :returns: a list of decision and a context dict (obsolete, empty)
         :rtype: ([swf.models.decision.base.Decision], dict)
         """
+        profiler = cProfile.Profile() if settings.DECISION_PROFILE_DIRECTORY else None
+        started = perf_counter()
+        self._replay_parsed_at = None
+        decisions_bytes = None
+        if profiler:
+            profiler.enable()
+        try:
+            decisions, context = self._replay(decision_response, decref_workflow)
+            ran_at = perf_counter()
+            slow = profiler and ran_at - started >= settings.DECISION_PROFILE_THRESHOLD
+            if slow or logger.isEnabledFor(logging.DEBUG):
+                # What responding to SWF does, to measure it
+                decisions_bytes = len(json_dumps(decisions))
+        finally:
+            if profiler:
+                profiler.disable()
+        finished = perf_counter()
+
+        execution = decision_response.execution
+        parsed_at = self._replay_parsed_at or started
+        total = finished - started
+        message = 'replay: workflow_id=%s run_id=%s history_events=%d decisions=%d parse=%.3f run=%.3f'
+        args = [
+            execution.workflow_id if execution else None,
+            execution.run_id if execution else None,
+            len(decision_response.history),
+            len(decisions),
+            parsed_at - started,
+            ran_at - parsed_at,
+        ]
+        if decisions_bytes is not None:
+            message += ' decisions_bytes=%d serialize=%.3f'
+            args += [decisions_bytes, finished - ran_at]
+        message += ' total=%.3f'
+        args.append(total)
+        logger.info(message, *args)
+        if slow:
+            self._dump_profile(profiler, decision_response)
+        return decisions, context
+
+    def _dump_profile(self, profiler, decision_response):
+        """
+        Write the profile of a decision to DECISION_PROFILE_DIRECTORY, named
+        after the workflow execution and the history length, which
+        identify the decision.
+        """
+        execution = decision_response.execution
+        if execution:
+            name = '{}.{}'.format(urlquote(execution.workflow_id, safe=''), execution.run_id)
+        else:
+            name = self._workflow_class.name
+        path = os.path.join(
+            settings.DECISION_PROFILE_DIRECTORY,
+            '{}.{}.prof'.format(name, len(decision_response.history)),
+        )
+        try:
+            if not os.path.isdir(settings.DECISION_PROFILE_DIRECTORY):
+                os.makedirs(settings.DECISION_PROFILE_DIRECTORY)
+            profiler.dump_stats(path)
+            logger.warning('slow decision, profile dumped to {}'.format(path))
+        except (IOError, OSError) as err:
+            logger.warning('cannot dump decision profile to {}: {}'.format(path, err))
+
+    def _replay(self, decision_response, decref_workflow):
         self.reset()
 
         history = decision_response.history
@@ -835,11 +1010,12 @@ class Executor(executor.Executor):
         self._execution = decision_response.execution
 
         workflow_started_event = history[0]
-        input = workflow_started_event.input
+        input = decompress_value(workflow_started_event.input)
         if input is None:
             input = {}
         args = input.get('args', ())
         kwargs = input.get('kwargs', {})
+        self._replay_parsed_at = perf_counter()
 
         self.before_replay()
         try:
@@ -853,7 +1029,7 @@ class Executor(executor.Executor):
             self.after_replay()
             if decref_workflow:
                 self.decref_workflow()
-            if self._append_timer:
+            if self._append_timer or self._markers_need_wake_up():
                 self._add_start_timer_decision('_simpleflow_wake_up_timer')
             return self._decisions, {}
         except exceptions.TaskException as err:
@@ -906,6 +1082,16 @@ class Executor(executor.Executor):
             self.decref_workflow()
         return [decision], {}
 
+    def _markers_need_wake_up(self):
+        """
+        Whether the workflow must be woken up after recording markers: the
+        replay blocked, and neither the other decisions nor the open tasks
+        will generate a new decision task.
+
+        :rtype: bool
+        """
+        return self._has_scheduled_markers and not self._has_inflight_tasks
+
     def decref_workflow(self):
         """
         Set the `_workflow` ivar to None in the hope of reducing memory consumption.
@@ -934,6 +1120,7 @@ class Executor(executor.Executor):
             pass
 
     def fail(self, reason, details=None):
+        self.before_close()
         self.on_failure(reason, details)
 
         decision = swf.models.decision.WorkflowExecutionDecision()
@@ -976,6 +1163,14 @@ class Executor(executor.Executor):
             parent_run_id=getattr(workflow_started_event, 'parent_workflow_execution', {}).get('runId'),
         )
 
+    @property
+    def history(self):
+        """
+        History of the execution being replayed.
+        :rtype: History
+        """
+        return self._history
+
     @property
     def _workflow_id(self):
         return self._execution_context.get('workflow_id')
@@ -1064,7 +1259,7 @@ class Executor(executor.Executor):
                 try:
                     self._execution.signal(
                         signal_name=name,
-                        input=input,
+                        input=compress_value(input),
                         workflow_id=workflow_id,
                         run_id=run_id,
                     )
@@ -1077,12 +1272,12 @@ class Executor(executor.Executor):
     def list_markers(self, all=False):
         if all:
             return [
-                Marker(m['name'], json_loads_or_raw(m['details']))
+                Marker(m['name'], json_loads_or_raw(m.get('details')), m['state'])
                 for ml in self._history.markers.values() for m in ml
             ]
         rc = []
         for ml in self._history.markers.values():
             m = ml[-1]
             if m['state'] == 'recorded':
-                rc.append(Marker(m['name'], json_loads_or_raw(m['details'])))
+                rc.append(Marker(m['name'], json_loads_or_raw(m['details']), m['state']))
         return rc
@@ -10,6 +10,7 @@ import swf.exceptions
 import swf.models
 import swf.querysets
 from future.utils import iteritems
+from simpleflow import payload
 from simpleflow.activity import Activity
 from simpleflow.utils import json_dumps
 
@@ -78,7 +79,7 @@ def show_workflow_status(domain_name, workflow_id, run_id=None, nb_tasks=None):
 def list_workflow_executions(domain_name, *args, **kwargs):
     domain = swf.models.Domain(domain_name)
     query = swf.querysets.WorkflowExecutionQuerySet(domain)
-    executions = query.all(*args, **kwargs)
+    executions = query.iter_all(*args, **kwargs)
 
     return pretty.list_executions(executions)
 
@@ -86,15 +87,53 @@ def list_workflow_executions(domain_name, *args, **kwargs):
 def filter_workflow_executions(domain_name, status, tag,
                                workflow_id, workflow_type_name,
                                workflow_type_version, *args, **kwargs):
+    """
+    :param tag: a tag, or a list of tags: SWF filters on a single tag, so the
+    tags are queried concurrently and the executions having any of them
+    listed once.
+    :type tag: str | list[str]
+    """
     domain = swf.models.Domain(domain_name)
     query = swf.querysets.WorkflowExecutionQuerySet(domain)
-    executions = query.filter(status, tag,
-                              workflow_id, workflow_type_name,
-                              workflow_type_version, *args, **kwargs)
+    if isinstance(tag, (list, tuple)) and len(tag) > 1:
+        threads = kwargs.pop('threads', 4)
+        executions = query.iter_filters([
+            dict(kwargs,
+                 status=status,
+                 tag=one_tag,
+                 workflow_id=workflow_id,
+                 workflow_type_name=workflow_type_name,
+                 workflow_type_version=workflow_type_version)
+            for one_tag in tag
+        ], threads=threads)
+        executions = unique_executions(executions)
+    else:
+        if isinstance(tag, (list, tuple)):
+            tag = tag[0] if tag else None
+        kwargs.pop('threads', None)
+        executions = query.iter_filter(status, tag,
+                                       workflow_id, workflow_type_name,
+                                       workflow_type_version, *args, **kwargs)
 
     return pretty.list_details(executions)
 
 
+def unique_executions(executions):
+    """
+    Skip the executions already seen, e.g. matching several filters.
+
+    :type executions: iterable[swf.models.WorkflowExecution]
+    :rtype: generator
+    """
+    seen = set()
+    for execution in executions:
+        key = (execution.workflow_id, execution.run_id)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield execution
+
+
 def find_activity(history, scheduled_id=None, activity_id=None, input=None):
     """
     Finds an activity in a given workflow execution and returns a callable,
@@ -122,10 +161,8 @@ def find_activity(history, scheduled_id=None, activity_id=None, input=None):
     if isinstance(func, Activity):
         func = func.callable
 
-    # get the input
-    input_ = input or found_activity["input"]
-    if input_ is None:
-        input_ = {}
+    # get the input, offloaded or compressed in the history
+    input_ = input or payload.resolve_input(found_activity["input"])
     args = input_.get('args', ())
     kwargs = input_.get('kwargs', {})
 
@@ -7,7 +7,9 @@ import swf.exceptions
 import swf.format
 import swf.models.decision
 
+from simpleflow import metrics
 from simpleflow.process import Supervisor, with_state
+from simpleflow.swf import client
 from simpleflow.swf.process import Poller
 
 
@@ -146,13 +148,16 @@ class DeciderPoller(Poller, swf.actors.Decider):
         """
         logger.info('taking decision for workflow {}'.format(
             self._workflow_name))
-        decisions = self.decide(decision_response)
-        try:
-            logger.info('completing decision for workflow {}'.format(
-                self._workflow_name))
-            self.complete_with_retry(decision_response.token, decisions)
-        except Exception as err:
-            logger.error('cannot complete decision: {}'.format(err))
+        with client.track() as usage:
+            decisions = self.decide(decision_response)
+            try:
+                logger.info('completing decision for workflow {}'.format(
+                    self._workflow_name))
+                self.complete_with_retry(decision_response.token, decisions)
+            except Exception as err:
+                logger.error('cannot complete decision: {}'.format(err))
+        logger.info('swf usage: workflow_id={} {}'.format(
+            decision_response.execution.workflow_id, usage))
 
     @with_state('deciding')
     def decide(self, decision_response):
@@ -167,7 +172,12 @@ class DeciderPoller(Poller, swf.actors.Decider):
         :rtype: list[swf.models.decision.base.Decision]
         """
         worker = DeciderWorker(self.domain, self._workflow_executors)
-        decisions = worker.decide(decision_response, self.task_list if self.is_standalone else None)
+        history = decision_response.history
+        workflow = history[0].workflow_type['name']
+        with metrics.registry.time('simpleflow_decision_seconds', workflow=workflow):
+            decisions = worker.decide(decision_response, self.task_list if self.is_standalone else None)
+        metrics.registry.observe('simpleflow_decision_history_events', len(history), workflow=workflow)
+        metrics.registry.observe('simpleflow_decisions_per_response', len(decisions), workflow=workflow)
         return decisions
 
 
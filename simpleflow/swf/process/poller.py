@@ -2,11 +2,13 @@ import abc
 import logging
 import os
 import signal
+import time
 
 import swf.actors
 import swf.exceptions
-from simpleflow import utils
+from simpleflow import metrics, utils
 from simpleflow.process import NamedMixin, with_state
+from simpleflow.swf import client
 from simpleflow.swf.helpers import swf_identity
 
 logger = logging.getLogger(__name__)
@@ -14,6 +16,17 @@ logger = logging.getLogger(__name__)
 __all__ = ['Poller']
 
 
+def _log_retry(operation):
+    """
+    Return a log_with function for utils.retry.with_delay() that also
+    counts the retries of operation.
+    """
+    def log(msg, *args):
+        metrics.registry.inc('simpleflow_retries_total', operation=operation)
+        logger.exception(msg, *args)
+    return log
+
+
 class Poller(swf.actors.Actor, NamedMixin):
     """Multi-processing implementation of a SWF actor.
 
@@ -22,6 +35,7 @@ class Poller(swf.actors.Actor, NamedMixin):
     def __init__(self, domain, task_list=None):
         self.is_alive = False
         self._named_mixin_properties = ["task_list"]
+        client.install()
 
         super(Poller, self).__init__(domain, task_list)
 
@@ -31,6 +45,21 @@ class Poller(swf.actors.Actor, NamedMixin):
             self.domain.name,
             self.task_list)
 
+    @property
+    def retry_budget(self):
+        """
+        Budget shared by the retries of the SWF calls of the process.
+        """
+        return client.get_retry_budget()
+
+    @property
+    def circuit_breaker(self):
+        """
+        Fails the SWF calls of the pollers of the process fast, during an
+        incident.
+        """
+        return client.get_circuit_breaker()
+
     @property
     def identity(self):
         """Identity when polling decision task.
@@ -73,11 +102,17 @@ class Poller(swf.actors.Actor, NamedMixin):
         self.is_alive = True
         self.set_process_name()
         while self.is_alive:
+            metrics.dump()
             try:
                 response = self.poll_with_retry()
             except swf.exceptions.PollTimeout:
                 continue
+            except utils.retry.CircuitOpenError as err:
+                logger.warning('not polling for %.1f seconds: %s', err.retry_after, err)
+                time.sleep(err.retry_after)
+                continue
             self.process(response)
+        metrics.dump(force=True)
 
     @with_state('stopping')
     def stop_gracefully(self):
@@ -101,11 +136,14 @@ class Poller(swf.actors.Actor, NamedMixin):
             complete = utils.retry.with_delay(
                 nb_times=self.nb_retries,
                 delay=utils.retry.exponential,
-                log_with=logger.exception,
+                log_with=_log_retry('complete'),
+                budget=self.retry_budget,
+                circuit_breaker=self.circuit_breaker,
                 except_on=swf.exceptions.DoesNotExistError,
             )(self.complete)  # Exponential backoff on errors.
             complete(token, response)
         except Exception as err:
+            metrics.registry.inc('simpleflow_errors_total', operation='complete')
             # This is embarrassing because the decider cannot notify SWF of the
             # task completion. As it will not try again, the task will
             # timeout (start_to_complete).
@@ -149,10 +187,17 @@ class Poller(swf.actors.Actor, NamedMixin):
         poll = utils.retry.with_delay(
             nb_times=self.nb_retries,
             delay=utils.retry.exponential,
-            log_with=logger.exception,
+            log_with=_log_retry('poll'),
+            budget=self.retry_budget,
+            circuit_breaker=self.circuit_breaker,
             on_exceptions=swf.exceptions.ResponseError,
         )(self.poll)
-        response = poll(task_list, identity=identity)
+        with metrics.registry.time('simpleflow_poll_seconds', task_list=task_list):
+            try:
+                response = poll(task_list, identity=identity)
+            except swf.exceptions.PollTimeout:
+                metrics.registry.inc('simpleflow_polls_empty_total', task_list=task_list)
+                raise
         return response
 
     @abc.abstractmethod
@@ -164,8 +209,14 @@ class Poller(swf.actors.Actor, NamedMixin):
         fail = utils.retry.with_delay(
             nb_times=self.nb_retries,
             delay=utils.retry.exponential,
-            log_with=logger.exception,
+            log_with=_log_retry('fail'),
+            budget=self.retry_budget,
+            circuit_breaker=self.circuit_breaker,
             on_exceptions=swf.exceptions.ResponseError,
         )(self.fail)
-        response = fail(*args, **kwargs)
+        try:
+            response = fail(*args, **kwargs)
+        except Exception:
+            metrics.registry.inc('simpleflow_errors_total', operation='fail')
+            raise
         return response
@@ -8,11 +8,15 @@ import psutil
 import swf.actors
 import swf.exceptions
 import swf.format
+from simpleflow import metrics, payload, result_cache
+from simpleflow.compat import perf_counter
 from simpleflow.process import Supervisor, with_state
+from simpleflow.swf import client
 from simpleflow.swf.process import Poller
 from simpleflow.swf.task import ActivityTask
 from simpleflow.swf.utils import sanitize_activity_context
 from simpleflow.utils import json_dumps, format_exc
+from simpleflow.utils.json_tools import compress
 
 from .dispatch import dynamic_dispatcher
 
@@ -134,18 +138,31 @@ class ActivityWorker(object):
         logger.debug('ActivityWorker.process() pid={}'.format(os.getpid()))
         try:
             activity = self.dispatch(task)
-            input = json.loads(task.input)
-            args = input.get('args', ())
-            kwargs = input.get('kwargs', {})
+            input = payload.resolve_input(json.loads(task.input))
+            args = input['args']
+            kwargs = input['kwargs']
             context = sanitize_activity_context(task.context)
-            result = ActivityTask(activity, *args, context=context, **kwargs).execute()
+            cache = result_cache.get_cache() if activity.idempotent else None
+            data = None
+            if cache:
+                cache_key = result_cache.get_key(
+                    task.activity_type.name, task.activity_type.version, args, kwargs)
+                data = cache.get(cache_key)
+            if data is None:
+                result = ActivityTask(activity, *args, context=context, **kwargs).execute()
+            else:
+                logger.info('result of {} found in cache'.format(task.activity_id))
         except Exception as err:
             logger.exception("process error: {}".format(str(err)))
             tb = traceback.format_exc()
             return poller.fail_with_retry(token, task, reason=format_exc(err), details=tb)
 
         try:
-            poller.complete_with_retry(token, json_dumps(result))
+            if data is None:
+                data = json_dumps(result)
+                if cache:
+                    cache.set(cache_key, data)
+            poller.complete_with_retry(token, payload.offload(compress(data)))
         except Exception as err:
             logger.exception("complete error")
             reason = 'cannot complete task {}: {}'.format(
@@ -167,7 +184,11 @@ def process_task(poller, token, task):
     """
     logger.debug('process_task() pid={}'.format(os.getpid()))
     worker = ActivityWorker()
-    worker.process(poller, token, task)
+    with client.track() as usage:
+        worker.process(poller, token, task)
+    logger.info('swf usage: activity_id={} {}'.format(task.activity_id, usage))
+    # Merged by the parent process, see spawn()
+    metrics.dump(force=True)
 
 
 def spawn(poller, token, task, heartbeat=60):
@@ -183,6 +204,16 @@ def spawn(poller, token, task, heartbeat=60):
     :type heartbeat: int
     """
     logger.debug('spawn() pid={} heartbeat={}'.format(os.getpid(), heartbeat))
+    activity_type = task.activity_type.name
+    started = perf_counter()
+
+    def record(outcome):
+        metrics.absorb(worker.pid)
+        metrics.registry.observe(
+            'simpleflow_activity_task_seconds', perf_counter() - started, activity_type=activity_type)
+        metrics.registry.inc(
+            'simpleflow_activity_tasks_total', activity_type=activity_type, outcome=outcome)
+
     worker = multiprocessing.Process(
         target=process_task,
         args=(poller, token, task),
@@ -204,6 +235,7 @@ def spawn(poller, token, task, heartbeat=60):
                         worker.pid
                     ))
             if worker.exitcode != 0:
+                record('died')
                 poller.fail_with_retry(
                     token,
                     task,
@@ -211,6 +243,8 @@ def spawn(poller, token, task, heartbeat=60):
                         worker.pid,
                         worker.exitcode)
                 )
+            else:
+                record('exited')
             return
         try:
             logger.debug(
@@ -221,9 +255,11 @@ def spawn(poller, token, task, heartbeat=60):
             # The subprocess is responsible for completing the task.
             # Either the task or the workflow execution no longer exists.
             logger.debug('heartbeat failed: {}'.format(error))
+            metrics.registry.inc('simpleflow_heartbeat_failures_total', activity_type=activity_type)
             # TODO: kill the worker at this point but make it configurable.
             return
         except Exception as error:
+            metrics.registry.inc('simpleflow_heartbeat_failures_total', activity_type=activity_type)
             # Let's crash if it cannot notify the heartbeat failed.  The
             # subprocess will become orphan and the heartbeat timeout may
             # eventually trigger on Amazon SWF side.
@@ -235,4 +271,5 @@ def spawn(poller, token, task, heartbeat=60):
         if response and response.get('cancelRequested'):
             # Task cancelled.
             worker.terminate()  # SIGTERM
+            record('cancelled')
             return
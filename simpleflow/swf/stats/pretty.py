@@ -1,7 +1,7 @@
 import operator
 from datetime import datetime
 from functools import partial, wraps
-from itertools import chain
+from itertools import chain, islice
 
 from future.utils import iteritems
 
@@ -207,6 +207,38 @@ def formatted(with_info=False, with_header=False, fmt=DEFAULT_FORMAT):
     return formatter
 
 
+def formatted_blocks(with_header=False, fmt=DEFAULT_FORMAT, block_size=100):
+    """
+    Like :py:func:`formatted`, but the decorated function returns a
+    generator of formatted blocks of *block_size* rows, so that the first
+    rows can be printed before the last ones are fetched. Tabular columns
+    are aligned per block. JSON and human formats are not split.
+    """
+    def formatter(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            header, rows = func(*args, **kwargs)
+            headers = header if (with_header or fmt == human) else []
+            if fmt in (jsonify, human):
+                yield fmt(list(rows), headers=headers)
+                return
+            rows = iter(rows)
+            while True:
+                block = list(islice(rows, block_size))
+                if not block:
+                    break
+                yield fmt(block, headers=headers)
+                headers = []
+
+        wrapped.__wrapped__ = wrapped
+        return wrapped
+
+    if isinstance(fmt, compat.basestring):
+        fmt = FORMATS[fmt]
+
+    return formatter
+
+
 def list_executions(workflow_executions):
     header = 'Workflow ID', 'Workflow Type', 'Status'
     rows = ((
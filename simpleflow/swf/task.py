@@ -3,8 +3,9 @@ import logging
 import swf.models
 import swf.models.decision
 
-from simpleflow import task
+from simpleflow import payload, task
 from simpleflow.utils import json_dumps
+from simpleflow.utils.json_tools import compress_value
 
 logger = logging.getLogger(__name__)
 
@@ -92,7 +93,7 @@ class ActivityTask(task.ActivityTask, SwfTask):
             'args': self.args,
             'kwargs': self.kwargs,
         }
-        return input
+        return payload.offload_value(compress_value(input))
 
 
 class NonPythonicActivityTask(ActivityTask):
@@ -150,10 +151,10 @@ class WorkflowTask(task.WorkflowTask, SwfTask):
             version=workflow.version,
         )
 
-        input = {
+        input = compress_value({
             'args': self.args,
             'kwargs': self.kwargs,
-        }
+        })
 
         get_tag_list = getattr(workflow, 'get_tag_list', None)
         if get_tag_list:
@@ -1,7 +1,6 @@
 from __future__ import absolute_import
 
 import abc
-from copy import deepcopy
 
 from simpleflow.base import Submittable
 from . import futures
@@ -51,8 +50,12 @@ class ActivityTask(Task):
         # Keep original arguments for use in subclasses
         # For instance this helps casting a generic class to a simpleflow.swf.task,
         # see simpleflow.swf.task.ActivityTask.from_generic_task() factory
-        self._args = deepcopy(args)
-        self._kwargs = deepcopy(kwargs)
+        # NB: we keep references, not copies: *args is an immutable tuple and
+        # the kwargs dict is ours, only the "context" key is popped below.
+        # Deep copying them used to be a major part of the replay time with
+        # large arguments.
+        self._args = args
+        self._kwargs = dict(kwargs)
 
         self.activity = activity
         self.idempotent = activity.idempotent
@@ -78,7 +81,13 @@ class ActivityTask(Task):
         if hasattr(method, 'execute'):
             task = method(*self.args, **self.kwargs)
             task.context = self.context
-            return task.execute()
+            try:
+                return task.execute()
+            finally:
+                # Optional hook, e.g. to flush buffered metrology
+                after_execute = getattr(task, 'after_execute', None)
+                if after_execute:
+                    after_execute()
         else:
             # NB: the following line attaches some *state* to the callable, so it
             # can be used directly for advanced usage. This works well because we
@@ -99,8 +108,9 @@ class WorkflowTask(Task):
         # Keep original arguments for use in subclasses
         # For instance this helps casting a generic class to a simpleflow.swf.task,
         # see simpleflow.swf.task.WorkflowTask.from_generic_task() factory
-        self._args = deepcopy(args)
-        self._kwargs = deepcopy(kwargs)
+        # NB: references, not copies, see ActivityTask.__init__().
+        self._args = args
+        self._kwargs = kwargs
 
         self.executor = executor
         self.workflow = workflow
@@ -2,6 +2,7 @@ from zlib import adler32
 
 from . import retry  # NOQA
 from .json_tools import json_dumps, json_loads_or_raw  # NOQA
+from .lru import LRUCache  # NOQA
 
 
 def issubclass_(arg1, arg2):
@@ -0,0 +1,84 @@
+import contextlib
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """
+    Lock between processes, on a lock file next to path: exclusive, or
+    shared with the other shared locks. Without blocking, yield False
+    instead of waiting for the lock, True otherwise.
+
+    The holder of an exclusive lock may remove the lock file (e.g. with
+    path itself); waiters then lock the new lock file.
+    """
+    if fcntl is None:
+        yield True
+        return
+    lock_path = path + '.lock'
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    while True:
+        f = open(lock_path, 'a')
+        try:
+            fcntl.flock(f, operation)
+        except (IOError, OSError):
+            f.close()
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(lock_path).st_ino:
+                break
+        except OSError:  # removed
+            pass
+        f.close()
+    try:
+        yield True
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+@contextlib.contextmanager
+def atomic_file(path):
+    """
+    Yield a file object open for writing in binary mode; its content is
+    renamed to path once the block succeeds, so that readers never see a
+    partial file.
+
+    :type path: str
+    """
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:  # created meanwhile
+            pass
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.rename(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_file_atomically(path, data):
+    """
+    Write data to path, see :py:func:`atomic_file`.
+
+    :type path: str
+    :type data: bytes
+    """
+    with atomic_file(path) as f:
+        f.write(data)
@@ -1,9 +1,18 @@
 from uuid import UUID
 
+import base64
 import datetime
 import json
 import types
+import zlib
 
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+from simpleflow import settings
+from simpleflow.compat import string_types
 from simpleflow.futures import Future
 
 
@@ -28,14 +37,166 @@ def _serialize_complex_object(obj):
         return obj.result
     elif isinstance(obj, UUID):
         return str(obj)
+    elif hasattr(obj, '__json__'):
+        # e.g. simpleflow.canvas.Broadcast
+        return obj.__json__()
     raise TypeError(
         "Type %s couldn't be serialized. This is a bug in simpleflow,"
         " please file a new issue on GitHub!" % type(obj))
 
 
+def _get_orjson_backend():
+    import orjson
+    # Let _serialize_complex_object format dates and times
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj, default=_serialize_complex_object):
+        return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+
+    return dumps, orjson.loads
+
+
+def _get_ujson_backend():
+    import ujson
+
+    def dumps(obj, default=_serialize_complex_object):
+        return ujson.dumps(obj, default=default, escape_forward_slashes=False)
+
+    return dumps, ujson.loads
+
+
+def _get_rapidjson_backend():
+    import rapidjson
+
+    def dumps(obj, default=_serialize_complex_object):
+        data = rapidjson.dumps(obj, default=default, ensure_ascii=False)
+        # rapidjson escapes non-ASCII characters in uppercase: let the
+        # standard library do it
+        data.encode('ascii')
+        return data
+
+    return dumps, rapidjson.loads
+
+
+def _get_json_backend():
+    return None, None
+
+
+JSON_BACKENDS = (
+    ('orjson', _get_orjson_backend),
+    ('ujson', _get_ujson_backend),
+    ('rapidjson', _get_rapidjson_backend),
+    ('json', _get_json_backend),
+)
+
+json_backend = None
+_backend_dumps = None
+_backend_loads = None
+
+# Values a backend must dump like the standard library does (or refuse to
+# dump), since serialized values are hashed, e.g. in payload keys.
+_STDLIB_PROBES = (
+    float('nan'),
+    float('inf'),
+    float('-inf'),
+    1e16,
+    1e-7,
+    0.1 + 0.2,
+    -0.0,
+    2 ** 64,
+    u'\xe9t\xe9 \u2603 \U0001f600',
+    u'a/b"\\\n\x00',
+)
+
+
+def _dumps_like_stdlib(dumps):
+    """
+    Tell if a backend dumps the probe values like the standard library,
+    or raises on them (json_dumps then falls back to the standard library).
+    It must at least dump basic values: ujson < 5 doesn't even take the
+    default argument.
+    """
+    value = {'b': [None, True, False, 1, 2.5], 'a': {}}
+    try:
+        if dumps(value) != json.dumps(value, separators=(',', ':')):
+            return False
+    except Exception:
+        return False
+    for value in _STDLIB_PROBES:
+        try:
+            data = dumps(value)
+        except Exception:
+            continue
+        if data != json.dumps(value, separators=(',', ':')):
+            return False
+    return True
+
+
+class _DefaultHook(object):
+    """
+    default argument of a json_dumps call: serializes each complex object
+    once, so that the fallback on the standard library doesn't run the
+    hooks again (e.g. consuming a generator twice), and keeps the error
+    raised by a hook, that must not be mistaken for an unsupported value.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self.error = None
+
+    def __call__(self, obj):
+        key = id(obj)
+        if key not in self._results:
+            try:
+                result = _serialize_complex_object(obj)
+            except Exception as err:
+                self.error = err
+                raise
+            # obj is kept alive for its id to stay unique
+            self._results[key] = (obj, result)
+        return self._results[key][1]
+
+
+# Errors of the backends on unsupported values (orjson.JSONEncodeError is a
+# TypeError), e.g. big integers, or NaN for rapidjson
+_BACKEND_ERRORS = (TypeError, OverflowError, ValueError)
+
+
+def set_json_backend(name=None):
+    """
+    Select the library used by json_dumps and json_loads_or_raw: "orjson",
+    "ujson", "rapidjson" or "json" (standard library). By default, use the
+    first one installed.
+    json_dumps only uses it if it dumps like the standard library (e.g.
+    not orjson, that dumps NaN as null and 1e16 as "1e16"); otherwise only
+    json_loads_or_raw does.
+    :param name:
+    :type name: Optional[str]
+    :return: name of the backend
+    :rtype: str
+    """
+    global json_backend, _backend_dumps, _backend_loads
+    for backend_name, get_backend in JSON_BACKENDS:
+        if name and backend_name != name:
+            continue
+        try:
+            _backend_dumps, _backend_loads = get_backend()
+        except ImportError:
+            if name:
+                raise
+            continue
+        if _backend_dumps is not None and not _dumps_like_stdlib(_backend_dumps):
+            _backend_dumps = None
+        json_backend = backend_name
+        return json_backend
+    raise ValueError('unknown JSON backend: {}'.format(name))
+
+
 def json_dumps(obj, pretty=False, compact=True, **kwargs):
     """
     JSON dump to string.
+    Compact dumps without extra arguments go through the selected backend
+    if it dumps like the standard library, see :py:func:`set_json_backend`.
     :param obj:
     :type obj: Any
     :param pretty:
@@ -45,8 +206,19 @@ def json_dumps(obj, pretty=False, compact=True, **kwargs):
     :return:
     :rtype: str
     """
+    default = None
+    if _backend_dumps is not None and compact and not pretty and not kwargs:
+        default = _DefaultHook()
+        try:
+            return _backend_dumps(obj, default)
+        except _BACKEND_ERRORS:
+            # Raised by a hook (e.g. a TypeError), possibly wrapped by the
+            # backend: propagate it. Otherwise unsupported by the backend:
+            # let the standard library handle it.
+            if default.error is not None:
+                raise default.error
     if "default" not in kwargs:
-        kwargs["default"] = _serialize_complex_object
+        kwargs["default"] = default or _serialize_complex_object
     if pretty:
         kwargs["indent"] = 4
         kwargs["sort_keys"] = True
@@ -65,7 +237,100 @@ def json_loads_or_raw(data):
     """
     if not data:
         return None
+    data = decompress(data)
+    if _backend_loads is not None:
+        try:
+            return _backend_loads(data)
+        except ValueError:
+            pass  # maybe accepted by the standard library, e.g. NaN
     try:
         return json.loads(data)
     except ValueError:
         return data
+
+
+set_json_backend(settings.JSON_BACKEND)
+
+
+# Compressed strings are base64-encoded and start with the prefix of their
+# codec; readers detect them by this prefix, so plain JSON is still read.
+COMPRESSION_CODECS = {
+    'zlib': ('!z:', zlib.compress, zlib.decompress),
+}
+if lzma is not None:
+    COMPRESSION_CODECS['lzma'] = ('!x:', lzma.compress, lzma.decompress)
+
+_DECOMPRESSORS = {prefix: decompress for prefix, _, decompress in COMPRESSION_CODECS.values()}
+
+# Raised on strings that only look compressed; ValueError covers base64
+# (binascii.Error) and UTF-8 errors.
+_DECOMPRESSION_ERRORS = (ValueError, zlib.error) + ((lzma.LZMAError,) if lzma is not None else ())
+
+
+def compress(data, codec=None):
+    """
+    Compress a string with codec (default: COMPRESSION_CODEC setting).
+    Strings shorter than the COMPRESSION_THRESHOLD setting are returned
+    unchanged, as well as all strings when there is no codec.
+    :param data:
+    :type data: str
+    :param codec: "zlib" or "lzma"
+    :type codec: Optional[str]
+    :return: compressed string
+    :rtype: str
+    """
+    codec = codec or settings.COMPRESSION_CODEC
+    if not codec or not data or len(data) < settings.COMPRESSION_THRESHOLD:
+        return data
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError('unknown compression codec: {}'.format(codec))
+    prefix, compress_func, _ = COMPRESSION_CODECS[codec]
+    compressed = base64.b64encode(compress_func(data.encode('utf-8'))).decode('ascii')
+    return prefix + compressed
+
+
+def decompress(data):
+    """
+    Decompress a string returned by :py:func:`compress`; other strings,
+    including raw strings merely starting with a codec prefix, are
+    returned unchanged.
+    :param data:
+    :type data: str
+    :return: decompressed string
+    :rtype: str
+    """
+    if not isinstance(data, string_types) or data[:1] != '!':
+        return data
+    decompress_func = _DECOMPRESSORS.get(data[:3])
+    if decompress_func is None:
+        return data
+    try:
+        return decompress_func(base64.b64decode(data[3:])).decode('utf-8')
+    except _DECOMPRESSION_ERRORS:
+        return data
+
+
+def compress_value(value):
+    """
+    Return value, or its compressed JSON serialization if compression is
+    enabled and worth it. The result can be embedded in a JSON document.
+    :param value:
+    :type value: Any
+    :rtype: Any
+    """
+    if not settings.COMPRESSION_CODEC:
+        return value
+    data = json_dumps(value)
+    compressed = compress(data)
+    return value if compressed is data else compressed
+
+
+def decompress_value(value):
+    """
+    Reverse of :py:func:`compress_value`.
+    :param value:
+    :type value: Any
+    :rtype: Any
+    """
+    data = decompress(value)
+    return value if data is value else json.loads(data)
@@ -0,0 +1,66 @@
+import collections
+
+
+class LRUCache(object):
+    """
+    Small bounded mapping evicting the least recently used entries.
+
+    It is meant for process-local caches (e.g. in a decider that replays the
+    same workflows over and over), not for sharing data between processes.
+
+    :ivar maxsize: max number of entries, or None for unbounded
+    :type maxsize: Optional[int]
+    :ivar max_weight: max total weight of the entries, or None for unbounded
+    :type max_weight: Optional[int]
+    """
+
+    def __init__(self, maxsize=1024, max_weight=None, weigh=len):
+        """
+        :param weigh: weight of a value, e.g. its size, if max_weight is set
+        :type weigh: callable
+        """
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = collections.OrderedDict()
+        self._weights = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def set(self, key, value):
+        self.pop(key)
+        if self.max_weight is not None:
+            weight = self.weigh(value)
+            if weight > self.max_weight:
+                # Would evict everything else, then itself
+                return
+            self._weights[key] = weight
+            self.weight += weight
+        self._data[key] = value
+        while (
+            (self.maxsize is not None and len(self._data) > self.maxsize) or
+            (self.max_weight is not None and self.weight > self.max_weight)
+        ):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        self.weight -= self._weights.pop(key, 0)
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+        self._weights.clear()
+        self.weight = 0
@@ -0,0 +1,115 @@
+"""
+Rendering of metrics in the Prometheus text exposition format, e.g. for the
+node exporter textfile collector.
+"""
+import bisect
+
+from .files import write_file_atomically
+
+INF = float('inf')
+
+# Durations, in seconds
+DEFAULT_BUCKETS = (
+    0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 4 * 3600, INF,
+)
+
+
+class Histogram(object):
+    """
+    Cumulative histogram: counts[i] is the number of observations in
+    ]buckets[i - 1], buckets[i]], the last bucket being +Inf.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, counts=None, sum=0.0):
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != INF:
+            self.buckets += (INF,)
+        self.counts = list(counts) if counts else [0] * len(self.buckets)
+        self.sum = sum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        """
+        Add the observations of another histogram with the same buckets.
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum}
+
+    @classmethod
+    def from_dict(cls, data, buckets=DEFAULT_BUCKETS):
+        return cls(buckets, counts=data['counts'], sum=data['sum'])
+
+
+def format_value(value):
+    if value == INF:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(labels):
+    """
+    :param labels: (name, value) pairs
+    :type labels: iterable[(str, str)]
+    :rtype: str
+    """
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ))
+
+
+def format_metric(name, kind, description, samples):
+    """
+    Return the lines of a metric.
+
+    :param name: metric name
+    :type name: str
+    :param kind: "counter", "gauge" or "histogram"
+    :type kind: str
+    :param description: HELP text
+    :type description: str
+    :param samples: (labels, value) pairs, where labels is a tuple of
+    (name, value) pairs and value a number or a Histogram
+    :type samples: iterable
+    :rtype: list[str]
+    """
+    lines = [
+        '# HELP {} {}'.format(name, description),
+        '# TYPE {} {}'.format(name, kind),
+    ]
+    for labels, value in sorted(samples, key=lambda sample: sample[0]):
+        labels = tuple(labels)
+        if kind != 'histogram':
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+            continue
+        cumulative = 0
+        for bucket, count in zip(value.buckets, value.counts):
+            cumulative += count
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels + (('le', format_value(bucket)),)), cumulative))
+        lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(value.sum)))
+        lines.append('{}_count{} {}'.format(name, format_labels(labels), cumulative))
+    return lines
+
+
+def write_textfile(path, lines):
+    """
+    Write metrics for the node exporter textfile collector, which must
+    never read a partial file.
+    """
+    write_file_atomically(path, ('\n'.join(lines) + '\n').encode('utf-8'))
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from simpleflow.compat import perf_counter
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket whose rate adapts AIMD-style: it is multiplied
+    by *decrease* when the caller reports a throttling, and grows back by
+    *increase* tokens per second every second, up to *max_rate*.
+
+    :ivar rate: current rate, in tokens per second
+    :type rate: float
+    """
+
+    def __init__(self, max_rate, burst=None, min_rate=None, decrease=0.5, increase=1.0):
+        """
+        :param max_rate: tokens per second
+        :type max_rate: float
+        :param burst: capacity of the bucket; defaults to max_rate (and at least 1)
+        :type burst: float
+        :param min_rate: floor of the rate; defaults to max_rate / 100
+        :type min_rate: float
+        :param decrease: factor applied to the rate on throttling
+        :type decrease: float
+        :param increase: rate increase per second
+        :type increase: float
+        """
+        self.max_rate = float(max_rate)
+        self.burst = float(burst) if burst else max(self.max_rate, 1.0)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 100
+        self.decrease = decrease
+        self.increase = increase
+        self.rate = self.max_rate
+        self.tokens = self.burst
+        self._updated_at = perf_counter()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed <= 0:
+            return
+        # Linear recovery of the rate; tokens accumulate at the mean rate
+        new_rate = min(self.max_rate, self.rate + self.increase * elapsed)
+        self.tokens = min(self.burst, self.tokens + elapsed * (self.rate + new_rate) / 2)
+        self.rate = new_rate
+        self._updated_at = now
+
+    def reserve(self):
+        """
+        Take a token, possibly in advance.
+
+        :returns: seconds to wait before using it
+        :rtype: float
+        """
+        with self._lock:
+            now = perf_counter()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """
+        Wait for a token.
+
+        :returns: seconds waited
+        :rtype: float
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def throttled(self):
+        """
+        Report a throttling: decrease the rate multiplicatively.
+        """
+        with self._lock:
+            self._refill(perf_counter())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
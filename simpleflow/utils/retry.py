@@ -2,6 +2,8 @@ import time
 import collections
 import functools
 import logging
+import random
+import threading
 
 
 def _to_tuple(exceptions):
@@ -21,17 +23,162 @@ def constant(value):
 
 
 def exponential(value):
-    import random
-
     return random.random() * (2 ** value)
 
 
+def decorrelated_jitter(base=1, cap=60):
+    """
+    Return a delay function for :py:func:`with_delay` where each delay is
+    drawn between *base* and three times the previous one, capped. Unlike
+    :py:func:`exponential`, concurrent clients quickly spread their retries.
+
+    The previous delay is kept by the returned function: use a function per
+    retry loop.
+
+    :param base: minimum delay, in seconds
+    :type base: float
+    :param cap: maximum delay, in seconds
+    :type cap: float
+    :rtype: callable(value: int) -> float
+    """
+    state = {'delay': base}
+
+    def call(value):
+        if value == 0:
+            state['delay'] = base
+        state['delay'] = min(cap, random.uniform(base, state['delay'] * 3))
+        return state['delay']
+
+    return call
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a function whose circuit breaker is open.
+
+    :ivar retry_after: seconds before the circuit lets a trial call through
+    :type retry_after: float
+    """
+
+    def __init__(self, message, retry_after=0):
+        super(CircuitOpenError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryBudget(object):
+    """
+    Bound the retries of a process to a ratio of its calls over a sliding
+    *window*, plus *min_retries* per window so that processes making few
+    calls can still retry. One budget is shared by several retry loops.
+    """
+
+    def __init__(self, ratio=0.2, window=60, min_retries=10):
+        """
+        :param ratio: retries allowed per call
+        :type ratio: float
+        :param window: in seconds
+        :type window: float
+        :param min_retries: retries always allowed per window
+        :type min_retries: int
+        """
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._calls = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for events in (self._calls, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_call(self):
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            self._calls.append(now)
+
+    def can_retry(self):
+        """
+        Take a retry from the budget, if any left.
+
+        :rtype: bool
+        """
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker(object):
+    """
+    Fail fast after *failure_threshold* consecutive failures: the circuit
+    opens and calls raise :py:class:`CircuitOpenError` for *reset_timeout*
+    seconds. Then a single trial call is let through (half-open): it closes
+    the circuit if it succeeds, else the circuit opens again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._trial or time.time() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        """
+        :raises: CircuitOpenError if the call must not be made.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.time() - self._opened_at)
+            if self._trial or remaining > 0:
+                raise CircuitOpenError(
+                    'circuit open after {} failures'.format(self.failures),
+                    retry_after=self.reset_timeout if self._trial else remaining,
+                )
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial = False
+
+
 def with_delay(
         nb_times=1,
         delay=constant(1),
         on_exceptions=Exception,
         except_on=None,
-        log_with=None):
+        log_with=None,
+        max_elapsed=None,
+        budget=None,
+        circuit_breaker=None):
     """
     Retry the *decorated* function *nb_times* with a *delay*.
 
@@ -48,6 +195,18 @@ def with_delay(
     :type  except_on: Sequence([Exception])
 
     :param log_with: logger instance to use.
+
+    :param max_elapsed: don't retry if the next attempt would start more
+    than *max_elapsed* seconds after the first one.
+    :type  max_elapsed: float
+
+    :param budget: don't retry when the budget is exhausted.
+    :type  budget: RetryBudget
+
+    :param circuit_breaker: raise CircuitOpenError instead of calling the
+    function while the circuit is open. Only the *on_exceptions* errors
+    count as failures; other ones are answers of the service.
+    :type  circuit_breaker: CircuitBreaker
     """
     if log_with is None:
         log_with = logging.getLogger(__name__).info
@@ -58,13 +217,28 @@ def with_delay(
         @functools.wraps(func)
         def decorated(*args, **kwargs):
             nb_retries = 0
+            started = time.time()
+            if budget is not None:
+                budget.record_call()
             while True:
+                if circuit_breaker is not None:
+                    circuit_breaker.before_call()
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except except_on:
+                    if circuit_breaker is not None:
+                        circuit_breaker.record_success()
                     raise
                 except on_exceptions as error:
+                    if circuit_breaker is not None:
+                        circuit_breaker.record_failure()
                     wait_delay = delay(nb_retries)
+                    if nb_times - nb_retries > 1:
+                        # Another attempt would follow
+                        if max_elapsed is not None and time.time() - started + wait_delay > max_elapsed:
+                            raise
+                        if budget is not None and not budget.can_retry():
+                            raise
                     log_with(
                         'error "%r": retrying in %.2f seconds',
                         error,
@@ -74,6 +248,14 @@ def with_delay(
                     nb_retries += 1
                     if nb_times - nb_retries <= 0:
                         raise
+                except Exception:
+                    if circuit_breaker is not None:
+                        circuit_breaker.record_success()
+                    raise
+                else:
+                    if circuit_breaker is not None:
+                        circuit_breaker.record_success()
+                    return result
         return decorated
 
     on_exceptions = _to_tuple(on_exceptions)
@@ -5,6 +5,7 @@
 #
 # See the file LICENSE for copying permission.
 import os
+import threading
 
 from boto.exception import NoAuthHandlerFound
 import boto.swf
@@ -13,6 +14,7 @@ import boto.swf
 # config hosted in simpleflow. This wouldn't be the case with a standard
 # "logging.getLogger(__name__)" which would write logs under the "swf" namespace
 from simpleflow import logger
+from simpleflow.swf import client
 from simpleflow.utils import retry
 
 from . import settings
@@ -21,6 +23,11 @@ from . import settings
 SETTINGS = settings.get()
 RETRIES = int(os.environ.get('SWF_CONNECTION_RETRIES', '5'))
 
+# Connections opened by the threads other than the one of the object,
+# e.g. the threads of the concurrent queries: boto connections aren't
+# thread-safe.
+_local = threading.local()
+
 
 class ConnectedSWFObject(object):
     """Authenticated object interface
@@ -29,19 +36,25 @@ class ConnectedSWFObject(object):
 
     :ivar region: name of the AWS region
     :type region: str
-    :ivar connection: connection to the SWF endpoint
+    :ivar connection: connection to the SWF endpoint, specific to the
+                      current thread
     :type connection: boto.swf.layer1.Layer1
 
     """
     __slots__ = [
         'region',
-        'connection'
+        '_connection',
+        '_thread',
     ]
 
-    @retry.with_delay(nb_times=RETRIES,
-                      delay=retry.exponential,
-                      on_exceptions=(TypeError, NoAuthHandlerFound))
     def __init__(self, *args, **kwargs):
+        # The retries count in the retry budget of the SWF calls
+        retry.with_delay(nb_times=RETRIES,
+                         delay=retry.exponential,
+                         on_exceptions=(TypeError, NoAuthHandlerFound),
+                         budget=client.get_retry_budget())(self._connect)(*args, **kwargs)
+
+    def _connect(self, *args, **kwargs):
         settings_ = {key: SETTINGS.get(key, kwargs.get(key)) for key in
                      ('aws_access_key_id',
                       'aws_secret_access_key')}
@@ -56,3 +69,27 @@ class ConnectedSWFObject(object):
             raise ValueError('invalid region: {}'.format(self.region))
 
         logger.debug("initiated connection to region={}".format(self.region))
+
+    @property
+    def connection(self):
+        connection = self._connection
+        if (self._thread is threading.current_thread() or
+                not isinstance(connection, boto.swf.layer1.Layer1)):
+            return connection
+
+        key = (self.region, connection.aws_access_key_id)
+        connections = _local.__dict__.setdefault('connections', {})
+        if key not in connections:
+            connections[key] = boto.swf.connect_to_region(
+                self.region,
+                aws_access_key_id=connection.aws_access_key_id,
+                aws_secret_access_key=connection.aws_secret_access_key,
+                session_token=connection.provider.security_token,
+            )
+            logger.debug("initiated thread connection to region={}".format(self.region))
+        return connections[key]
+
+    @connection.setter
+    def connection(self, connection):
+        self._connection = connection
+        self._thread = threading.current_thread()
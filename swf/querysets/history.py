@@ -1,5 +1,6 @@
 from swf.models import History
 from swf.querysets.base import BaseQuerySet
+from swf.utils import iter_pages
 
 
 class HistoryQuerySet(BaseQuerySet):
@@ -30,30 +31,38 @@ class HistoryQuerySet(BaseQuerySet):
         :param  reverse: Should the history events be retrieved in reverse order.
         :type   reverse: bool
         """
+        return History.from_event_list(list(self.iter_events(
+            run_id, workflow_id, max_results, page_size, reverse)))
+
+    def iter_events(self, run_id, workflow_id, max_results=None, page_size=100, reverse=False):
+        """Yields the events of a WorkflowExecution history, page by page:
+        the next page is requested while the current one is consumed
+
+        See :meth:`get` for the parameters.
+
+        :rtype: generator
+        """
         max_results = max_results or page_size
 
         if max_results < page_size:
             page_size = max_results
 
-        response = self.connection.get_workflow_execution_history(
-            self.domain.name,
-            run_id,
-            workflow_id,
-            maximum_page_size=page_size,
-            reverse_order=reverse)
-        events = response['events']
-
-        next_page = response.get('nextPageToken')
-        while next_page is not None and len(events) < max_results:
-            response = self.connection.get_workflow_execution_history(
+        counts = {'events': 0}
+
+        def fetch(next_page_token):
+            return self.connection.get_workflow_execution_history(
                 self.domain.name,
                 run_id,
                 workflow_id,
                 maximum_page_size=page_size,
-                next_page_token=next_page,
+                next_page_token=next_page_token,
                 reverse_order=reverse
             )
-            events.extend(response['events'])
-            next_page = response.get('nextPageToken')
 
-        return History.from_event_list(events)
+        def more(response):
+            counts['events'] += len(response['events'])
+            return counts['events'] < max_results
+
+        for response in iter_pages(fetch, more):
+            for event in response['events']:
+                yield event
@@ -12,7 +12,7 @@ from swf.querysets.base import BaseQuerySet
 from swf.models import Domain
 from swf.models.workflow import (WorkflowType, WorkflowExecution,
                                  CHILD_POLICIES)
-from swf.utils import datetime_timestamp, past_day, get_subkey
+from swf.utils import chain_concurrently, datetime_timestamp, iter_pages, past_day, get_subkey
 from swf.exceptions import (ResponseError, DoesNotExistError,
                             InvalidKeywordArgumentError, AlreadyExistsError)
 
@@ -59,14 +59,10 @@ class BaseWorkflowQuerySet(BaseQuerySet):
         raise NotImplementedError
 
     def _list_items(self, *args, **kwargs):
-        response = {'nextPageToken': None}
-        while 'nextPageToken' in response:
-            response = self._list(
-                *args,
-                next_page_token=response['nextPageToken'],
-                **kwargs
-            )
+        def fetch(next_page_token):
+            return self._list(*args, next_page_token=next_page_token, **kwargs)
 
+        for response in iter_pages(fetch):
             for item in response[self._infos_plural]:
                 yield item
 
@@ -422,6 +418,8 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
         # `oldest_date` mandatory arg.
         if status == WorkflowExecution.STATUS_OPEN:
             kwargs['oldest_date'] = kwargs.pop('start_oldest_date')
+            if 'start_latest_date' in kwargs:
+                kwargs['latest_date'] = kwargs.pop('start_latest_date')
 
         try:
             method = 'list_{}_workflow_executions'.format(statuses[status])
@@ -493,6 +491,23 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
                workflow_id=None, workflow_type_name=None,
                workflow_type_version=None,
                *args, **kwargs):
+        """Filters workflow executions, see :meth:`iter_filter`
+
+        :returns: workflow executions objects list
+        :rtype: list
+        """
+        return list(self.iter_filter(
+            status, tag,
+            workflow_id, workflow_type_name,
+            workflow_type_version,
+            *args, **kwargs
+        ))
+
+    def iter_filter(self,
+                    status=WorkflowExecution.STATUS_OPEN, tag=None,
+                    workflow_id=None, workflow_type_name=None,
+                    workflow_type_version=None,
+                    *args, **kwargs):
         """Filters workflow executions based on kwargs provided criteras
 
         :param  status: workflow executions with provided status will be kept.
@@ -552,8 +567,9 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
                                   * ``CLOSE_TIMED_OUT``
             :type   close_status: string
 
-            :returns: workflow executions objects list
-            :rtype: list
+            :returns: generator of workflow executions objects, fetched
+                      page by page
+            :rtype: generator
         """
         # As WorkflowTypeQuery has to be built against a specific domain
         # name, domain filter is disposable, but not mandatory.
@@ -588,18 +604,36 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
         else:
             start_oldest_date = None
 
-        return [self.to_WorkflowExecution(self.domain, wfe) for wfe in
-                self._list_items(
-                    *args,
-                    domain=self.domain.name,
-                    status=status,
-                    workflow_id=workflow_id,
-                    workflow_name=workflow_type_name,
-                    workflow_version=workflow_type_version,
-                    start_oldest_date=start_oldest_date,
-                    tag=tag,
-                    **kwargs
-                )]
+        for wfe in self._list_items(
+                *args,
+                domain=self.domain.name,
+                status=status,
+                workflow_id=workflow_id,
+                workflow_name=workflow_type_name,
+                workflow_version=workflow_type_version,
+                start_oldest_date=start_oldest_date,
+                tag=tag,
+                **kwargs):
+            yield self.to_WorkflowExecution(self.domain, wfe)
+
+    def iter_filters(self, filters, threads=4):
+        """Chains the results of several filters, e.g. on different tags,
+        querying up to ``threads`` of them concurrently
+
+        :param  filters: keyword arguments of :meth:`iter_filter`
+        :type   filters: list[dict]
+
+        :param  threads: maximum number of concurrent queries
+        :type   threads: int
+
+        :returns: generator of workflow executions objects, in the order
+                  of the filters
+        :rtype: generator
+        """
+        return chain_concurrently(
+            [self.iter_filter(**kwargs) for kwargs in filters],
+            threads=threads,
+        )
 
     def _list(self, *args, **kwargs):
         return self.list_workflow_executions(*args, **kwargs)
@@ -607,6 +641,17 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
     def all(self, status=WorkflowExecution.STATUS_OPEN,
             start_oldest_date=MAX_WORKFLOW_AGE,
             *args, **kwargs):
+        """Fetch every workflow executions, see :meth:`iter_all`
+
+        :returns: workflow executions objects list
+        :rtype: list
+        """
+        return list(self.iter_all(status, start_oldest_date))
+
+    def iter_all(self, status=WorkflowExecution.STATUS_OPEN,
+                 start_oldest_date=MAX_WORKFLOW_AGE,
+                 windows=1, threads=4,
+                 *args, **kwargs):
         """Fetch every workflow executions during the last `start_oldest_date`
         days, with `status`
 
@@ -616,8 +661,16 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
         :param  start_oldest_date: Specifies the oldest start/close date to return.
         :type   start_oldest_date: integer (days)
 
-        :returns: workflow executions objects list
-        :rtype: list
+        :param  windows: split the period in ``windows`` time windows,
+                         queried concurrently
+        :type   windows: int
+
+        :param  threads: maximum number of concurrent queries
+        :type   threads: int
+
+        :returns: generator of workflow executions objects, most recently
+                  started first
+        :rtype: generator
 
         A typical amazon response looks like:
 
@@ -651,10 +704,30 @@ class WorkflowExecutionQuerySet(BaseWorkflowQuerySet):
                 "nextPageToken": "string"
             }
         """
-        start_oldest_date = datetime_timestamp(past_day(start_oldest_date))
-
-        return [self.to_WorkflowExecution(self.domain, wfe) for wfe
-                in self._list_items(
-                status,
-                self.domain.name,
-                start_oldest_date=int(start_oldest_date))]
+        start_oldest_date = int(datetime_timestamp(past_day(start_oldest_date)))
+        if windows <= 1:
+            bounds = [(start_oldest_date, None)]
+        else:
+            now = int(datetime_timestamp(past_day(0)))
+            step = max(1, -(-(now - start_oldest_date) // windows))
+            edges = [start_oldest_date + i * step for i in range(windows)]
+            # Windows [oldest, latest[ in whole seconds, the most recent one
+            # is open-ended. Most recent window first, as SWF returns the
+            # most recent executions first.
+            bounds = list(zip(edges, edges[1:] + [None]))[::-1]
+
+        def iter_window(oldest, latest):
+            kwargs = {'start_oldest_date': oldest}
+            if latest is not None:
+                kwargs['start_latest_date'] = latest
+            for wfe in self._list_items(status, self.domain.name, **kwargs):
+                # SWF includes the executions started at the latest date:
+                # they belong to the next window.
+                if latest is not None and wfe['startTimestamp'] >= latest:
+                    continue
+                yield self.to_WorkflowExecution(self.domain, wfe)
+
+        return chain_concurrently(
+            [iter_window(oldest, latest) for oldest, latest in bounds],
+            threads=threads,
+        )
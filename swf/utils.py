@@ -8,9 +8,14 @@
 from datetime import datetime, timedelta
 from time import mktime
 from itertools import chain, islice
+from multiprocessing.pool import ThreadPool
+import os
+import threading
 
 from functools import wraps
 
+from future.moves.queue import Full, Queue
+
 from simpleflow import compat
 
 
@@ -82,6 +87,111 @@ def get_subkey(d, key_path):
         return d.get(key_path[0])
 
 
+_pages_pools = {}
+_pages_pools_lock = threading.Lock()
+
+
+def get_pages_pool():
+    """Returns the thread pool of this process prefetching the pages
+    of :func:`iter_pages`.
+
+    :rtype: multiprocessing.pool.ThreadPool
+    """
+    pid = os.getpid()
+    with _pages_pools_lock:
+        if pid not in _pages_pools:
+            # The pools of the parent process are unusable after a fork
+            _pages_pools.clear()
+            _pages_pools[pid] = ThreadPool(4)
+        return _pages_pools[pid]
+
+
+def iter_pages(fetch, more=None, pool=None):
+    """Yields the responses of a paginated SWF API. While a page is
+    consumed, the next one is requested in a background thread.
+
+    :param  fetch: returns the page of a token (None for the first page)
+    :type   fetch: callable(next_page_token) -> dict
+
+    :param  more: tells, before a page is yielded, if the next one
+                  should be requested; defaults to always
+    :type   more: callable(dict) -> bool
+
+    :param  pool: pool requesting the next pages; defaults to the
+                  pool shared by the process, see :func:`get_pages_pool`
+    :type   pool: multiprocessing.pool.ThreadPool
+    """
+    pool = pool or get_pages_pool()
+    response = fetch(None)
+    while True:
+        token = response.get('nextPageToken')
+        pending = None
+        if token is not None and (more is None or more(response)):
+            pending = pool.apply_async(fetch, (token,))
+        yield response
+        if pending is None:
+            return
+        response = pending.get()
+
+
+_DONE = object()
+
+
+def chain_concurrently(iterables, threads=4, buffer_size=1000):
+    """Chains iterables, e.g. of SWF queries, consuming up to ``threads``
+    of them concurrently. Items are yielded in order, as soon as possible.
+
+    :type   iterables: list[iterable]
+    :type   threads: int
+
+    :param  buffer_size: maximum number of items read ahead per iterable
+    :type   buffer_size: int
+    """
+    iterables = list(iterables)
+    if len(iterables) <= 1 or threads <= 1:
+        for item in chain(*iterables):
+            yield item
+        return
+
+    queues = [Queue(maxsize=buffer_size) for _ in iterables]
+    stopped = threading.Event()
+
+    def put(queue, item):
+        # Don't block forever on a full queue once the consumer is gone
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def consume(iterable, queue):
+        try:
+            for item in iterable:
+                if not put(queue, (True, item)):
+                    return
+        except Exception as err:
+            put(queue, (False, err))
+        put(queue, (True, _DONE))
+
+    pool = ThreadPool(threads)
+    try:
+        for iterable, queue in zip(iterables, queues):
+            pool.apply_async(consume, (iterable, queue))
+        for queue in queues:
+            while True:
+                ok, item = queue.get()
+                if not ok:
+                    raise item
+                if item is _DONE:
+                    break
+                yield item
+    finally:
+        stopped.set()
+        pool.close()
+
+
 class _CachedProperty(property):
     """A property cache mechanism.
 
@@ -1,3 +1,4 @@
+import gc
 import json
 import unittest
 
@@ -5,8 +6,10 @@ from simpleflow.activity import with_attributes
 from simpleflow import metrology, storage, settings
 from simpleflow.constants import MINUTE, HOUR
 from simpleflow.local.executor import Executor
+from simpleflow.task import ActivityTask
 
 import boto
+from mock import patch
 from moto import mock_s3
 
 
@@ -22,6 +25,21 @@ class MyMetrologyTask(metrology.MetrologyTask):
             step.read.records = self.num
 
 
+@with_attributes(task_list='test_task_list')
+class MyStepsTask(metrology.MetrologyTask):
+
+    def __init__(self, num, fail=False):
+        self.num = num
+        self.fail = fail
+
+    def execute(self):
+        for i in range(self.num):
+            with self.step('Step{}'.format(i)) as step:
+                step.read.records = i
+        if self.fail:
+            raise ValueError("failed")
+
+
 class MyWorkflow(metrology.MetrologyWorkflow):
     name = 'test_workflow'
     version = 'test_version'
@@ -33,6 +51,13 @@ class MyWorkflow(metrology.MetrologyWorkflow):
         self.submit(MyMetrologyTask, num)
 
 
+class MyManyTasksWorkflow(MyWorkflow):
+
+    def run(self, num):
+        for i in range(num):
+            self.submit(MyMetrologyTask, i)
+
+
 class MetrologyTestCase(unittest.TestCase):
 
     def create_bucket(self):
@@ -57,3 +82,103 @@ class MetrologyTestCase(unittest.TestCase):
         self.assertEquals(res[0][1]["metrology"][0]["name"], "Step1")
         self.assertEquals(res[0][1]["metrology"][0]["read"]["records"], 1)
         self.assertEquals(res[0][1]["metrology"][0]["metadata"]["num"], 1)
+
+    @patch.object(settings, 'METROLOGY_BUCKET', 'memory://metrology')
+    def test_metrology_memory_storage(self):
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+        ex = Executor(MyWorkflow)
+        ex.run(input={"args": [1], "kwargs": {}})
+        res = json.loads(storage.pull_content(
+            settings.METROLOGY_BUCKET,
+            "local/local/metrology.json"))
+        self.assertEquals(res[0][1]["metrology"][0]["name"], "Step1")
+
+    @patch.object(settings, 'METROLOGY_BUCKET', 'memory://metrology')
+    def test_metrology_many_activities(self):
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+        ex = Executor(MyManyTasksWorkflow)
+        ex.run(input={"args": [12], "kwargs": {}})
+        res = json.loads(storage.pull_content(
+            settings.METROLOGY_BUCKET,
+            "local/local/metrology.json"))
+        self.assertEquals(len(res), 12)
+        for name, event in res:
+            self.assertEquals(event["metrology"][0]["metadata"]["num"], int(name))
+
+    @patch.object(settings, 'METROLOGY_BUCKET', 'memory://metrology')
+    @patch.object(settings, 'STORAGE_THREADS', 2)
+    def test_metrology_history_streamed(self):
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+        for i in range(10):
+            storage.push_content(settings.METROLOGY_BUCKET, "wf/activity.{}.json".format(i), json.dumps([i]))
+        events = [[str(i), {"id": i}] for i in range(20)]
+        history = metrology.MetrologyHistory(
+            events, ["wf/activity.{}.json".format(i) for i in range(10)])
+        with patch.object(storage, 'pull_contents', wraps=storage.pull_contents) as pull_contents:
+            merged = list(history)
+        # By batches of STORAGE_THREADS * 4 events
+        self.assertEquals([len(c[0][1]) for c in pull_contents.call_args_list], [8, 2])
+        self.assertEquals(merged[3], ["3", {"id": 3, "metrology": [3]}])
+        self.assertEquals(merged[15], ["15", {"id": 15}])
+        # The stats are not kept
+        self.assertEquals(events[3], ["3", {"id": 3}])
+
+    def run_steps_task(self, *args):
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+        context = {"workflow_id": "wid", "run_id": "rid", "activity_id": "0"}
+        task = ActivityTask(MyStepsTask, *args, context=context)
+        with patch.object(settings, 'METROLOGY_BUCKET', 'memory://metrology'), \
+                patch('simpleflow.storage.push_content', side_effect=storage.push_content) as push_content:
+            try:
+                task.execute()
+            finally:
+                res = json.loads(storage.pull_content('memory://metrology', "wid/rid/activity.0.json"))
+        return push_content.call_count, res
+
+    def test_stats_uploaded_once(self):
+        call_count, res = self.run_steps_task(5)
+        self.assertEquals(call_count, 1)
+        self.assertEquals([step["read"]["records"] for step in res], list(range(5)))
+
+    def test_stats_uploaded_on_failure(self):
+        with self.assertRaises(ValueError):
+            self.run_steps_task(2, True)
+        # Checked in the finally clause of run_steps_task()
+        self.assertEquals(len(storage.MemoryBackend("metrology").files), 1)
+
+    @patch.object(settings, 'METROLOGY_FLUSH_INTERVAL', 1)
+    def test_stats_flush_interval(self):
+        perf_counter = [
+            0, 0,  # Step0 starts, first step
+            0.5, 0.5,  # Step0 ends
+            0.6, 1.5, 1.5, 1.5,  # Step1 ends after the interval: upload
+            1.6, 1.8, 1.8,  # Step2 ends
+            2,  # final upload
+        ]
+        # Garbage collections are timed with perf_counter() too
+        gc.disable()
+        self.addCleanup(gc.enable)
+        with patch('simpleflow.metrology.perf_counter', side_effect=perf_counter):
+            call_count, res = self.run_steps_task(3)
+        self.assertEquals(call_count, 2)
+        self.assertEquals(len(res), 3)
+
+    def test_step_resources(self):
+        call_count, res = self.run_steps_task(1)
+        resources = res[0]["resources"]
+        for name in ("cpu_user", "cpu_system", "max_rss_delta", "block_input", "block_output"):
+            self.assertGreaterEqual(resources[name], 0)
+        if hasattr(gc, 'callbacks'):
+            self.assertEquals(len(resources["gc_collections"]), 3)
+            self.assertGreaterEqual(resources["gc_time"], 0)
+        self.assertNotIn("allocations", resources)
+
+    @unittest.skipIf(metrology.tracemalloc is None, "needs tracemalloc")
+    @patch.object(settings, 'METROLOGY_TRACEMALLOC_TOP', 3)
+    def test_step_allocations(self):
+        call_count, res = self.run_steps_task(1)
+        allocations = res[0]["resources"]["allocations"]
+        self.assertLessEqual(len(allocations), 3)
+        for allocation in allocations:
+            self.assertEquals(list(allocation), ["location", "size_diff", "count_diff"])
+        self.assertFalse(metrology.tracemalloc.is_tracing())
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from simpleflow import metrology_sinks, settings, storage
+from simpleflow.local.executor import Executor
+from simpleflow.task import ActivityTask
+
+from tests.test_metrology import MyStepsTask, MyWorkflow
+
+
+class MetrologySinksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+        patcher = patch.object(settings, 'METROLOGY_BUCKET', 'memory://metrology')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_sinks(self, sinks):
+        patcher = patch.object(settings, 'METROLOGY_SINKS', sinks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_steps_task(self, *args):
+        context = {"workflow_id": "wid", "run_id": "rid", "activity_id": "0", "name": "steps"}
+        ActivityTask(MyStepsTask, *args, context=context).execute()
+
+    def test_jsonl(self):
+        path = os.path.join(self.directory, "logs", "metrology.jsonl")
+        self.set_sinks("storage, jsonl://" + path)
+        Executor(MyWorkflow).run(input={"args": [1], "kwargs": {}})
+        with open(path) as f:
+            activity, workflow = [json.loads(line) for line in f]
+        self.assertEquals(activity["type"], "activity")
+        self.assertEquals(activity["activity_type"], "tests.test_metrology.MyMetrologyTask")
+        self.assertEquals(activity["steps"][0]["read"]["records"], 1)
+        self.assertEquals(workflow["type"], "workflow")
+        self.assertEquals(workflow["history"][0][1]["metrology"][0]["name"], "Step1")
+        # Still written to the storage
+        self.assertIsNotNone(storage.stat(settings.METROLOGY_BUCKET, "local/local/metrology.json"))
+
+    def test_jsonl_rotation(self):
+        path = os.path.join(self.directory, "metrology.jsonl")
+        sink = metrology_sinks.get_sink("jsonl://{}?max_bytes=30&backup_count=2".format(path))
+        for i in range(5):
+            sink.write({"document": i})
+        self.assertEquals(
+            sorted(name for name in os.listdir(self.directory) if not name.endswith(".lock")),
+            ["metrology.jsonl", "metrology.jsonl.1", "metrology.jsonl.2"])
+        with open(path) as f:
+            self.assertEquals(json.loads(f.read()), {"document": 4})
+
+    def test_prometheus(self):
+        path = os.path.join(self.directory, "simpleflow.prom")
+        self.set_sinks("prometheus://" + path)
+        self.run_steps_task(3)
+        self.run_steps_task(2)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertIn('simpleflow_activity_duration_seconds_count{activity_type="steps"} 2', lines)
+        self.assertIn('simpleflow_step_duration_seconds_count{activity_type="steps",step="Step1"} 2', lines)
+        self.assertIn('simpleflow_step_duration_seconds_count{activity_type="steps",step="Step2"} 1', lines)
+        self.assertIn(
+            'simpleflow_step_records_total{activity_type="steps",step="Step2",direction="read"} 2', lines)
+        # Not written to the storage
+        self.assertEquals(storage.list_keys(settings.METROLOGY_BUCKET), [])
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            metrology_sinks.get_sink("ftp://host/path")
+
+    def test_dump_list(self):
+        path = os.path.join(self.directory, "list.json")
+        for items in ([], [["a", {"b": [1, 2], "c": {}}], ["d", {"e": "f\ng"}]]):
+            with open(path, "w") as f:
+                metrology_sinks._dump_list(iter(items), f)
+            with open(path) as f:
+                self.assertEqual(f.read(), json.dumps(items, indent=2))
@@ -4,12 +4,16 @@ import platform
 import signal
 import time
 
+from mock import patch
 from psutil import Process
 from pytest import mark
 from sure import expect
 
+import swf.exceptions
 from swf.models import Domain
+from simpleflow.swf import client
 from simpleflow.swf.process import Poller
+from simpleflow.utils.retry import CircuitBreaker
 from tests.utils import IntegrationTestCase
 
 
@@ -48,3 +52,45 @@ class TestSupervisor(IntegrationTestCase):
         # in "zombie" mode yet (which would be the case if SIGTERM had its
         # default effect)
         expect(Process(process.pid).status()).to.contain("sleeping")
+
+
+class FailingPoller(Poller):
+    name = 'FailingPoller'
+    nb_retries = 3
+
+    @property
+    def identity(self):
+        return 'test-identity'
+
+    def poll(self, task_list, identity=None):
+        self.polls += 1
+        raise swf.exceptions.ResponseError('boom')
+
+    def complete(self, token, response):
+        pass
+
+    def process(self, request):
+        pass
+
+    def fail(self, *args, **kwargs):
+        pass
+
+
+class TestPollerCircuitBreaker(IntegrationTestCase):
+    def test_circuit_open(self):
+        poller = FailingPoller(Domain("test-domain"), "test-task-list")
+        poller.polls = 0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+        def sleep(seconds):
+            if seconds > 1:  # waiting for the circuit
+                poller.is_alive = False
+
+        with patch.object(client, 'get_circuit_breaker', return_value=breaker), \
+                patch.object(poller, 'bind_signal_handlers'), \
+                patch('time.sleep', side_effect=sleep) as time_sleep:
+            poller.start()
+        # The third attempt failed fast
+        expect(poller.polls).to.equal(2)
+        expect(breaker.state).to.equal(CircuitBreaker.OPEN)
+        expect(time_sleep.call_args[0][0]).to.be.greater_than(29)
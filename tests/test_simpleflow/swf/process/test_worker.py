@@ -1,14 +1,28 @@
 from collections import namedtuple
 from mock import patch, ANY
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 from moto import mock_swf
 
+from simpleflow import activity, result_cache
 from simpleflow.swf.process.worker.base import ActivityWorker, ActivityPoller
 from swf.models import Domain, ActivityTask
 
 
 FakeActivityType = namedtuple("FakeActivityType", ["name"])
+FakeVersionedActivityType = namedtuple("FakeVersionedActivityType", ["name", "version"])
+
+CALLS = []
+
+
+@activity.with_attributes(idempotent=True)
+def cached_double(x):
+    CALLS.append(x)
+    return x * 2
 
 
 @mock_swf
@@ -30,3 +44,86 @@ class TestActivityWorker(unittest.TestCase):
         self.assertEquals(1, mock.call_count)
         self.assertEquals(mock.call_args[0], ("token", task))
         self.assertIn("No module named ", mock.call_args[1]["reason"])
+
+    def test_result_cache(self):
+        directory = tempfile.mkdtemp()
+        result_cache.set_cache(result_cache.LocalResultCache(directory, ttl=60))
+        self.addCleanup(result_cache.set_cache, None)
+        self.addCleanup(shutil.rmtree, directory)
+        del CALLS[:]
+
+        domain = Domain("test-domain")
+        poller = ActivityPoller(domain, "task-list")
+        activity_type = FakeVersionedActivityType(
+            "tests.test_simpleflow.swf.process.test_worker.cached_double", "1.0")
+        worker = ActivityWorker()
+        for x in (2, 2, 3):
+            task = ActivityTask(domain, "task-list", activity_type=activity_type,
+                                input='{"args":[%d]}' % x)
+            task.context = {
+                "activityType": {"name": activity_type.name, "version": activity_type.version},
+                "workflowExecution": {"workflowId": "wid", "runId": "rid"},
+                "activityId": "activity-{}".format(x),
+                "input": task.input,
+            }
+            with patch.object(poller, "complete_with_retry") as mock:
+                worker.process(poller, "token", task)
+            self.assertEquals(mock.call_args[0], ("token", str(x * 2)))
+
+        # The second execution came from the cache
+        self.assertEquals(CALLS, [2, 3])
+
+
+class TestLocalResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        key = result_cache.get_key("foo", "1.0", [1], {"a": 1, "b": 2})
+        self.assertEquals(key, result_cache.get_key("foo", "1.0", [1], {"b": 2, "a": 1}))
+        self.assertNotEquals(key, result_cache.get_key("foo", "2.0", [1], {"a": 1, "b": 2}))
+        self.assertNotEquals(key, result_cache.get_key("foo", "1.0", [2], {"a": 1, "b": 2}))
+
+    def test_ttl(self):
+        cache = result_cache.LocalResultCache(self.directory, ttl=60)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", "42")
+        self.assertEquals(cache.get("key"), "42")
+        with patch("time.time", return_value=time.time() + 3600):
+            self.assertIsNone(cache.get("key"))
+
+    def test_lru_eviction(self):
+        cache = result_cache.LocalResultCache(self.directory, max_size=150)
+        cache.set("a", "x" * 50)
+        cache.set("b", "x" * 50)
+        os.utime(os.path.join(self.directory, "a"), (0, 0))
+        cache.get("b")
+        cache.set("c", "x" * 50)
+        self.assertIsNone(cache.get("a"))
+        self.assertEquals(cache.get("b"), "x" * 50)
+        self.assertEquals(cache.get("c"), "x" * 50)
+
+    def test_eviction_scans_lazily(self):
+        cache = result_cache.LocalResultCache(self.directory, max_size=1000)
+        with patch("os.listdir", wraps=os.listdir) as listdir:
+            for key in "abcde":
+                cache.set(key, "x" * 50)
+            self.assertEquals(listdir.call_count, 1)
+            for key in "fghijklmnopqrst":
+                cache.set(key, "x" * 50)
+            # Estimated size above max_size
+            self.assertEquals(listdir.call_count, 2)
+        self.assertLessEqual(
+            sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)),
+            1000)
+
+    def test_corrupt_entries(self):
+        cache = result_cache.LocalResultCache(self.directory, ttl=60)
+        for content in ("no timestamp", "abc\n42"):
+            with open(os.path.join(self.directory, "key"), "w") as f:
+                f.write(content)
+            self.assertIsNone(cache.get("key"))
+            self.assertFalse(os.path.exists(os.path.join(self.directory, "key")))
@@ -3,7 +3,7 @@ import unittest
 
 from swf.models import History as BasicHistory
 from simpleflow.history import History
-from simpleflow.swf.stats.pretty import dump_history_to_json
+from simpleflow.swf.stats.pretty import dump_history_to_json, formatted_blocks
 
 
 def fake_history():
@@ -32,3 +32,15 @@ class TestSimpleflowSwfStatsPretty(unittest.TestCase):
              "activity-examples.basic.double-1"],
             [t[0] for t in parsed],
         )
+
+    def test_formatted_blocks(self):
+        def rows():
+            return ('Name', 'Value'), ((str(i), i) for i in range(5))
+
+        blocks = list(formatted_blocks(with_header=True, block_size=2)(rows)())
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(blocks[0].split()[:2], ['Name', 'Value'])
+        self.assertEqual(blocks[2], '4  4')
+
+        blocks = list(formatted_blocks(fmt='json', block_size=2)(rows)())
+        self.assertEqual(json.loads(blocks[0]), [[str(i), i] for i in range(5)])
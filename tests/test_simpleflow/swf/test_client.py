@@ -0,0 +1,172 @@
+import unittest
+
+import boto
+from boto.exception import SWFResponseError
+from mock import patch
+from moto import mock_swf
+
+from simpleflow import metrics, settings
+from simpleflow.swf import client
+from simpleflow.utils.retry import RetryBudget
+from swf.core import ConnectedSWFObject
+
+
+def throttling_error():
+    return SWFResponseError(400, 'Bad Request', body={
+        '__type': 'com.amazon.coral.availability#ThrottlingException',
+        'message': 'Rate exceeded',
+    })
+
+
+class TestClient(unittest.TestCase):
+
+    def setUp(self):
+        metrics.registry.values.clear()
+        self.addCleanup(metrics.registry.values.clear)
+
+    def value(self, name, **labels):
+        return metrics.registry.values.get((name, tuple(sorted(labels.items()))))
+
+    def test_is_throttling(self):
+        self.assertTrue(client.is_throttling(throttling_error()))
+        self.assertFalse(client.is_throttling(SWFResponseError(400, 'Bad Request', body={
+            '__type': 'com.amazonaws.swf.base.model#UnknownResourceFault'})))
+        self.assertFalse(client.is_throttling(ValueError()))
+
+    def test_record(self):
+        with client.track() as outer:
+            client.record('PollForDecisionTask', 0.5, 100, 1000)
+            with client.track() as inner:
+                client.record('RespondDecisionTaskCompleted', 0.1, 50, 0, throttling_error())
+                client.record('RespondDecisionTaskCompleted', 0.1, 50, 0)
+            client.record('RespondDecisionTaskCompleted', 0.1, 50, 0)
+
+        self.assertEqual(inner.to_dict(), {'RespondDecisionTaskCompleted': {
+            'calls': 2, 'errors': 1, 'throttled': 1, 'retries': 1,
+            'seconds': 0.2, 'request_bytes': 100, 'response_bytes': 0,
+        }})
+        self.assertEqual(outer.total('calls'), 4)
+        # Only the call following the failure is a retry
+        self.assertEqual(outer.total('retries'), 1)
+        self.assertEqual(outer.total('response_bytes'), 1000)
+        self.assertEqual(
+            str(outer),
+            'calls=4 errors=1 throttled=1 retries=1 seconds=0.800 request_bytes=250 response_bytes=1000 '
+            'apis=PollForDecisionTask:1,RespondDecisionTaskCompleted:3')
+
+        self.assertEqual(self.value('simpleflow_swf_requests_total',
+                                    api='RespondDecisionTaskCompleted', outcome='ok'), 2)
+        self.assertEqual(self.value('simpleflow_swf_requests_total',
+                                    api='RespondDecisionTaskCompleted', outcome='throttled'), 1)
+        self.assertEqual(self.value('simpleflow_swf_retries_total', api='RespondDecisionTaskCompleted'), 1)
+        self.assertEqual(self.value('simpleflow_swf_request_seconds', api='PollForDecisionTask').count, 1)
+        self.assertEqual(self.value('simpleflow_swf_response_bytes_total', api='PollForDecisionTask'), 1000)
+
+    @mock_swf
+    def test_install(self):
+        client.install()
+        self.addCleanup(client.uninstall)
+        client.install()  # idempotent
+        conn = boto.connect_swf()
+        with client.track() as usage:
+            conn.register_domain('TestClientDomain', '50')
+            for _ in range(2):
+                with self.assertRaises(SWFResponseError):
+                    conn.register_domain('TestClientDomain', '50')
+            conn.list_domains('REGISTERED')
+
+        self.assertEqual(sorted(usage.apis), ['ListDomains', 'RegisterDomain'])
+        self.assertEqual(usage.apis['RegisterDomain']['calls'], 3)
+        self.assertEqual(usage.apis['RegisterDomain']['errors'], 2)
+        self.assertEqual(usage.apis['RegisterDomain']['retries'], 1)
+        self.assertGreater(usage.apis['RegisterDomain']['request_bytes'], 0)
+        self.assertGreater(usage.apis['ListDomains']['response_bytes'], 0)
+        self.assertEqual(self.value('simpleflow_swf_requests_total', api='RegisterDomain', outcome='error'), 2)
+
+        client.uninstall()
+        with client.track() as usage:
+            conn.list_domains('REGISTERED')
+        self.assertEqual(usage.apis, {})
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        client.reset_limiters()
+        self.addCleanup(client.reset_limiters)
+        metrics.registry.values.clear()
+        self.addCleanup(metrics.registry.values.clear)
+
+    def test_get_family(self):
+        self.assertEqual(client.get_family('PollForActivityTask'), 'poll')
+        self.assertEqual(client.get_family('RecordActivityTaskHeartbeat'), 'heartbeat')
+        self.assertEqual(client.get_family('RespondDecisionTaskCompleted'), 'respond')
+        self.assertEqual(client.get_family('GetWorkflowExecutionHistory'), 'list')
+        self.assertEqual(client.get_family('DescribeDomain'), 'list')
+        self.assertEqual(client.get_family('StartWorkflowExecution'), 'other')
+
+    def test_parse_rate_limits(self):
+        self.assertEqual(client.parse_rate_limits(''), {})
+        self.assertEqual(client.parse_rate_limits('poll=5, heartbeat=10:20'),
+                         {'poll': (5, None), 'heartbeat': (10, 20)})
+        for value in ('poll', 'poll=fast', 'poll=5:x', 'poll=0'):
+            with self.assertRaises(ValueError):
+                client.parse_rate_limits(value)
+
+    def test_get_limiter_malformed(self):
+        with patch.object(settings, 'SWF_RATE_LIMITS', 'poll'), \
+                patch.object(client, 'parse_rate_limits', wraps=client.parse_rate_limits) as parse, \
+                patch.object(client.logger, 'error') as error:
+            self.assertIsNone(client.get_limiter('poll'))
+            self.assertIsNone(client.get_limiter('list'))
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(error.call_count, 1)
+
+    def test_get_limiter(self):
+        with patch.object(settings, 'SWF_RATE_LIMITS', 'list=2:4'):
+            limiter = client.get_limiter('list')
+            self.assertIsNone(client.get_limiter('poll'))
+        self.assertEqual((limiter.max_rate, limiter.burst), (2, 4))
+        self.assertIs(client.get_limiter('list'), limiter)
+
+    @mock_swf
+    def test_throttling_decreases_rate(self):
+        client.install()
+        self.addCleanup(client.uninstall)
+        conn = boto.connect_swf()
+        with patch.object(settings, 'SWF_RATE_LIMITS', 'list=100'), \
+                patch.object(client, '_original_make_request', side_effect=throttling_error()):
+            with self.assertRaises(SWFResponseError):
+                conn.list_domains('REGISTERED')
+        limiter = client.get_limiter('list')
+        self.assertEqual(limiter.rate, 50)
+        self.assertEqual(metrics.registry.values[('simpleflow_swf_rate_limit', (('family', 'list'),))], 50)
+        # The throttling left the bucket empty
+        with patch('time.sleep') as sleep:
+            conn.list_domains('REGISTERED')
+        self.assertEqual(sleep.call_count, 1)
+        # The gauge follows the rate growing back
+        limiter.rate = 80
+        with patch.object(limiter, '_refill'), patch('time.sleep'):
+            conn.list_domains('REGISTERED')
+        self.assertEqual(metrics.registry.values[('simpleflow_swf_rate_limit', (('family', 'list'),))], 80)
+
+
+class TestRetries(unittest.TestCase):
+
+    def test_get_retry_budget(self):
+        budget = client.get_retry_budget()
+        self.assertIs(client.get_retry_budget(), budget)
+        self.assertEqual(budget.ratio, settings.SWF_RETRY_BUDGET_RATIO)
+        self.assertIs(client.get_circuit_breaker(), client.get_circuit_breaker())
+
+    def test_connection_retries_use_budget(self):
+        budget = RetryBudget(ratio=0, min_retries=1)
+        with patch.object(client, 'get_retry_budget', return_value=budget), \
+                patch('swf.core.RETRIES', 5), \
+                patch('boto.swf.connect_to_region', side_effect=TypeError('no credentials')) as connect, \
+                patch('time.sleep'):
+            with self.assertRaises(TypeError):
+                ConnectedSWFObject()
+        # One retry left in the budget
+        self.assertEqual(connect.call_count, 2)
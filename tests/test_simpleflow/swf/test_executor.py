@@ -1,16 +1,26 @@
+import os
+import pstats
+import shutil
+import tempfile
 import unittest
 
 import boto
+from mock import patch
 from moto import mock_swf
 from sure import expect
 
-from simpleflow import activity, futures
+from simpleflow import activity, futures, settings
+from simpleflow.swf import executor as swf_executor
 from simpleflow.swf.executor import Executor
+from simpleflow.swf.task import ActivityTask, NonPythonicActivityTask
 from swf.actors import Decider
+from swf.models.history import builder
+from swf.responses import Response
 from tests.data import (
     BaseTestWorkflow,
     DOMAIN,
     increment,
+    non_pythonic,
 )
 
 
@@ -81,3 +91,156 @@ class TestSimpleflowSwfExecutor(unittest.TestCase):
 
         # priority set at decorator level but overridden in self.submit()
         expect(get_task_priority(decisions[4])).to.equal("30")
+
+
+class TestReplayInstrumentation(unittest.TestCase):
+    def poll(self):
+        conn = boto.connect_swf()
+        conn.register_domain("TestDomain", "50")
+        conn.register_workflow_type(
+            "TestDomain", "test-workflow", "v1.2",
+            task_list="test-task-list", default_child_policy="TERMINATE",
+            default_execution_start_to_close_timeout="6",
+            default_task_start_to_close_timeout="3",
+        )
+        conn.start_workflow_execution("TestDomain", "wfe-1234", "test-workflow", "v1.2")
+        return Decider(DOMAIN, "test-task-list").poll()
+
+    def replay_log_args(self, response, debug):
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        with patch.object(swf_executor.logger, 'info') as info, \
+                patch.object(swf_executor.logger, 'isEnabledFor', return_value=debug), \
+                patch.object(swf_executor, 'json_dumps', wraps=swf_executor.json_dumps) as dumps:
+            executor.replay(response)
+        calls = [c for c in info.call_args_list if c[0][0].startswith('replay:')]
+        expect(calls).to.have.length_of(1)
+        return calls[0][0][1:], dumps.call_count
+
+    @mock_swf
+    def test_replay_logs_timings(self):
+        response = self.poll()
+        args, dumps = self.replay_log_args(response, debug=False)
+        # The decisions are not serialized an extra time
+        expect(dumps).to.equal(0)
+        expect(args[:4]).to.equal(("wfe-1234", response.execution.run_id, len(response.history), 5))
+        parse, run, total = args[4:]
+        expect(abs(parse + run - total)).to.be.lower_than(1e-3)
+
+    @mock_swf
+    def test_replay_logs_serialization_on_debug(self):
+        response = self.poll()
+        args, dumps = self.replay_log_args(response, debug=True)
+        expect(dumps).to.equal(1)
+        parse, run, decisions_bytes, serialize, total = args[4:]
+        expect(decisions_bytes).to.be.greater_than(0)
+        expect(abs(parse + run + serialize - total)).to.be.lower_than(1e-6)
+
+    @mock_swf
+    def test_replay_profile(self):
+        response = self.poll()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with patch.object(settings, 'DECISION_PROFILE_DIRECTORY', directory), \
+                patch.object(settings, 'DECISION_PROFILE_THRESHOLD', 3600):
+            Executor(DOMAIN, ExampleWorkflow).replay(response)
+            expect(os.listdir(directory)).to.be.empty
+            with patch.object(settings, 'DECISION_PROFILE_THRESHOLD', 0):
+                Executor(DOMAIN, ExampleWorkflow).replay(response)
+        filename = "wfe-1234.{}.{}.prof".format(response.execution.run_id, len(response.history))
+        expect(os.listdir(directory)).to.equal([filename])
+        stats = pstats.Stats(os.path.join(directory, filename))
+        expect([f for f in stats.stats if f[2] == "run_workflow"]).to.have.length_of(1)
+
+
+class ManySubmitsWorkflow(BaseTestWorkflow):
+    """
+    Submits a lot of tasks, mixing ActivityTask subclasses.
+    """
+    nb_tasks = 2000
+
+    def run(self):
+        fs = []
+        for i in range(self.nb_tasks):
+            if i % 2:
+                fs.append(self.submit(NonPythonicActivityTask(non_pythonic, i)))
+            else:
+                fs.append(self.submit(increment, i))
+        futures.wait(*fs)
+        return len(fs)
+
+
+@mock_swf
+class TestSimpleflowSwfExecutorDispatch(unittest.TestCase):
+    def build_history(self):
+        history = builder.History(ManySubmitsWorkflow)
+        decision_id = history.last_id
+        for i in range(ManySubmitsWorkflow.nb_tasks):
+            if i % 2:
+                a, activity_id = non_pythonic, 'activity-tests.data.activities.non_pythonic-{}'.format(i // 2 + 1)
+            else:
+                a, activity_id = increment, 'activity-tests.data.activities.increment-{}'.format(i // 2 + 1)
+            history.add_activity_task(
+                a,
+                decision_id=decision_id,
+                last_state='completed',
+                activity_id=activity_id,
+                result=i,
+            )
+        return history
+
+    def test_find_event_resolves_subclasses(self):
+        executor = Executor(DOMAIN, ManySubmitsWorkflow)
+        finder = Executor.TASK_TYPE_TO_EVENT_FINDER[ActivityTask]
+        expect(executor._lookup_by_task_type(
+            'TASK_TYPE_TO_EVENT_FINDER', NonPythonicActivityTask)).to.equal(finder)
+        expect(executor._lookup_by_task_type(
+            'TASK_TYPE_TO_EVENT_FINDER', ActivityTask)).to.equal(finder)
+        expect(executor._lookup_by_task_type('TASK_TYPE_TO_EVENT_FINDER', int)).to.be.none
+        with self.assertRaises(TypeError):
+            executor.find_event(42, None)
+
+    def test_replay_many_submits(self):
+        """
+        Replay of many submits: the MRO of each task class is walked once, then
+        the dispatch cache is hit.
+        """
+        class CountingDict(dict):
+            hits = 0
+
+            def __getitem__(self, key):
+                value = super(CountingDict, self).__getitem__(key)
+                CountingDict.hits += 1
+                return value
+
+        history = self.build_history()
+        executor = Executor(DOMAIN, ManySubmitsWorkflow)
+        with patch.object(Executor, '_task_type_dispatch_cache', CountingDict()) as cache:
+            decisions, _ = executor.replay(Response(history=history, execution=None))
+
+        expect(decisions).to.have.length_of(1)
+        expect(decisions[0]['decisionType']).to.equal('CompleteWorkflowExecution')
+        # One entry per (table, task class), hit by every other submit
+        expect(len(cache)).to.be.lower_than(5)
+        expect(CountingDict.hits).to.be.greater_than(ManySubmitsWorkflow.nb_tasks - 5)
+
+
+class TestTaskIdCache(unittest.TestCase):
+    def setUp(self):
+        swf_executor.TASK_ID_CACHE.clear()
+
+    def test_hash_arguments_is_memoized(self):
+        digest = swf_executor._hash_arguments((1, 'a'), {'b': None})
+        with patch('simpleflow.swf.executor.json_dumps') as json_dumps:
+            expect(swf_executor._hash_arguments((1, 'a'), {'b': None})).to.equal(digest)
+            expect(json_dumps.called).to.be.false
+
+    def test_hash_arguments_types_are_part_of_the_key(self):
+        expect(swf_executor._hash_arguments((1,), {})).to_not.equal(
+            swf_executor._hash_arguments((True,), {}))
+        expect(swf_executor._hash_arguments((1,), {})).to_not.equal(
+            swf_executor._hash_arguments((1.0,), {}))
+
+    def test_hash_arguments_complex_values_are_not_cached(self):
+        digest = swf_executor._hash_arguments(([1, 2],), {'b': {'c': 3}})
+        expect(swf_executor.TASK_ID_CACHE).to.have.length_of(0)
+        expect(swf_executor._hash_arguments(([1, 2],), {'b': {'c': 3}})).to.equal(digest)
@@ -3,9 +3,11 @@ from mock import patch
 import os
 import unittest
 
+import boto
+from moto import mock_swf
 from sure import expect
 
-from simpleflow.swf.helpers import swf_identity
+from simpleflow.swf.helpers import filter_workflow_executions, swf_identity
 
 
 @patch("socket.gethostname")
@@ -84,3 +86,23 @@ class TestSwfHelpers(unittest.TestCase):
         expect(identity).to_not.have.key("user")
         # key ignored
         expect(identity).to_not.have.key("foo")
+
+
+class TestFilterWorkflowExecutions(unittest.TestCase):
+    @mock_swf
+    def test_several_tags(self):
+        conn = boto.connect_swf()
+        conn.register_domain("TestFilterTagsDomain", "50")
+        conn.register_workflow_type(
+            "TestFilterTagsDomain", "test-workflow", "v1",
+            task_list="test-task-list", default_child_policy="TERMINATE",
+            default_execution_start_to_close_timeout="60",
+            default_task_start_to_close_timeout="30",
+        )
+        for workflow_id, tags in (("wf-a", ["a"]), ("wf-ab", ["a", "b"]), ("wf-c", ["c"])):
+            conn.start_workflow_execution("TestFilterTagsDomain", workflow_id, "test-workflow", "v1",
+                                          tag_list=tags)
+
+        _, rows = filter_workflow_executions(
+            "TestFilterTagsDomain", "OPEN", ["a", "b"], None, None, None, oldest_date=1)
+        expect(sorted(row[0] for row in rows)).to.equal(["wf-a", "wf-ab"])
@@ -1733,6 +1733,46 @@ def test_markers():
     assert expected == decisions
 
 
+class ATestDefinitionWithMarkerAndActivityWorkflow(BaseTestWorkflow):
+    name = "test_markers"
+
+    def run(self):
+        m = self.submit(self.record_marker('First marker'))
+        a = self.submit(increment, 1)
+        futures.wait(m, a)
+
+
+@mock_swf
+def test_markers_are_batched_with_other_decisions():
+    workflow = ATestDefinitionWithMarkerAndActivityWorkflow
+    executor = Executor(DOMAIN, workflow)
+    history = builder.History(workflow, input={})
+    decisions, _ = executor.replay(Response(history=history, execution=None))
+    assert len(decisions) == 2
+    assert decisions[0]['decisionType'] == 'RecordMarker'
+    check_task_scheduled_decision(decisions[1], increment)
+
+    # The activity is now running: its completion will wake the workflow up,
+    # so the marker doesn't need a timer either.
+    decision_id = history.last_id
+    (history
+        .add_activity_task(increment,
+                           decision_id=decision_id,
+                           last_state='started',
+                           activity_id='activity-tests.data.activities.increment-1')
+        .add_decision_task_scheduled()
+        .add_decision_task_started())
+    decisions, _ = executor.replay(Response(history=history, execution=None))
+    assert decisions == [
+        {
+            'decisionType': 'RecordMarker',
+            'recordMarkerDecisionAttributes': {
+                'markerName': 'First marker'
+            }
+        },
+    ]
+
+
 class ATestDefinitionNonPythonicWorkflow(BaseTestWorkflow):
     def run(self, *args, **kwargs):
         task = NonPythonicActivityTask(non_pythonic, *args, **kwargs)
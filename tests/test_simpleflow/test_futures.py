@@ -38,3 +38,19 @@ def test_future_cancel():
     assert future.running is False
     assert future.cancelled
     assert future.done
+
+
+def test_future_set_finished_decode_lazily():
+    calls = []
+
+    def decode(raw):
+        calls.append(raw)
+        return int(raw)
+
+    future = Future()
+    future.set_finished('42', decode=decode)
+    assert future.finished
+    assert calls == []
+    assert future.result == 42
+    assert future.result == 42
+    assert calls == ['42']
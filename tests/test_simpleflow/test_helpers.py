@@ -1,9 +1,14 @@
 # See README for more informations about integration tests
+import shutil
+import tempfile
 import unittest
 
+from mock import patch
 from sure import expect
 
+from simpleflow import payload, settings
 from simpleflow.swf.helpers import find_activity
+from simpleflow.utils.json_tools import compress_value
 
 
 # some fake objects to test find_activity()
@@ -32,3 +37,21 @@ class TestSimpleflowSwfHelpers(unittest.TestCase):
     def test_find_activity_with_overriden_input(self):
         _, args, _, _ = find_activity(FakeHistory(), scheduled_id=5, input={"args": [4]})
         expect(args).to.equal([4])
+
+    def test_find_activity_with_offloaded_input(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        payload.set_store(payload.LocalPayloadStore(directory))
+        self.addCleanup(payload.set_store, None)
+        history = FakeHistory()
+        params = history.activities["activity-tests.integration.workflow.sleep-1"]
+        params["name"] = "tests.data.activities.increment"
+        with patch.object(settings, "COMPRESSION_CODEC", "zlib"), patch.object(settings, "COMPRESSION_THRESHOLD", 0):
+            params["input"] = payload.offload_value(
+                compress_value({"args": [payload.offload_value(41, threshold=0)], "kwargs": {}}),
+                threshold=0)
+        expect(list(params["input"].keys())).to.equal([payload.PAYLOAD_REFERENCE_KEY])
+
+        func, args, kwargs, _ = find_activity(history, scheduled_id=5)
+        expect(args).to.equal([41])
+        expect(func(*args, **kwargs)).to.equal(42)
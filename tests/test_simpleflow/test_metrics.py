@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+import swf.exceptions
+from swf.models import Domain
+from simpleflow import metrics, settings
+from simpleflow.compat import request
+from simpleflow.swf.process import Poller
+
+
+class FakePoller(Poller):
+    name = 'FakePoller'
+
+    def __init__(self, responses):
+        super(FakePoller, self).__init__(Domain("test-domain"), "test-task-list")
+        self.responses = list(responses)
+        self.nb_retries = 3
+
+    @property
+    def identity(self):
+        return 'test-identity'
+
+    def poll(self, task_list, identity=None):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def complete(self, token, response):
+        pass
+
+    def process(self, request):
+        pass
+
+    def fail(self, *args, **kwargs):
+        pass
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        metrics.registry.values.clear()
+        self.addCleanup(metrics.registry.values.clear)
+
+    def test_registry(self):
+        registry = metrics.Registry()
+        registry.inc('simpleflow_polls_empty_total', task_list='a')
+        registry.inc('simpleflow_polls_empty_total', 2, task_list='a')
+        registry.observe('simpleflow_decision_history_events', 50, workflow='w')
+        with patch('simpleflow.metrics.perf_counter', side_effect=[1, 3]):
+            with registry.time('simpleflow_poll_seconds', task_list='a'):
+                pass
+        other = metrics.Registry()
+        other.merge(json.loads(json.dumps(registry.to_dict())))
+        other.merge(registry.to_dict())
+        lines = other.format()
+        self.assertIn('simpleflow_polls_empty_total{task_list="a"} 6', lines)
+        self.assertIn('simpleflow_poll_seconds_sum{task_list="a"} 4', lines)
+        self.assertIn('simpleflow_decision_history_events_bucket{workflow="w",le="100"} 2', lines)
+
+    def test_registry_is_reset_after_fork(self):
+        registry = metrics.Registry()
+        registry.inc('simpleflow_polls_empty_total')
+        registry._pid = -1  # another process
+        self.assertEqual(registry.format(), [])
+
+    def test_registry_threads(self):
+        registry = metrics.Registry()
+
+        def work():
+            for _ in range(1000):
+                registry.inc('simpleflow_polls_empty_total', task_list='a')
+                registry.observe('simpleflow_poll_seconds', 0.1, task_list='a')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        lines = registry.format()
+        self.assertIn('simpleflow_polls_empty_total{task_list="a"} 8000', lines)
+        self.assertIn('simpleflow_poll_seconds_count{task_list="a"} 8000', lines)
+
+    def test_dump_and_aggregate(self):
+        metrics.registry.inc('simpleflow_retries_total', operation='poll')
+        with patch.object(settings, 'METRICS_DIRECTORY', self.directory):
+            metrics.dump(force=True)
+            metrics.registry.inc('simpleflow_retries_total', operation='poll')
+            metrics.dump()  # within METRICS_INTERVAL: skipped
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        # The current registry replaces the dump of this process
+        self.assertIn('simpleflow_retries_total{operation="poll"} 2',
+                      metrics.aggregate(self.directory).format())
+
+    def test_absorb(self):
+        child = metrics.Registry()
+        child.inc('simpleflow_swf_requests_total', api='RespondActivityTaskCompleted', outcome='ok')
+        for name in ('1234-abc.json', '12345-abc.json'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                json.dump(child.to_dict(), f)
+        with patch.object(settings, 'METRICS_DIRECTORY', self.directory):
+            metrics.absorb(1234)
+        own_dump = metrics._dump_filename
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(['12345-abc.json', own_dump]))
+        self.assertIn('simpleflow_swf_requests_total{api="RespondActivityTaskCompleted",outcome="ok"} 1',
+                      metrics.registry.format())
+        # Dumped right away, and not counted twice with the current registry
+        with open(os.path.join(self.directory, own_dump)) as f:
+            self.assertEqual(json.load(f), json.loads(json.dumps(metrics.registry.to_dict())))
+        self.assertIn('simpleflow_swf_requests_total{api="RespondActivityTaskCompleted",outcome="ok"} 2',
+                      metrics.aggregate(self.directory).format())
+
+    def test_absorb_dead(self):
+        child = metrics.Registry()
+        child.inc('simpleflow_polls_empty_total', task_list='a')
+        for name in ('1-abc.json', '2-abc.json'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                json.dump(child.to_dict(), f)
+        with patch.object(settings, 'METRICS_DIRECTORY', self.directory), \
+                patch('psutil.pid_exists', side_effect=lambda pid: pid == 1):
+            metrics.absorb_dead(self.directory)
+        self.assertIn('1-abc.json', os.listdir(self.directory))
+        self.assertNotIn('2-abc.json', os.listdir(self.directory))
+        self.assertIn('simpleflow_polls_empty_total{task_list="a"} 1', metrics.registry.format())
+
+    def test_gauges_merge(self):
+        registry = metrics.Registry()
+        registry.set('simpleflow_swf_rate_limit', 5, family='poll')
+        registry.set('simpleflow_supervised_processes', 2, supervisor='a')
+        other = metrics.Registry()
+        other.set('simpleflow_swf_rate_limit', 10, family='poll')
+        other.set('simpleflow_supervised_processes', 3, supervisor='a')
+        registry.merge(other.to_dict())
+        lines = registry.format()
+        self.assertIn('simpleflow_swf_rate_limit{family="poll"} 5', lines)
+        self.assertIn('simpleflow_supervised_processes{supervisor="a"} 3', lines)
+
+    def test_poll_metrics(self):
+        poller = FakePoller([
+            swf.exceptions.ResponseError('throttled'),
+            ('token', 'task'),
+            swf.exceptions.PollTimeout('timeout'),
+        ])
+        with patch('time.sleep'):
+            self.assertEqual(poller.poll_with_retry(), ('token', 'task'))
+        with self.assertRaises(swf.exceptions.PollTimeout):
+            poller.poll_with_retry()
+        lines = metrics.registry.format()
+        self.assertIn('simpleflow_retries_total{operation="poll"} 1', lines)
+        self.assertIn('simpleflow_polls_empty_total{task_list="test-task-list"} 1', lines)
+        self.assertIn('simpleflow_poll_seconds_count{task_list="test-task-list"} 2', lines)
+
+    def test_exporter(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        textfile = os.path.join(self.directory, 'simpleflow.prom')
+        exporter = metrics.Exporter(os.path.join(self.directory, 'supervisor'), port=port, textfile=textfile)
+        exporter.start()
+        self.addCleanup(metrics.set_directory, None)
+        try:
+            self.assertEqual(metrics.get_directory(), exporter.directory)
+            child = metrics.Registry()
+            child.inc('simpleflow_activity_tasks_total', activity_type='a', outcome='exited')
+            with open(os.path.join(exporter.directory, '1-child.json'), 'w') as f:
+                json.dump(child.to_dict(), f)
+            body = request.urlopen('http://127.0.0.1:{}/metrics'.format(port)).read().decode('utf-8')
+            self.assertIn('simpleflow_activity_tasks_total{activity_type="a",outcome="exited"} 1', body)
+        finally:
+            exporter.stop()
+        with open(textfile) as f:
+            self.assertIn('simpleflow_activity_tasks_total{activity_type="a",outcome="exited"} 1', f.read())
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto
+from mock import patch
+from moto import mock_s3
+
+from simpleflow import futures, payload, settings, workflow
+from simpleflow.activity import Activity
+from simpleflow.canvas import Broadcast, Group
+from simpleflow.local.executor import Executor as LocalExecutor
+from simpleflow.swf.task import ActivityTask
+from simpleflow.utils import json_dumps
+from .base import TestWorkflowMixin
+
+
+def double(x):
+    return x * 2
+
+
+def length(config, suffix):
+    return len(config["data"]) + len(suffix)
+
+
+class BroadcastWorkflow(workflow.Workflow):
+    name = 'test_workflow'
+    version = 'test_version'
+
+    def run(self):
+        config = Broadcast({"data": "a" * 1000})
+        future = self.submit(Group(*[
+            ActivityTask(Activity(length), config, "b" * i) for i in range(3)
+        ]))
+        futures.wait(future)
+        return future.result
+
+
+class ManyResultsWorkflow(workflow.Workflow):
+    name = 'test_workflow'
+    version = 'test_version'
+    task_list = 'test_task_list'
+    decision_tasks_timeout = 300
+    execution_timeout = 3600
+
+    def run(self):
+        results = [self.submit(ActivityTask(Activity(double), i)) for i in range(50)]
+        futures.wait(*results)
+        return len(results)
+
+
+class CountingStore(payload.LocalPayloadStore):
+    def __init__(self, directory):
+        super(CountingStore, self).__init__(directory)
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return super(CountingStore, self).get(key)
+
+
+class TestPayload(unittest.TestCase, TestWorkflowMixin):
+    WORKFLOW = ManyResultsWorkflow
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        payload.set_store(payload.LocalPayloadStore(self.directory))
+        self.patcher = patch.object(settings, 'PAYLOAD_THRESHOLD', 100)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        payload.set_store(None)
+        payload._fetched.clear()
+        shutil.rmtree(self.directory)
+
+    def test_small_payloads_are_kept(self):
+        data = json_dumps(["a" * 10])
+        self.assertEqual(payload.offload(data), data)
+        self.assertEqual(payload.offload_value(["a" * 10]), ["a" * 10])
+
+    def test_offload(self):
+        data = json_dumps(["a" * 1000])
+        reference = payload.offload(data)
+        self.assertTrue(payload.is_reference(reference))
+        self.assertLess(len(reference), 100)
+        self.assertEqual(payload.load(reference), data)
+        self.assertEqual(payload.loads_or_raw(reference), ["a" * 1000])
+        # Not references
+        self.assertEqual(payload.load(data), data)
+        self.assertEqual(payload.loads_or_raw('foo'), 'foo')
+
+    def test_offload_value(self):
+        value = {'args': ["a" * 1000], 'kwargs': {}}
+        reference = payload.offload_value(value)
+        self.assertEqual(list(reference.keys()), [payload.PAYLOAD_REFERENCE_KEY])
+        self.assertEqual(payload.resolve_value(reference), value)
+        self.assertEqual(payload.resolve_value(value), value)
+
+    def test_activity_task_input(self):
+        task = ActivityTask(Activity(double), "a" * 1000)
+        self.assertEqual(
+            payload.resolve_value(task.get_input()),
+            {'args': ["a" * 1000], 'kwargs': {}})
+
+    def test_disabled(self):
+        payload.set_store(None)
+        data = json_dumps(["a" * 1000])
+        self.assertEqual(payload.offload(data), data)
+
+    @mock_s3
+    def test_storage_store(self):
+        boto.connect_s3().create_bucket("payloads")
+        payload.set_store(payload.StoragePayloadStore("payloads", "prefix"))
+        reference = payload.offload(json_dumps(["a" * 1000]))
+        self.assertEqual(payload.loads_or_raw(reference), ["a" * 1000])
+
+    def test_broadcast(self):
+        config = Broadcast({"data": "a" * 1000})
+        inputs = [
+            json.loads(json_dumps(ActivityTask(Activity(length), config, "b" * i).get_input()))
+            for i in range(3)
+        ]
+        reference = inputs[0]["args"][0]
+        self.assertEqual(list(reference.keys()), [payload.PAYLOAD_REFERENCE_KEY])
+        self.assertEqual([i["args"][0] for i in inputs], [reference] * 3)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(payload.resolve_value(reference), {"data": "a" * 1000})
+
+    def test_small_broadcast_is_kept(self):
+        config = Broadcast({"data": "a" * 10})
+        task_input = json.loads(json_dumps(ActivityTask(Activity(length), config, "b").get_input()))
+        self.assertEqual(task_input["args"][0], {"data": "a" * 10})
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_broadcast_local_executor(self):
+        self.assertEqual(LocalExecutor(BroadcastWorkflow).run(), [1000, 1001, 1002])
+
+    def test_broadcast_local_executor_activity(self):
+        class MyWorkflow(BroadcastWorkflow):
+            def run(self):
+                return self.submit(Activity(length), Broadcast({"data": "a" * 10}), suffix="b").result
+
+        self.assertEqual(LocalExecutor(MyWorkflow).run(), 11)
+
+    def test_broadcast_stored_once(self):
+        with patch.object(payload.LocalPayloadStore, 'put') as put:
+            for _ in range(2):
+                # e.g. one Broadcast per decision
+                config = Broadcast({"data": "a" * 1000})
+                json_dumps([config, config])
+        self.assertEqual(put.call_count, 1)
+
+    def test_replay_many_offloaded_results(self):
+        store = CountingStore(self.directory)
+        payload.set_store(store)
+        self.build_history({})
+        decisions = self.replay()
+        while decisions[0]['decisionType'] == 'ScheduleActivityTask':
+            for decision in decisions:
+                if decision['decisionType'] != 'ScheduleActivityTask':
+                    continue
+                result = ["result {}".format(len(self.history.events))] * 100
+                self.add_activity_task_from_decision(decision, Activity(double), payload.offload_value(result))
+            self.history.add_decision_task_scheduled().add_decision_task_started()
+            decisions = self.replay()
+
+        self.assertEqual(decisions[0]['decisionType'], 'CompleteWorkflowExecution')
+        self.assertEqual(self.replay()[0]['decisionType'], 'CompleteWorkflowExecution')
+        # Each result is downloaded once, not on every decision
+        self.assertEqual(store.gets, 50)
@@ -1,4 +1,6 @@
 import json
+import shutil
+import tempfile
 import unittest
 
 from mock import patch
@@ -6,17 +8,21 @@ from moto import mock_swf, mock_s3
 import boto
 
 from simpleflow.activity import with_attributes
-from simpleflow import workflow, task, storage, step, futures
+from simpleflow import workflow, task, storage, futures, settings
 from simpleflow.constants import MINUTE, HOUR
 from simpleflow.step.submittable import Step
 from simpleflow.step.workflow import WorkflowStepMixin
-from simpleflow.step.tasks import GetStepsDoneTask, MarkStepDoneTask
+from simpleflow.local.executor import Executor as LocalExecutor
+from simpleflow.marker import Marker
+from simpleflow.step.tasks import GetStepsDoneTask, MarkStepDoneTask, MarkStepsDoneTask
 from simpleflow.step.utils import (
-    should_force_step,
+    StepRules,
     get_step_force_reasons,
+    should_force_step,
     step_will_run
 )
 from simpleflow.step.constants import UNKNOWN_CONTEXT
+from simpleflow.utils.json_tools import compress
 from .base import TestWorkflowMixin
 
 
@@ -71,6 +77,16 @@ class StepTestCase(unittest.TestCase, TestWorkflowMixin):
         res = t.execute()
         self.assertEquals(res, ["mystep", "mystep2"])
 
+    def test_get_steps_done_local_storage(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        bucket = "file://" + directory
+        MarkStepDoneTask(bucket, "steps", "mystep").execute()
+        MarkStepsDoneTask(bucket, "steps", ["mystep2", "mystep3"]).execute()
+        self.assertEquals(
+            GetStepsDoneTask(bucket, "steps").execute(),
+            ["mystep", "mystep2", "mystep3"])
+
     @mock_s3
     def test_mark_step_done(self):
         self.create_bucket()
@@ -80,6 +96,77 @@ class StepTestCase(unittest.TestCase, TestWorkflowMixin):
             storage.pull_content(BUCKET, "steps/mystep"),
             json.dumps(UNKNOWN_CONTEXT))
 
+    @mock_s3
+    def test_mark_steps_done(self):
+        self.create_bucket()
+        t = MarkStepsDoneTask(BUCKET, "steps/", ["mystep", "mystep2"])
+        t.execute()
+        for step_name in ("mystep", "mystep2"):
+            self.assertEquals(
+                storage.pull_content(BUCKET, "steps/" + step_name),
+                json.dumps(UNKNOWN_CONTEXT))
+
+    @mock_s3
+    def test_steps_done_written_before_completion(self):
+        self.conn = boto.connect_s3()
+        self.conn.create_bucket("step_bucket")
+        LocalExecutor(MyWorkflow).run({"args": [2]})
+        self.assertEquals(
+            GetStepsDoneTask("s3.amazonaws.com/step_bucket", "local/steps").execute(),
+            ["my_step"])
+
+    def test_steps_done_local_storage(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for bucket in ("file://" + directory, "memory://steps"):
+            with patch.object(settings, "STEP_BUCKET", bucket):
+                self.assertEquals(MyWorkflow(None).get_step_bucket(), bucket)
+                LocalExecutor(MyWorkflow).run({"args": [2]})
+            self.assertEquals(GetStepsDoneTask(bucket, "local/steps").execute(), ["my_step"])
+
+    @mock_s3
+    def test_steps_done_written_before_failure(self):
+        self.conn = boto.connect_s3()
+        self.conn.create_bucket("step_bucket")
+
+        class MyFailingWorkflow(MyWorkflow):
+            def run(self, num):
+                futures.wait(self.submit(Step('my_step', task.ActivityTask(MyTask, num))))
+                raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            LocalExecutor(MyFailingWorkflow).run({"args": [2]})
+        self.assertEquals(
+            GetStepsDoneTask("s3.amazonaws.com/step_bucket", "local/steps").execute(),
+            ["my_step"])
+
+    def test_steps_completed_from_recorded_markers(self):
+        wf = WorkflowStepMixin()
+        wf.list_markers = lambda all: [
+            Marker('log.step', {'step': 'a', 'status': 'completed'}),
+            Marker('log.step', {'step': 'b', 'status': 'scheduled'}),
+            Marker('log.step', {'step': 'c', 'status': 'completed'}, state='failed'),
+            Marker('log.step', None, state='failed'),
+            Marker('other', {'step': 'd', 'status': 'completed'}),
+        ]
+        self.assertEquals(wf._get_steps_completed(), ['a'])
+
+    def test_mark_steps_done_always_idempotent(self):
+        class NonIdempotentWorkflow(MyWorkflow):
+            def get_step_activity_params(self):
+                return {'idempotent': False}
+
+        wf = NonIdempotentWorkflow(LocalExecutor(NonIdempotentWorkflow))
+        self.assertFalse(wf.get_steps_done_activity().activity.idempotent)
+        self.assertTrue(wf.get_mark_steps_done_activity(['a']).activity.idempotent)
+
+    def test_mark_steps_done_step_names(self):
+        input = {'args': ['bucket', 'steps', ['a', 'b']], 'kwargs': {}}
+        self.assertEquals(WorkflowStepMixin._get_mark_steps_done_step_names(input), ['a', 'b'])
+        with patch.object(settings, 'COMPRESSION_THRESHOLD', 0):
+            compressed = compress(json.dumps(input), 'zlib')
+        self.assertEquals(WorkflowStepMixin._get_mark_steps_done_step_names(compressed), ['a', 'b'])
+
     @mock_s3
     @mock_swf
     def _test_first_run(self):
@@ -230,6 +317,76 @@ class StepTestCase(unittest.TestCase, TestWorkflowMixin):
         self.assertEquals(
             sorted(get_step_force_reasons(step_name, reasons)),
             ["MY_REASON", "MY_ROOT_REASON"])
+        self.assertEquals(
+            sorted(StepRules(["a", "a.b", "a.c"], reasons).get_reasons(step_name)),
+            ["MY_REASON", "MY_ROOT_REASON"])
+
+    def test_step_rules_maintained(self):
+        wf = WorkflowStepMixin()
+        wf.add_forced_steps(["a.b"], "MY_REASON")
+        rules = wf.get_forced_step_rules()
+        self.assertTrue(rules.match("a.b.c"))
+        with patch('simpleflow.step.workflow.StepRules') as step_rules:
+            wf.add_forced_steps(["c"], "OTHER_REASON")
+            self.assertIs(wf.get_forced_step_rules(), rules)
+        self.assertEquals(step_rules.call_count, 0)
+        self.assertEquals(rules.get_reasons("c.d"), ["OTHER_REASON"])
+        # Rebuilt when the steps are assigned
+        wf.steps_forced = {"d"}
+        self.assertTrue(wf.get_forced_step_rules().match("d"))
+        self.assertFalse(wf.get_forced_step_rules().match("c"))
+
+    def test_step_rules_overridden(self):
+        class MyStepWorkflow(WorkflowStepMixin):
+            skipped = ["a"]
+
+            def get_skipped_steps(self):
+                return self.skipped
+
+        wf = MyStepWorkflow()
+        rules = wf.get_skipped_step_rules()
+        self.assertIs(wf.get_skipped_step_rules(), rules)
+        wf.skipped = ["b"]
+        self.assertTrue(wf.get_skipped_step_rules().match("b"))
+        self.assertFalse(wf.get_skipped_step_rules().match("a"))
+
+    @mock_s3
+    def test_overridden_skipped_steps(self):
+        self.conn = boto.connect_s3()
+        self.conn.create_bucket("step_bucket")
+
+        class MySkippingWorkflow(MyWorkflow):
+            def get_skipped_steps(self):
+                return ["my_step"]
+
+        executor = LocalExecutor(MySkippingWorkflow)
+        executor.run({"args": [2]})
+        self.assertEquals(
+            executor.list_markers()[0].details,
+            {"status": "skipped", "forced": True, "step": "my_step", "reasons": []})
+
+    def test_step_rules(self):
+        rules = StepRules()
+        self.assertFalse(rules.match("a.b.c"))
+
+        rules.add("a.b", "MY_REASON")
+        rules.add("a", "MY_ROOT_REASON")
+        rules.add("a.b.cd")
+        self.assertTrue(rules.match("a.b.c"))
+        self.assertTrue(rules.match("a.b"))
+        self.assertTrue(should_force_step("a.c", rules))
+        self.assertFalse(rules.match("b.a"))
+        self.assertFalse(rules.match("ab"))
+        self.assertEquals(
+            sorted(rules.get_reasons("a.b.c")),
+            ["MY_REASON", "MY_ROOT_REASON"])
+        self.assertEquals(rules.get_reasons("a.c"), ["MY_ROOT_REASON"])
+
+        rules.add("*", "ALL")
+        self.assertTrue(rules.match("b.a"))
+        self.assertEquals(rules.get_reasons("b.a"), ["ALL"])
+
+        self.assertFalse(step_will_run("a.b.c", StepRules(), rules, []))
 
     def test_step_will_run_skipped(self):
         step_name = "a.b.c"
@@ -1,10 +1,16 @@
+import hashlib
 import os
+import shutil
 import unittest
 import tempfile
+import threading
+import time
 import boto
+from mock import patch
 from moto import mock_s3
 
 from simpleflow import storage, settings
+from simpleflow.utils.files import file_lock
 
 
 class TestGroup(unittest.TestCase):
@@ -67,6 +73,174 @@ class TestGroup(unittest.TestCase):
         keys = [k for k in storage.list_keys(self.bucket, None)]
         self.assertEquals(keys[0].key, "mykey.txt")
 
+    @mock_s3
+    def test_pull_cache(self):
+        self.create()
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        storage.push(self.bucket, "mykey.txt", self.tmp_filename)
+        with patch.object(settings, 'STORAGE_CACHE_DIRECTORY', cache_directory):
+            self.assertEquals(storage.pull_content(self.bucket, "mykey.txt"), "42")
+            with patch('boto.s3.key.Key.get_contents_to_file') as get_contents:
+                self.assertEquals(storage.pull_content(self.bucket, "mykey.txt"), "42")
+                dest_tmp_filename = tempfile.mktemp()
+                storage.pull(self.bucket, "mykey.txt", dest_tmp_filename)
+                with open(dest_tmp_filename) as f:
+                    self.assertEquals(f.read(), "42")
+                os.remove(dest_tmp_filename)
+                self.assertEquals(storage.pull_mmap(self.bucket, "mykey.txt")[:], b"42")
+            self.assertEquals(get_contents.call_count, 0)
+
+            # New ETag
+            storage.push_content(self.bucket, "mykey.txt", "43")
+            self.assertEquals(storage.pull_content(self.bucket, "mykey.txt"), "43")
+
+    @mock_s3
+    def test_pull_cache_eviction(self):
+        self.create()
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        with patch.object(settings, 'STORAGE_CACHE_DIRECTORY', cache_directory), \
+                patch.object(settings, 'STORAGE_CACHE_MAX_SIZE', 15):
+            for i in range(3):
+                storage.push_content(self.bucket, "key{}".format(i), "x" * 5 + str(i))
+                storage.pull_content(self.bucket, "key{}".format(i))
+            files = [name for name in os.listdir(cache_directory)
+                     if not name.startswith('.') and not name.endswith('.lock')]
+            self.assertEquals(len(files), 2)
+
+    @mock_s3
+    def test_pull_cache_oversized_key(self):
+        self.create()
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        storage.push_content(self.bucket, "big", "x" * 20)
+        with patch.object(settings, 'STORAGE_CACHE_DIRECTORY', cache_directory), \
+                patch.object(settings, 'STORAGE_CACHE_MAX_SIZE', 15):
+            self.assertEquals(storage.pull_content(self.bucket, "big"), "x" * 20)
+            self.assertEquals(storage.pull_mmap(self.bucket, "big")[:], b"x" * 20)
+            dest_tmp_filename = tempfile.mktemp()
+            self.addCleanup(os.remove, dest_tmp_filename)
+            storage.pull(self.bucket, "big", dest_tmp_filename)
+            with open(dest_tmp_filename) as f:
+                self.assertEquals(f.read(), "x" * 20)
+        self.assertEquals(os.listdir(cache_directory), [])
+
+    def test_evict_cache_skips_entries_in_use(self):
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        paths = [os.path.join(cache_directory, name) for name in "abc"]
+        for i, path in enumerate(paths):
+            with open(path, "w") as f:
+                f.write("x" * 10)
+            os.utime(path, (i, i))
+        with file_lock(paths[0], shared=True):
+            # a: in use, b: kept
+            storage._evict_cache(cache_directory, 10, keep=paths[1])
+        self.assertEquals(sorted(os.listdir(cache_directory)), ["a", "a.lock", "b"])
+
+    @mock_s3
+    def test_pull_cache_entry_in_use(self):
+        self.create()
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        for i in range(3):
+            storage.push_content(self.bucket, "key{}".format(i), "x" * 5 + str(i))
+        with patch.object(settings, 'STORAGE_CACHE_DIRECTORY', cache_directory), \
+                patch.object(settings, 'STORAGE_CACHE_MAX_SIZE', 6):
+            with storage._cached_file(storage.get_bucket(self.bucket).get_key("key0")) as path:
+                storage.pull_content(self.bucket, "key1")
+                storage.pull_content(self.bucket, "key2")
+                with open(path) as f:
+                    self.assertEquals(f.read(), "xxxxx0")
+
+    @mock_s3
+    def test_connection_and_bucket_are_cached(self):
+        self.create()
+        storage._caches_pid = None  # start with empty caches
+        make_request = boto.s3.connection.S3Connection.make_request
+        with patch('boto.s3.connection.S3Connection.make_request',
+                   side_effect=make_request, autospec=True) as mock:
+            storage.push_content(self.bucket, "mykey.txt", "Hey Jude")
+            # get_bucket() HEAD + PUT
+            self.assertEquals(mock.call_count, 2)
+            for _ in range(3):
+                self.assertEquals(storage.pull_content(self.bucket, "mykey.txt"), "Hey Jude")
+            # get_key() HEAD + GET for each pull, no more get_bucket()
+            self.assertEquals(mock.call_count, 2 + 3 * 2)
+            self.assertEquals([m[0][1] for m in mock.call_args_list[:2]], ["HEAD", "PUT"])
+        self.assertEquals(len(storage.CONNECTION_CACHE), 1)
+        self.assertEquals(list(storage.BUCKET_CACHE), [(settings.SIMPLEFLOW_S3_HOST, self.bucket)])
+
+    @mock_s3
+    def test_multipart_push_and_pull(self):
+        self.create()
+        part_size = 5 * 1024 ** 2
+        content = os.urandom(1024) * (2 * part_size // 1024 + 100)
+        src_filename = tempfile.mktemp()
+        dest_filename = tempfile.mktemp()
+        self.addCleanup(os.remove, src_filename)
+        self.addCleanup(os.remove, dest_filename)
+        with open(src_filename, "wb") as f:
+            f.write(content)
+        # The S3 mock isn't thread-safe
+        with patch.object(settings, 'STORAGE_PART_SIZE', part_size), \
+                patch.object(settings, 'STORAGE_THREADS', 1):
+            with patch('boto.s3.key.Key.set_contents_from_filename') as set_contents:
+                storage.push(self.bucket, "big", src_filename)
+            self.assertEquals(set_contents.call_count, 0)
+            key = self.conn.get_bucket(self.bucket).get_key("big")
+            self.assertTrue(key.etag.strip('"').endswith("-3"))
+
+            with patch('boto.s3.key.Key.get_contents_as_string',
+                       side_effect=boto.s3.key.Key.get_contents_as_string,
+                       autospec=True) as get_contents:
+                storage.pull(self.bucket, "big", dest_filename)
+            self.assertEquals(get_contents.call_count, 3)
+        with open(dest_filename, "rb") as f:
+            self.assertEquals(f.read(), content)
+
+    def test_map(self):
+        threads = set()
+
+        def square(x):
+            threads.add(threading.current_thread())
+            time.sleep(0.01)
+            return x * x
+
+        self.assertEquals(storage._map(square, range(10), threads=4), [x * x for x in range(10)])
+        self.assertGreater(len(threads), 1)
+        with self.assertRaises(ZeroDivisionError):
+            storage._map(lambda x: 1 // x, range(10), threads=4)
+
+    def test_multipart_etag(self):
+        digests = [hashlib.md5(b"a").digest(), hashlib.md5(b"b").digest()]
+        self.assertEquals(
+            storage._multipart_etag(digests),
+            hashlib.md5(b"".join(digests)).hexdigest() + "-2")
+
+    @mock_s3
+    @patch.object(settings, 'STORAGE_THREADS', 1)
+    def test_push_many_and_pull_many(self):
+        self.create()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage.push_many(self.bucket, [("key{}".format(i), self.tmp_filename) for i in range(5)])
+        items = [("key{}".format(i), os.path.join(directory, str(i))) for i in range(5)]
+        storage.pull_many(self.bucket, items)
+        for _, dest_filename in items:
+            with open(dest_filename) as f:
+                self.assertEquals(f.read(), "42")
+
+    def test_caches_are_reset_after_fork(self):
+        self.addCleanup(setattr, storage, '_caches_pid', None)
+        storage.CONNECTION_CACHE["host"] = "connection"
+        storage._caches_pid = -1  # another process
+        with patch.object(storage.connection, 'S3Connection') as mock:
+            storage.get_connection("host")
+        self.assertEquals(mock.call_count, 1)
+        self.assertEquals(storage.CONNECTION_CACHE, {"host": mock.return_value})
+
     def test_sanitize_bucket_and_host(self):
         self.assertEquals(
             storage.sanitize_bucket_and_host('mybucket'),
@@ -78,3 +252,58 @@ class TestGroup(unittest.TestCase):
             storage.sanitize_bucket_and_host('any/mybucket')
         with self.assertRaises(ValueError):
             storage.sanitize_bucket_and_host('s3-eu-west-1.amazonaws.com/mybucket/subpath')
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(storage.MemoryBackend.stores.clear)
+
+    def check_backend(self, bucket):
+        storage.push_content(bucket, "steps/mystep", "42")
+        storage.push_content(bucket, "steps/sub/mystep2", u"é")
+        storage.push_content(bucket, "stepsbis", "1")
+        src_filename = os.path.join(self.directory, "src")
+        with open(src_filename, "w") as f:
+            f.write("file")
+        storage.push(bucket, "files/file", src_filename)
+
+        self.assertEquals(storage.pull_content(bucket, "steps/mystep"), "42")
+        self.assertEquals(storage.pull_content(bucket, "steps/sub/mystep2"), u"é")
+        self.assertEquals(storage.pull_contents(bucket, ["stepsbis", "steps/mystep"]), ["1", "42"])
+        dest_filename = os.path.join(self.directory, "dest")
+        storage.pull(bucket, "files/file", dest_filename)
+        with open(dest_filename) as f:
+            self.assertEquals(f.read(), "file")
+
+        self.assertEquals(
+            [key.name for key in storage.list_keys(bucket, "steps/")],
+            ["steps/mystep", "steps/sub/mystep2"])
+        self.assertEquals(
+            [key.name for key in storage.list_keys(bucket, "steps")],
+            ["steps/mystep", "steps/sub/mystep2", "stepsbis"])
+        self.assertEquals(len(list(storage.list_keys(bucket))), 4)
+        self.assertEquals(storage.stat(bucket, "steps/sub/mystep2"), ("steps/sub/mystep2", 2))
+        self.assertIsNone(storage.stat(bucket, "steps/unknown"))
+
+    def test_local_backend(self):
+        bucket = "file://" + os.path.join(self.directory, "bucket")
+        self.check_backend(bucket)
+        self.assertEquals(storage.pull_mmap(bucket, "steps/mystep")[:], b"42")
+
+    def test_memory_backend(self):
+        self.check_backend("memory://bucket")
+        self.assertEquals(storage.pull_content("memory://bucket", "stepsbis"), "1")
+        self.assertEquals(storage.list_keys("memory://other"), [])
+
+    @mock_s3
+    def test_s3_backend(self):
+        boto.connect_s3().create_bucket("bucket")
+        self.check_backend("s3://bucket")
+        self.assertEquals(storage.pull_content("bucket", "stepsbis"), "1")
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            storage.get_backend("ftp://bucket")
@@ -31,3 +31,19 @@ def test_task_register():
     _registry = registry.registry[None]
     assert _registry['tests.test_simpleflow.test_task.double'] == double
     assert _registry['tests.test_simpleflow.test_task.Double'] == Double
+
+
+def test_task_keeps_references_to_arguments():
+    big = {'urls': ['http://example.com/{}'.format(i) for i in range(10)]}
+    a_task = task.ActivityTask(double, big, context={'foo': 'bar'}, val=big)
+    assert a_task._args[0] is big
+    assert a_task._kwargs['val'] is big
+    assert a_task.args[0] is big
+    assert a_task.kwargs == {'val': big}
+    assert a_task.context == {'foo': 'bar'}
+
+    from simpleflow.swf.task import ActivityTask
+    swf_task = ActivityTask.from_generic_task(a_task)
+    assert swf_task.args[0] is big
+    assert swf_task.kwargs['val'] is big
+    assert swf_task.context == {'foo': 'bar'}
@@ -0,0 +1,68 @@
+import unittest
+
+from mock import patch
+
+from simpleflow import settings
+from simpleflow.swf.task import ActivityTask
+from simpleflow.activity import Activity
+from simpleflow.utils import json_dumps, json_loads_or_raw
+from simpleflow.utils.json_tools import (
+    COMPRESSION_CODECS,
+    compress,
+    compress_value,
+    decompress,
+    decompress_value,
+)
+
+
+def double(x):
+    return x * 2
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.data = json_dumps({"urls": ["http://example.com/{}".format(i) for i in range(100)]})
+
+    def test_compress(self):
+        for codec in COMPRESSION_CODECS:
+            compressed = compress(self.data, codec)
+            self.assertLess(len(compressed), len(self.data) / 2)
+            self.assertEqual(decompress(compressed), self.data)
+            self.assertEqual(json_loads_or_raw(compressed), json_loads_or_raw(self.data))
+
+    def test_disabled_by_default(self):
+        self.assertIs(compress(self.data), self.data)
+        value = {"foo": "bar"}
+        self.assertIs(compress_value(value), value)
+
+    def test_small_strings_are_kept(self):
+        self.assertEqual(compress('"foo"', 'zlib'), '"foo"')
+
+    def test_plain_data(self):
+        self.assertEqual(decompress(self.data), self.data)
+        self.assertEqual(decompress("!foo"), "!foo")
+        self.assertEqual(decompress_value({"foo": "bar"}), {"foo": "bar"})
+        self.assertEqual(json_loads_or_raw("!foo"), "!foo")
+
+    def test_raw_strings_with_codec_prefix(self):
+        for data in ("!z:not base64!", "!z:Zm9v", "!x:Zm9v", "!z:" + compress(self.data, 'zlib')[3:-4]):
+            self.assertEqual(decompress(data), data)
+            self.assertEqual(decompress_value(data), data)
+            self.assertEqual(json_loads_or_raw(data), data)
+
+    @patch.object(settings, 'COMPRESSION_CODEC', 'zlib')
+    def test_compress_value(self):
+        value = json_loads_or_raw(self.data)
+        compressed = compress_value(value)
+        self.assertTrue(compressed.startswith('!z:'))
+        self.assertEqual(decompress_value(compressed), value)
+
+    @patch.object(settings, 'COMPRESSION_CODEC', 'zlib')
+    def test_activity_task_input(self):
+        urls = ["http://example.com/{}".format(i) for i in range(100)]
+        input = ActivityTask(Activity(double), urls).get_input()
+        self.assertEqual(decompress_value(input), {"args": [urls], "kwargs": {}})
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            compress(self.data, 'foo')
@@ -1,10 +1,13 @@
 import datetime
+import json
 import unittest
+import uuid
 
 import pytz
+from mock import patch
 from simpleflow.exceptions import ExecutionBlocked
 from simpleflow.futures import Future
-from simpleflow.utils import json_dumps
+from simpleflow.utils import json_dumps, json_loads_or_raw, json_tools
 
 
 class TestJsonDumps(unittest.TestCase):
@@ -66,5 +69,109 @@ class TestJsonDumps(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+class TestJsonBackends(unittest.TestCase):
+    def setUp(self):
+        self.backend = json_tools.json_backend
+
+    def tearDown(self):
+        json_tools.set_json_backend(self.backend)
+
+    def get_backends(self):
+        backends = []
+        for name, _ in json_tools.JSON_BACKENDS:
+            try:
+                json_tools.set_json_backend(name)
+            except ImportError:
+                continue
+            backends.append(name)
+        return backends
+
+    def test_same_encoding(self):
+        resolved = Future()
+        resolved.set_finished("foo")
+        cases = [
+            [{'a': [1, 2.5, None, True], 'b': (1, 2)}, '{"a":[1,2.5,null,true],"b":[1,2]}'],
+            [datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC), '"1970-01-01T00:00:00Z"'],
+            [datetime.datetime(1970, 1, 1, 1, 2, 3, 456789), '"1970-01-01T01:02:03.456"'],
+            [datetime.date(1970, 1, 1), '"1970-01-01"'],
+            [datetime.time(1, 2, 3, 456789), '"01:02:03.456"'],
+            [uuid.UUID(int=1), '"00000000-0000-0000-0000-000000000001"'],
+            [resolved, '"foo"'],
+            [2 ** 70, '1180591620717411303424'],
+        ]
+        for backend in self.get_backends():
+            json_tools.set_json_backend(backend)
+            for obj, expected in cases:
+                self.assertEqual(json_loads_or_raw(json_dumps(obj)), json_loads_or_raw(expected), backend)
+            self.assertEqual(json_dumps(i for i in range(3)), '[0,1,2]', backend)
+            with self.assertRaises(ExecutionBlocked):
+                json_dumps([Future()])
+
+    def test_fallback_runs_hooks_once(self):
+        class Counted(object):
+            calls = 0
+
+            def __json__(self):
+                Counted.calls += 1
+                return "x"
+
+        for backend in self.get_backends():
+            json_tools.set_json_backend(backend)
+            Counted.calls = 0
+            # The big integer makes some backends fall back on the standard library
+            obj = [(i for i in range(3)), Counted(), 2 ** 70]
+            self.assertEqual(json_dumps(obj), '[[0,1,2],"x",1180591620717411303424]', backend)
+            self.assertEqual(Counted.calls, 1, backend)
+
+    def test_hook_errors_propagate(self):
+        class Failing(object):
+            def __json__(self):
+                raise TypeError("boom")
+
+        for backend in self.get_backends():
+            json_tools.set_json_backend(backend)
+            with patch.object(json, 'dumps', wraps=json.dumps) as stdlib_dumps:
+                with self.assertRaises(TypeError) as context:
+                    json_dumps([Failing()])
+            self.assertEqual(str(context.exception), "boom", backend)
+            if json_tools._backend_dumps is not None:
+                self.assertEqual(stdlib_dumps.call_count, 0, backend)
+
+    def test_same_output_as_stdlib(self):
+        cases = [
+            float('nan'),
+            [float('inf'), float('-inf')],
+            1e16,
+            {'x': 1e-7},
+            u'\xe9t\xe9 \u2603 \U0001f600',
+            {u'cl\xe9': u'http://example.com/\xe9'},
+        ]
+        for backend in self.get_backends():
+            json_tools.set_json_backend(backend)
+            for obj in cases:
+                self.assertEqual(json_dumps(obj), json.dumps(obj, separators=(',', ':')), backend)
+
+    def test_backend_not_dumping_like_stdlib(self):
+        def get_backend():
+            return (lambda obj: 'null' if obj != obj else json.dumps(obj, separators=(',', ':'))), json.loads
+
+        with patch.object(json_tools, 'JSON_BACKENDS', (('fake', get_backend),)):
+            self.assertEqual(json_tools.set_json_backend(), 'fake')
+        self.assertIsNone(json_tools._backend_dumps)
+        self.assertEqual(json_dumps(float('nan')), 'NaN')
+        self.assertEqual(json_loads_or_raw('[1]'), [1])
+
+    def test_same_decoding(self):
+        for backend in self.get_backends():
+            json_tools.set_json_backend(backend)
+            self.assertEqual(json_loads_or_raw('{"a":[1,2.5,null]}'), {"a": [1, 2.5, None]}, backend)
+            self.assertEqual(json_loads_or_raw('foo'), 'foo', backend)
+            self.assertEqual(json_loads_or_raw(''), None, backend)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            json_tools.set_json_backend('foo')
+
+
 if __name__ == '__main__':
     unittest.main()
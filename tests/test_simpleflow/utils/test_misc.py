@@ -1,6 +1,6 @@
 import unittest
 
-from simpleflow.utils import format_exc
+from simpleflow.utils import LRUCache, format_exc
 
 
 class MyTestCase(unittest.TestCase):
@@ -12,6 +12,32 @@ class MyTestCase(unittest.TestCase):
             line = format_exc(e)
         self.assertEqual("KeyError: 1", line)
 
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.set('c', 3)  # evicts 'b', least recently used
+        self.assertNotIn('b', cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(2, len(cache))
+
+    def test_lru_cache_max_weight(self):
+        cache = LRUCache(maxsize=None, max_weight=10)
+        cache.set('a', 'x' * 4)
+        cache.set('b', 'x' * 4)
+        cache.get('a')
+        cache.set('c', 'x' * 4)  # evicts 'b', least recently used
+        self.assertEqual(['a', 'c'], sorted(cache._data))
+        self.assertEqual(8, cache.weight)
+        cache.set('d', 'x' * 11)  # too large to be cached
+        self.assertNotIn('d', cache)
+        self.assertEqual(8, cache.weight)
+        cache.clear()
+        self.assertEqual(0, cache.weight)
+
 
 if __name__ == '__main__':
     unittest.main()
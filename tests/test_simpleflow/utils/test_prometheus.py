@@ -0,0 +1,33 @@
+import unittest
+
+from simpleflow.utils import prometheus
+
+
+class TestPrometheus(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = prometheus.Histogram((1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEquals(histogram.counts, [2, 1, 1])
+        self.assertEquals(histogram.count, 4)
+        self.assertEquals(histogram.sum, 14.5)
+        histogram.merge(prometheus.Histogram.from_dict(histogram.to_dict(), (1, 5)))
+        self.assertEquals(histogram.counts, [4, 2, 2])
+
+    def test_format_metric(self):
+        histogram = prometheus.Histogram((1,))
+        histogram.observe(0.5)
+        self.assertEquals(
+            prometheus.format_metric('duration', 'histogram', 'Duration.', [((('type', 'a"b'),), histogram)]),
+            [
+                '# HELP duration Duration.',
+                '# TYPE duration histogram',
+                'duration_bucket{type="a\\"b",le="1"} 1',
+                'duration_bucket{type="a\\"b",le="+Inf"} 1',
+                'duration_sum{type="a\\"b"} 0.5',
+                'duration_count{type="a\\"b"} 1',
+            ])
+        self.assertEquals(
+            prometheus.format_metric('total', 'counter', 'Total.', [((), 3)])[2:],
+            ['total 3'])
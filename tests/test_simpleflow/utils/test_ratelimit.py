@@ -0,0 +1,59 @@
+import unittest
+
+from mock import patch
+
+from simpleflow.utils.ratelimit import TokenBucket
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch('simpleflow.utils.ratelimit.perf_counter', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEquals([bucket.reserve() for _ in range(4)], [0, 0, 0.1, 0.2])
+        self.clock.now = 1.0
+        # 10 tokens refilled, minus the 2 borrowed, capped by the burst
+        self.assertEquals(bucket.reserve(), 0)
+        self.assertEquals(bucket.tokens, 1)
+
+    def test_aimd(self):
+        bucket = TokenBucket(10, increase=2)
+        bucket.throttled()
+        self.assertEquals(bucket.rate, 5)
+        self.assertEquals(bucket.tokens, 0)
+        bucket.throttled()
+        self.assertEquals(bucket.rate, 2.5)
+        self.assertAlmostEqual(bucket.reserve(), 0.4)
+        # Linear recovery
+        self.clock.now = 1.0
+        bucket.reserve()
+        self.assertEquals(bucket.rate, 4.5)
+        self.clock.now = 10.0
+        bucket.reserve()
+        self.assertEquals(bucket.rate, 10)
+
+    def test_min_rate(self):
+        bucket = TokenBucket(10, min_rate=4)
+        for _ in range(5):
+            bucket.throttled()
+        self.assertEquals(bucket.rate, 4)
+
+    def test_acquire_sleeps(self):
+        bucket = TokenBucket(2, burst=1)
+        with patch('time.sleep') as sleep:
+            self.assertEquals(bucket.acquire(), 0)
+            self.assertEquals(bucket.acquire(), 0.5)
+        sleep.assert_called_once_with(0.5)
@@ -4,7 +4,15 @@ from time import time
 
 from flaky import flaky
 
-from simpleflow.utils.retry import with_delay, constant, exponential
+from simpleflow.utils.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    constant,
+    decorrelated_jitter,
+    exponential,
+    with_delay,
+)
 
 
 error_epsilon = 0.01  # tolerate an error of 0.01%
@@ -101,3 +109,93 @@ class TestRetry(unittest.TestCase):
                 func()
 
         self.assertEquals(callable.count, max_count)
+
+
+class TestRetryLimits(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('time.sleep', self.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_no_sleep_when_retry_denied(self):
+        callable = DummyCallableRaises(ValueError('test'))
+        budget = RetryBudget(ratio=0, min_retries=0)
+        with self.assertRaises(ValueError):
+            with_delay(nb_times=3, delay=constant(1), budget=budget)(callable)()
+        self.assertEquals(callable.count, 1)
+        self.assertEquals(self.now, 1000)
+        with self.assertRaises(ValueError):
+            with_delay(nb_times=3, delay=constant(1), max_elapsed=0.5)(callable)()
+        self.assertEquals(self.now, 1000)
+
+    def test_max_elapsed(self):
+        callable = DummyCallableRaises(ValueError('test'))
+        with self.assertRaises(ValueError):
+            with_delay(nb_times=10, delay=constant(2), max_elapsed=5)(callable)()
+        # Attempts at 0, 2 and 4 seconds; the next one would start at 6
+        self.assertEquals(callable.count, 3)
+
+    def test_decorrelated_jitter(self):
+        delay = decorrelated_jitter(base=1, cap=10)
+        with mock.patch('random.uniform', lambda a, b: b):
+            self.assertEquals([delay(i) for i in range(4)], [3, 9, 10, 10])
+            self.assertEquals(delay(0), 3)
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, window=10, min_retries=1)
+        for _ in range(4):
+            budget.record_call()
+        # 1 + 0.5 * 4 retries
+        self.assertEquals([budget.can_retry() for _ in range(4)], [True, True, True, False])
+        self.now += 10
+        self.assertTrue(budget.can_retry())
+
+    def test_with_delay_budget(self):
+        budget = RetryBudget(ratio=0, min_retries=2)
+        callable = DummyCallableRaises(ValueError('test'))
+        func = with_delay(nb_times=10, delay=constant(0), budget=budget)(callable)
+        with self.assertRaises(ValueError):
+            func()
+        self.assertEquals(callable.count, 3)
+        with self.assertRaises(ValueError):
+            func()
+        # Budget exhausted: no retry
+        self.assertEquals(callable.count, 4)
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        callable = DummyCallableRaises(ValueError('test'))
+        func = with_delay(nb_times=2, delay=constant(1), circuit_breaker=breaker)(callable)
+        with self.assertRaises(ValueError):
+            func()
+        self.assertEquals(breaker.state, CircuitBreaker.CLOSED)
+        with self.assertRaises(CircuitOpenError):
+            func()
+        self.assertEquals(callable.count, 3)
+        self.assertEquals(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as context:
+            func()
+        self.assertEquals(callable.count, 3)
+        # Opened at the third failure, then the retry delay elapsed
+        self.assertEquals(context.exception.retry_after, 29)
+
+        # A failed trial opens the circuit again
+        self.now += 30
+        self.assertEquals(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            func()
+        self.assertEquals(callable.count, 4)
+        self.assertEquals(breaker.state, CircuitBreaker.OPEN)
+
+        # A successful one closes it
+        self.now += 30
+        self.assertEquals(with_delay(circuit_breaker=breaker)(lambda: 42)(), 42)
+        self.assertEquals(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEquals(breaker.failures, 0)
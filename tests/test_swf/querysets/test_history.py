@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from mock import patch
+
+from swf.models.domain import Domain
+from swf.querysets.history import HistoryQuerySet
+
+
+def event(event_id):
+    return {
+        'eventId': event_id,
+        'eventType': 'WorkflowExecutionStarted',
+        'eventTimestamp': 1000000000.0,
+        'workflowExecutionStartedEventAttributes': {},
+    }
+
+
+class TestHistoryQuerySet(unittest.TestCase):
+
+    def setUp(self):
+        self.qs = HistoryQuerySet(Domain("TestDomain"))
+        self.pages = {
+            None: {'events': [event(1), event(2)], 'nextPageToken': 'a'},
+            'a': {'events': [event(3), event(4)], 'nextPageToken': 'b'},
+            'b': {'events': [event(5)]},
+        }
+
+    def get_history(self, domain, run_id, workflow_id, maximum_page_size=None,
+                    next_page_token=None, reverse_order=None):
+        return self.pages[next_page_token]
+
+    def test_iter_events(self):
+        with patch('boto.swf.layer1.Layer1.get_workflow_execution_history',
+                   side_effect=self.get_history) as mock:
+            events = self.qs.iter_events('run-id', 'workflow-id', max_results=10, page_size=2)
+            self.assertEqual(next(events)['eventId'], 1)
+            self.assertEqual([e['eventId'] for e in events], [2, 3, 4, 5])
+        self.assertEqual(mock.call_count, 3)
+
+    def test_get_stops_at_max_results(self):
+        with patch('boto.swf.layer1.Layer1.get_workflow_execution_history',
+                   side_effect=self.get_history) as mock:
+            history = self.qs.get('run-id', 'workflow-id', max_results=3, page_size=2)
+        self.assertEqual([e.id for e in history.events], [1, 2, 3, 4])
+        self.assertEqual(mock.call_count, 2)
@@ -335,3 +335,73 @@ class TestWorkflowExecutionQuerySet(unittest.TestCase):
         kwargs = self.weq._list_items.call_args[1]
         self.assertIsNone(kwargs["start_oldest_date"])
         self.assertIsInstance(kwargs["close_latest_date"], int)
+
+    def test_iter_filter_is_lazy(self):
+        pages = [
+            {'executionInfos': mock_list_open_workflow_executions()['executionInfos'], 'nextPageToken': 'a'},
+            {'executionInfos': mock_list_open_workflow_executions()['executionInfos']},
+        ]
+        with patch.object(self.weq, '_list', side_effect=pages) as _list:
+            executions = self.weq.iter_filter()
+            self.assertEqual(_list.call_count, 0)
+            self.assertIsInstance(next(executions), WorkflowExecution)
+            self.assertEqual(len(list(executions)), 1)
+        self.assertEqual(_list.call_args_list[1][1]['next_page_token'], 'a')
+
+    def test_iter_all_windows(self):
+        windows = []
+
+        def list_executions(status, domain, next_page_token=None, **kwargs):
+            windows.append((kwargs['start_oldest_date'], kwargs.get('start_latest_date')))
+            info = mock_list_open_workflow_executions()['executionInfos'][0]
+            info = dict(info,
+                        execution={'workflowId': str(kwargs['start_oldest_date']), 'runId': 'run'},
+                        startTimestamp=kwargs['start_oldest_date'] + 0.5)
+            return {'executionInfos': [info]}
+
+        with patch.object(self.weq, '_list', side_effect=list_executions):
+            executions = list(self.weq.iter_all(start_oldest_date=3, windows=3, threads=2))
+
+        self.assertEqual(len(windows), 3)
+        windows.sort()
+        # Contiguous windows in whole seconds, the most recent one is open-ended
+        self.assertEqual(windows[-1][1], None)
+        self.assertEqual(windows[0][1], windows[1][0])
+        self.assertEqual(windows[1][1], windows[2][0])
+        for oldest, _ in windows:
+            self.assertIsInstance(oldest, int)
+        # Most recent window first
+        self.assertEqual([e.workflow_id for e in executions],
+                         [str(window[0]) for window in reversed(windows)])
+
+    def test_iter_all_windows_edges(self):
+        def list_executions(status, domain, next_page_token=None, **kwargs):
+            # SWF includes both dates: an execution started on the edge
+            # of two windows is returned by both queries
+            info = mock_list_open_workflow_executions()['executionInfos'][0]
+            edge = kwargs.get('start_latest_date') or kwargs['start_oldest_date']
+            return {'executionInfos': [dict(info, startTimestamp=edge)]}
+
+        with patch.object(self.weq, '_list', side_effect=list_executions):
+            executions = list(self.weq.iter_all(start_oldest_date=3, windows=2, threads=2))
+
+        self.assertEqual(len(executions), 1)
+
+    def test_iter_filters(self):
+        def list_executions(*args, **kwargs):
+            info = mock_list_open_workflow_executions()['executionInfos'][0]
+            return {'executionInfos': [dict(info, tagList=[kwargs['tag']])]}
+
+        with patch.object(self.weq, '_list', side_effect=list_executions):
+            executions = list(self.weq.iter_filters([{'tag': 'a'}, {'tag': 'b'}]))
+        self.assertEqual([e.tag_list for e in executions], [['a'], ['b']])
+
+    def test_list_open_workflows_executions_with_latest_date(self):
+        with patch.object(self.weq.connection, 'list_open_workflow_executions') as mock:
+            self.weq.list_workflow_executions(
+                WorkflowExecution.STATUS_OPEN,
+                self.domain.name,
+                start_oldest_date=1,
+                start_latest_date=2,
+            )
+        mock.assert_called_once_with(self.domain.name, oldest_date=1, latest_date=2)
@@ -0,0 +1,41 @@
+# -*- coding:utf-8 -*-
+
+import threading
+import unittest
+
+import boto.swf
+from mock import Mock
+
+from swf.core import ConnectedSWFObject
+
+
+def in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+class TestConnectedSWFObject(unittest.TestCase):
+
+    def test_connection_per_thread(self):
+        obj = ConnectedSWFObject(region='us-east-1')
+        connection = obj.connection
+        self.assertIs(obj.connection, connection)
+
+        def get_connections():
+            return obj.connection, obj.connection
+
+        first, second = in_thread(get_connections)
+        self.assertIsInstance(first, boto.swf.layer1.Layer1)
+        self.assertIsNot(first, connection)
+        self.assertIs(first, second)
+        self.assertEqual(first.aws_access_key_id, connection.aws_access_key_id)
+        self.assertEqual(first.region.name, 'us-east-1')
+        self.assertIsNot(in_thread(lambda: obj.connection), first)
+
+    def test_custom_connection_shared(self):
+        connection = Mock()
+        obj = ConnectedSWFObject(connection=connection)
+        self.assertIs(in_thread(lambda: obj.connection), connection)
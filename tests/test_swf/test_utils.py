@@ -2,6 +2,8 @@
 
 import unittest
 
+from mock import Mock
+
 from swf.utils import *
 
 
@@ -62,3 +64,100 @@ class TestUtils(unittest.TestCase):
         }
 
         self.assertIsNone(get_subkey(base_dict, ['b', '1']))
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_iter_pages(self):
+        pages = {None: {'items': [1, 2], 'nextPageToken': 'a'},
+                 'a': {'items': [3], 'nextPageToken': 'b'},
+                 'b': {'items': [4]}}
+        fetched = []
+
+        def fetch(token):
+            fetched.append(token)
+            return pages[token]
+
+        responses = iter_pages(fetch)
+        self.assertEqual(next(responses)['items'], [1, 2])
+        self.assertEqual([r['items'] for r in responses], [[3], [4]])
+        self.assertEqual(fetched, [None, 'a', 'b'])
+
+        del fetched[:]
+        responses = list(iter_pages(fetch, more=lambda response: len(response['items']) > 1))
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(fetched, [None, 'a'])
+
+    def test_iter_pages_error(self):
+        def fetch(token):
+            if token:
+                raise ValueError(token)
+            return {'nextPageToken': 'a'}
+
+        responses = iter_pages(fetch)
+        next(responses)
+        with self.assertRaises(ValueError):
+            next(responses)
+
+    def test_iter_pages_pool(self):
+        import threading
+        threads = set()
+
+        def fetch(token):
+            threads.add(threading.current_thread())
+            return {'nextPageToken': 'a'} if token is None else {}
+
+        for _ in range(3):
+            self.assertEqual(len(list(iter_pages(fetch))), 2)
+        # One thread of the shared pool per page, no new pool per query
+        self.assertIs(get_pages_pool(), get_pages_pool())
+        self.assertLessEqual(len(threads), 1 + get_pages_pool()._processes)
+
+        pool = Mock(wraps=get_pages_pool())
+        self.assertEqual(len(list(iter_pages(fetch, pool=pool))), 2)
+        self.assertEqual(pool.apply_async.call_count, 1)
+
+    def test_chain_concurrently(self):
+        import threading
+        import time
+        started = []
+
+        def slow(items):
+            started.append(threading.current_thread())
+            for item in items:
+                time.sleep(0.01)
+                yield item
+
+        iterables = [slow([1, 2]), slow([3]), slow([4, 5])]
+        self.assertEqual(list(chain_concurrently(iterables, threads=3)), [1, 2, 3, 4, 5])
+        self.assertEqual(len(set(started)), 3)
+        self.assertEqual(list(chain_concurrently([[1], [2]], threads=1)), [1, 2])
+
+    def test_chain_concurrently_error(self):
+        def failing():
+            yield 1
+            raise ValueError('boom')
+
+        items = chain_concurrently([[0], failing(), [2]], threads=2)
+        self.assertEqual([next(items), next(items)], [0, 1])
+        with self.assertRaises(ValueError):
+            next(items)
+
+    def test_chain_concurrently_bounded(self):
+        import time
+        read = []
+
+        def counting(start):
+            for item in range(start, start + 100):
+                read.append(item)
+                yield item
+
+        items = chain_concurrently([counting(0), counting(100)], threads=2, buffer_size=5)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.1)
+        # At most buffer_size items read ahead per iterable, plus the one
+        # waiting for room in the queue
+        self.assertLessEqual(len(read), 2 * 7)
+        items.close()
+        self.assertEqual(len(list(chain_concurrently([counting(0), counting(100)], threads=2,
+                                                     buffer_size=5))), 200)